@@ -1,12 +1,47 @@
+import time
+_inicio_script = time.perf_counter()
+
 import streamlit as st
-import os
+import copy
+from concurrent.futures import wait
 from datetime import datetime, date
-import google.generativeai as genai
-import requests
-from PIL import Image
-import io
-import json
-import pandas as pd
+from streamlit.errors import StreamlitAPIException
+
+from nutrifarma.actividad import MINUTOS_SEMANALES_RECOMENDADOS, RegistroActividad
+from nutrifarma.almacen import CLAVE_ALMACEN, obtener_almacen, registro_consentimiento
+from nutrifarma.cima import obtener_nomenclator, resolver_medicacion_cima
+from nutrifarma.clinica import (
+    calcular_imc, clasificacion_imc, evaluar_historial, evaluar_panel, registrar_analitica, tendencias_analiticas,
+)
+from nutrifarma.constantes import (
+    CATEGORIAS_ALIMENTOS, CSS_PERSONALIZADO, ENFERMEDADES_COMUNES, FRECUENCIAS_CONSUMO,
+    INTENSIDADES, PACIENTE_POR_DEFECTO, TEXTO_CONSENTIMIENTO, TEXTO_CONSENTIMIENTO_ALMACEN, TIPOS_ACTIVIDAD,
+    TIPOS_COMIDA,
+)
+from nutrifarma.composicion import (
+    NUTRIENTES, obtener_tabla_composicion, resumen_para_contexto, totales_por_comida, totales_por_dia,
+)
+from nutrifarma.contexto import construir_contexto_paciente
+from nutrifarma.cribado import analizar_riesgo_gemini, evaluar_cohorte, leer_campana
+from nutrifarma.documentos import (
+    CAMPOS_ANALITICA, huella_documento, lanzar_ocr, miniatura_imagen, numero_paginas_pdf, pagina_pdf
+)
+from nutrifarma.exportacion import FORMATOS_EXPORTACION, exportar_registros, formatos_disponibles
+from nutrifarma.gemini import (
+    GEMINI_API_KEY, INSTRUCCION_COACHING, INSTRUCCION_DIAGNOSTICO,
+    INSTRUCCION_GUIAS, consultar_gemini_stream, id_sesion_actual, obtener_planificador_gemini,
+)
+from nutrifarma.informe import (
+    FORMATOS_INFORME, entradas_actividad, entradas_alimentacion, entradas_informe, generar_informe, huella,
+    huellas_secciones, obtener_ejecutor_informes,
+)
+from nutrifarma.interacciones import actualizar_interacciones
+from nutrifarma.metricas import cronometrado
+from nutrifarma.piramide import evaluar_frecuencias, feedback_rapido, puntuacion_adherencia
+from nutrifarma.piramide import resumen_para_contexto as resumen_piramide
+from nutrifarma.registros import RegistroIndexado
+from nutrifarma.rendimiento import registrar_render
+from nutrifarma.simulacion import MODO_SERVICIOS
  
 # Configuración de la página
 st.set_page_config(
@@ -17,97 +52,14 @@ st.set_page_config(
 )
 
 # CSS personalizado para interfaz atractiva
-st.markdown("""
-<style>
-    /* Estilos generales */
-    .main {
-        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-    }
-    
-    /* Tarjetas */
-    .stCard {
-        background: white;
-        padding: 20px;
-        border-radius: 15px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        margin: 10px 0;
-    }
-    
-    /* Encabezados */
-    h1 {
-        color: #2c3e50;
-        text-align: center;
-        padding: 20px;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        font-weight: 800;
-    }
-    
-    h2 {
-        color: #34495e;
-        border-bottom: 3px solid #3498db;
-        padding-bottom: 10px;
-    }
-    
-    /* Botones */
-    .stButton>button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        padding: 12px 30px;
-        border-radius: 25px;
-        font-weight: 600;
-        transition: transform 0.3s ease;
-    }
-    
-    .stButton>button:hover {
-        transform: scale(1.05);
-        box-shadow: 0 6px 12px rgba(0,0,0,0.2);
-    }
-    
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 10px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background-color: #f0f2f6;
-        border-radius: 10px 10px 0 0;
-        padding: 10px 20px;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white !important;
-    }
-    
-    /* Inputs */
-    .stTextInput>div>div>input, .stTextArea>div>div>textarea {
-        border-radius: 10px;
-        border: 2px solid #e0e0e0;
-    }
-    
-    /* Métricas */
-    [data-testid="stMetricValue"] {
-        font-size: 28px;
-        font-weight: 700;
-        color: #667eea;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(CSS_PERSONALIZADO, unsafe_allow_html=True)
 
-# Obtener API key de Gemini
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-
-if not GEMINI_API_KEY:
+# Comprobar API key de Gemini (no hace falta al reproducir respuestas grabadas)
+if not GEMINI_API_KEY and MODO_SERVICIOS != 'reproducir':
     st.error("⚠️ Error: No se ha configurado GEMINI_API_KEY")
     st.info("Configura la variable de entorno GEMINI_API_KEY en Streamlit Cloud")
     st.stop()
 
-# Configurar Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-
 # Inicializar consentimiento en session_state
 if 'consentimiento_aceptado' not in st.session_state:
     st.session_state.consentimiento_aceptado = False
@@ -130,39 +82,9 @@ if not st.session_state.consentimiento_aceptado:
         
         st.markdown("## 📝 Consentimiento Informado - Protección de Datos")
         
-        st.markdown("""
-        ### Información sobre el Tratamiento de Datos Personales
-        
-        De acuerdo con el **Reglamento General de Protección de Datos (RGPD)** y la 
-        **Ley Orgánica de Protección de Datos (LOPD)**, le informamos:
-        
-        #### 📁 Datos que se recopilan:
-        - Datos identificativos (nombre, edad, sexo)
-        - Datos de salud (medidas antropométricas, analíticas, enfermedades, medicación)
-        - Datos de hábitos alimentarios y actividad física
-        
-        #### 🎯 Finalidad del tratamiento:
-        - Asesoramiento nutricional personalizado
-        - Seguimiento de hábitos saludables
-        - Análisis de interacciones medicamento-nutriente
-        
-        #### 🔒 Seguridad de los datos:
-        - **Sus datos NO se almacenan en ningún servidor**
-        - La información permanece únicamente en **esta sesión del navegador**
-        - Al cerrar la aplicación, todos los datos se eliminan automáticamente
-        
-        #### ⚖️ Sus derechos (ARCO):
-        - **Acceso**: Puede consultar sus datos en cualquier momento
-        - **Rectificación**: Puede modificar cualquier dato erróneo
-        - **Cancelación**: Puede eliminar todos sus datos (botón "Limpiar Todo")
-        - **Oposición**: Puede rechazar este consentimiento y cerrar la aplicación
-        
-        #### 🏭 Responsable del tratamiento:
-        - **NutriFarma Advisor Pro**
-        - Herramienta de asesoramiento nutricional para farmacias
-        
-        ---
-        """)
+        st.markdown(TEXTO_CONSENTIMIENTO)
+        if CLAVE_ALMACEN:
+            st.markdown(TEXTO_CONSENTIMIENTO_ALMACEN)
                 
         consentimiento_check = st.checkbox(
             "✅ He leído y acepto el tratamiento de mis datos personales conforme a la información proporcionada",
@@ -187,167 +109,50 @@ if not st.session_state.consentimiento_aceptado:
         
         st.markdown("""</div>""", unsafe_allow_html=True)
     
+    registrar_render(_inicio_script)
     st.stop()  # Detener la ejecución hasta que se acepte el consentimiento
 
 # Inicializar session_state
 if 'paciente' not in st.session_state:
-    st.session_state.paciente = {
-        'nombre': '',
-        'edad': 30,
-        'sexo': 'Mujer',
-        'peso': 70.0,
-        'altura': 165,
-        'analiticas': {},
-        'enfermedades': [],
-        'medicacion': [],
-        'alergias': [],
-                    'objetivo': '',
-        # Contexto del paciente
-        'estado_civil': '',
-        'hijos': 0,
-        'personas_cargo': '',
-        'profesion': '',
-        'horario_laboral': '',
-        'estres_laboral': 'Medio',
-        'tiempo_disponible': 'Medio',
-        'recursos_economicos': 'Medios',
-        # Sueño y descanso
-        'horas_sueno': 7,
-        'calidad_sueno': 'Buena',
-        'trastornos_sueno': [],
-        # Actividad física detallada
-        'tipo_actividad': [],
-        'frecuencia_semanal': 0,
-        'intensidad_actividad': 'Moderada',
-        # Determinantes del cambio
-        'barreras': [],
-        'beneficios_percibidos': [],
-        'creencias_alimentacion': '',
-        'emociones_comida': '',
-        'entorno_familiar': '',
-        'habilidades_cocina': 'Intermedias',
-        'conocimientos_nutricionales': 'Básicos',
-        'comidas_fuera_casa': 0,
-        'apoyo_social': '',
-        # Evaluación motivacional
-        'etapa_cambio': 'Contemplación',
-        'nivel_importancia': 5,
-        'nivel_confianza': 5,
-        # Diagnóstico PES
-        'problema_pes': '',
-        'etiologia_pes': '',
-        'signos_sintomas_pes': '',
-        # Objetivos SMART/PRAMPE
-        'objetivo_smart': '',
-        'objetivos_especificos': [],
-        # Plan de acción
-        'acciones_concretas': [],
-        'estrategias_motivacionales': [],
-        # Medicación e interacciones
-        'interacciones_detectadas': [],
-        'suplementos_recomendados': []
-    }
+    st.session_state.paciente = copy.deepcopy(PACIENTE_POR_DEFECTO)
 
 if 'registro_alimentos' not in st.session_state:
-    st.session_state.registro_alimentos = []
+    st.session_state.registro_alimentos = RegistroIndexado()
 
 if 'registro_actividad' not in st.session_state:
-    st.session_state.registro_actividad = []
+    st.session_state.registro_actividad = RegistroActividad()
 
 if 'diagnostico' not in st.session_state:
     st.session_state.diagnostico = None
 
-# Valores de referencia para analíticas
-VALORES_REFERENCIA = {
-    'Glucosa': {'min': 70, 'max': 100, 'unidad': 'mg/dL'},
-    'Colesterol Total': {'min': 0, 'max': 200, 'unidad': 'mg/dL'},
-    'HDL': {'min': 40, 'max': 999, 'unidad': 'mg/dL'},
-    'LDL': {'min': 0, 'max': 100, 'unidad': 'mg/dL'},
-    'Triglicéridos': {'min': 0, 'max': 150, 'unidad': 'mg/dL'},
-    'HbA1c': {'min': 4.0, 'max': 5.6, 'unidad': '%'},
-    'Vitamina D': {'min': 30, 'max': 100, 'unidad': 'ng/mL'},
-    'Vitamina B12': {'min': 200, 'max': 900, 'unidad': 'pg/mL'},
-    'Hierro': {'min': 60, 'max': 170, 'unidad': 'µg/dL'},
-    'Ferritina': {'min': 20, 'max': 200, 'unidad': 'ng/mL'},
-}
-
-ENFERMEDADES_COMUNES = [
-    'Diabetes Tipo 1', 'Diabetes Tipo 2', 'Prediabetes',
-    'Hipertensión', 'Hipercolesterolemia', 'Obesidad',
-    'Enfermedad Celíaca', 'Intolerancia a la Lactosa',
-    'Síndrome de Intestino Irritable', 'Reflujo Gastroesofágico',
-    'Hipotiroidismo', 'Hipertiroidismo', 'Anemia',
-    'Osteoporosis', 'Artritis', 'Enfermedad Renal Crónica',
-    'Hígado Graso', 'Gota', 'Ninguna'
-]
-
-# Funciones auxiliares
-def calcular_imc(peso, altura):
-    altura_m = altura / 100
-    imc = peso / (altura_m ** 2)
-    return round(imc, 1)
-
-# Funciones de exportación
-def exportar_alimentacion_csv(registros):
-    """Exporta los registros de alimentación a CSV"""
-    if not registros:
-        return None
-    df = pd.DataFrame(registros)
-    return df.to_csv(index=False).encode('utf-8')
-
-def exportar_actividad_csv(registros):
-    """Exporta los registros de actividad física a CSV"""
-    if not registros:
-        return None
-    df = pd.DataFrame(registros)
-    return df.to_csv(index=False).encode('utf-8')
+def estado_paciente():
+    """Todo lo que se guarda en la ficha cifrada del paciente"""
+    return {
+        'paciente': st.session_state.paciente,
+        'registro_alimentos': st.session_state.registro_alimentos.registros(),
+        'registro_actividad': st.session_state.registro_actividad.registros(),
+        'diagnostico': st.session_state.diagnostico,
+    }
 
+# Resultados memorizados por versión del registro y campos de analíticas: no
+# deben sobrevivir a un cambio de paciente
+CLAVES_DEPENDIENTES_PACIENTE = [
+    'exportaciones', 'nutrientes_alimentos', 'evaluacion_piramide',
+    'glucosa', 'hba1c', 'colesterol', 'hdl', 'ldl', 'trig', 'vitd', 'vitb12', 'hierro', 'ferritina',
+    'ocr_documento', 'analitica_ocr', 'analitica_guardada', 'consulta_cima',
+    'informe_alimentacion', 'informe_actividad', 'informe_secciones', 'informe_documentos', 'informe_tarea',
+    'registro_medicacion',
+]
 
-def clasificacion_imc(imc):
-    if imc < 18.5:
-        return "Bajo peso", "🟡"
-    elif 18.5 <= imc < 25:
-        return "Peso normal", "🟢"
-    elif 25 <= imc < 30:
-        return "Sobrepeso", "🟠"
-    else:
-        return "Obesidad", "🔴"
-
-def verificar_analitica(parametro, valor):
-    if parametro in VALORES_REFERENCIA:
-        ref = VALORES_REFERENCIA[parametro]
-        if ref['min'] <= valor <= ref['max']:
-            return "Normal 🟢"
-        elif valor < ref['min']:
-            return "Bajo 🟡"
-        else:
-            return "Alto 🔴"
-    return "Sin referencia"
+def restaurar_paciente(estado):
+    """Sustituye el paciente de la sesión por una ficha cargada del almacén"""
+    st.session_state.paciente = {**copy.deepcopy(PACIENTE_POR_DEFECTO), **estado['paciente']}
+    st.session_state.registro_alimentos = RegistroIndexado(estado.get('registro_alimentos') or [])
+    st.session_state.registro_actividad = RegistroActividad.desde_registros(estado.get('registro_actividad') or [])
+    st.session_state.diagnostico = estado.get('diagnostico')
+    for clave in CLAVES_DEPENDIENTES_PACIENTE:
+        st.session_state.pop(clave, None)
 
-def consultar_gemini(prompt, contexto_paciente):
-    try:
-        # Crear modelo con búsqueda web
-        model = genai.GenerativeModel(
-            'gemini-2.0-flash-exp',
-            tools='google_search_retrieval'
-        )
-        
-        # Generar respuesta
-        response = model.generate_content(prompt + "\n\n" + contexto_paciente)
-        return response.text
-    except Exception as e:
-        return f"Error al consultar: {str(e)}"
-
-def buscar_cima_aemps(medicamento):
-    try:
-        url = f"https://cima.aemps.es/cima/rest/medicamentos?nombre={medicamento}"
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except:
-        return None
-        
 # Título principal
 st.markdown("<h1>🍎 NutriFarma Advisor Pro</h1>", unsafe_allow_html=True)
 st.markdown("<p style='text-align: center; color: #7f8c8d; font-size: 18px;'>Asesoramiento Nutricional Integral para Farmacias</p>", unsafe_allow_html=True)
@@ -372,7 +177,48 @@ with st.sidebar:
     
     st.markdown("---")
     st.markdown("### 🔒 Privacidad")
-    st.caption("No se almacenan datos personales. Toda la información se mantiene en esta sesión.")
+    almacen = obtener_almacen()
+    if almacen is None:
+        st.caption("No se almacenan datos personales. Toda la información se mantiene en esta sesión.")
+    else:
+        st.caption("Los datos solo se guardan, cifrados en este equipo, si el paciente autoriza su ficha de seguimiento.")
+        with st.expander("🗄️ Ficha de seguimiento"):
+            identificador = st.text_input("🪪 DNI / tarjeta sanitaria", type="password", key="identificador_ficha",
+                                          help="Solo se usa para calcular el seudónimo de la ficha; no se guarda")
+            if st.button("📂 Cargar ficha", disabled=not identificador):
+                try:
+                    ficha = almacen.cargar(identificador)
+                except Exception:
+                    ficha = None
+                    st.error("⚠️ No se pudo descifrar la ficha")
+                else:
+                    if ficha is None:
+                        st.info("ℹ️ No hay ficha guardada para este identificador")
+                    else:
+                        restaurar_paciente(ficha[0])
+                        st.session_state.consentimiento_ficha = ficha[1]
+                        st.session_state.ficha_actual = almacen.seudonimo(identificador)
+                        st.rerun()
+            misma_ficha = st.session_state.get('ficha_actual') == almacen.seudonimo(identificador)
+            if misma_ficha and st.session_state.get('consentimiento_ficha'):
+                st.caption(f"✅ Ficha autorizada el {st.session_state.consentimiento_ficha['fecha'][:10]}")
+            autoriza = st.checkbox("El paciente autoriza guardar su ficha cifrada", key="autoriza_ficha")
+            if st.button("💾 Guardar ficha", disabled=not (identificador and autoriza)):
+                # Se conserva la fecha de la autorización original de esta ficha
+                consentimiento = st.session_state.get('consentimiento_ficha') if misma_ficha else None
+                consentimiento = consentimiento or registro_consentimiento(TEXTO_CONSENTIMIENTO + TEXTO_CONSENTIMIENTO_ALMACEN)
+                almacen.guardar(identificador, estado_paciente(), consentimiento)
+                st.session_state.consentimiento_ficha = consentimiento
+                st.session_state.ficha_actual = almacen.seudonimo(identificador)
+                st.success("✅ Ficha guardada")
+            if st.button("🗑️ Suprimir ficha", disabled=not identificador, help="Derecho de supresión: borra la ficha definitivamente"):
+                if almacen.suprimir(identificador):
+                    if misma_ficha:
+                        st.session_state.pop('consentimiento_ficha', None)
+                        st.session_state.pop('ficha_actual', None)
+                    st.success("✅ Ficha suprimida")
+                else:
+                    st.info("ℹ️ No hay ficha guardada para este identificador")
     
     if st.button("🗑️ Limpiar Todo"):
         for key in st.session_state.keys():
@@ -380,7 +226,7 @@ with st.sidebar:
         st.rerun()
 
 # Tabs principales
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
     "👤 Perfil",
     "🍽️ Alimentación",
     "🏋️ Actividad",
@@ -388,11 +234,212 @@ tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
     "🩺 Diagnóstico",
     "🧠 Coaching",
     "🎯 Evaluación",
-    "📄 Informe"
+    "📄 Informe",
+    "👥 Cribado"
 ])
 
+# Cada pestaña es un fragmento: sus widgets solo vuelven a ejecutar su propia
+# pestaña. Los cambios en los datos del paciente (perfil, registros,
+# medicación, analíticas, diagnóstico) afectan a otras pestañas —barra
+# lateral, coaching, informe— y fuerzan una recarga completa con st.rerun().
+
+def recargar_pestana():
+    """Vuelve a ejecutar solo la pestaña actual; si no es un rerun de fragmento, toda la app"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def registro_medicacion():
+    """Medicación del paciente con ids estables para borrar por id.
+
+    La ficha guarda `paciente['medicacion']` como lista; el RegistroIndexado
+    comparte sus dicts y se reconstruye si la lista se sustituyó por otra vía
+    (ficha restaurada, datos sembrados).
+    """
+    lista = st.session_state.paciente.setdefault('medicacion', [])
+    registro = st.session_state.get('registro_medicacion')
+    if registro is None or len(registro) != len(lista) or any(a is not b for a, b in zip(registro, lista)):
+        for med in lista:
+            med.setdefault('fecha', '')
+        registro = RegistroIndexado(lista)
+        st.session_state.registro_medicacion = registro
+    return registro
+
+TAMANOS_PAGINA = [10, 25, 50, 100]
+
+def _valor_celda(valor):
+    # Las celdas del editor llegan como tipos de numpy/pandas (NaN/NA para vacías)
+    import pandas as pd
+    if pd.isna(valor):
+        return None
+    return valor.item() if hasattr(valor, 'item') else valor
+
+def mostrar_historial_editable(registro, columnas, clave):
+    """Historial paginado en una tabla editable.
+
+    Solo se construye la página visible, de modo que el coste no depende de la
+    longitud del historial. Las ediciones y el borrado de las filas
+    seleccionadas se aplican juntos al enviar el formulario.
+    `columnas` asocia cada campo del registro con su column_config.
+    """
+    import pandas as pd
+    
+    col_tam, col_pag = st.columns(2)
+    with col_tam:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, key=f"{clave}_tamano")
+    paginas = max(1, -(-len(registro) // tamano))
+    # El valor vive solo en session_state: tras borrar filas la página
+    # guardada puede haber dejado de existir
+    if st.session_state.setdefault(f"{clave}_pagina", 1) > paginas:
+        st.session_state[f"{clave}_pagina"] = paginas
+    with col_pag:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, key=f"{clave}_pagina")
+    
+    filas = registro.pagina((pagina - 1) * tamano, tamano)
+    original = pd.DataFrame(
+        [{campo: reg.get(campo) for campo in columnas} for _, reg in filas],
+        index=[id_reg for id_reg, _ in filas],
+        columns=list(columnas)
+    )
+    original.insert(0, 'seleccionar', False)
+    
+    with st.form(f"{clave}_form"):
+        editado = st.data_editor(
+            original,
+            hide_index=True,
+            num_rows="fixed",
+            column_config={'seleccionar': st.column_config.CheckboxColumn("🗑️", width="small"), **columnas},
+            key=f"{clave}_editor"
+        )
+        col_guardar, col_eliminar = st.columns(2)
+        with col_guardar:
+            guardar = st.form_submit_button("💾 Guardar cambios")
+        with col_eliminar:
+            eliminar = st.form_submit_button("🗑️ Eliminar seleccionados")
+    
+    if not (guardar or eliminar):
+        return
+    # Cualquiera de los dos botones aplica las ediciones de la tabla; el de
+    # eliminar borra además las filas marcadas
+    seleccionados = [id_reg for id_reg, marcado in editado['seleccionar'].items() if marcado] if eliminar else []
+    modificados = 0
+    for id_reg, fila in editado.iterrows():
+        if id_reg in seleccionados:
+            continue
+        cambios = {}
+        for campo in columnas:
+            valor = _valor_celda(fila[campo])
+            if valor != _valor_celda(original.at[id_reg, campo]):
+                cambios[campo] = valor
+        if 'fecha' in cambios:
+            try:
+                datetime.strptime(str(cambios['fecha']), "%Y-%m-%d")
+            except ValueError:
+                st.warning(f"⚠️ Fecha no válida: {cambios['fecha']} (formato AAAA-MM-DD)")
+                continue
+        if cambios:
+            registro.actualizar(id_reg, cambios)
+            modificados += 1
+    for id_reg in seleccionados:
+        registro.eliminar(id_reg)
+    if modificados:
+        st.success(f"✅ {modificados} registro(s) actualizados")
+    if seleccionados:
+        st.success(f"✅ {len(seleccionados)} registro(s) eliminados")
+    if modificados or seleccionados:
+        st.rerun()
+
+def memorizar_por_version(clave, registro, funcion):
+    """Resultado de funcion(registro) guardado en la sesión hasta que cambie el registro"""
+    guardado = st.session_state.get(clave)
+    if guardado is None or guardado[0] != registro.version:
+        guardado = (registro.version, funcion(registro))
+        st.session_state[clave] = guardado
+    return guardado[1]
+
+def calcular_nutrientes_registro():
+    """Nutrientes del registro de alimentación, recalculados solo cuando cambia el registro"""
+    registro = st.session_state.registro_alimentos
+    tabla = obtener_tabla_composicion()
+    if tabla is None or not registro:
+        return None
+    return memorizar_por_version('nutrientes_alimentos', registro, tabla.calcular)
+
+def evaluar_piramide_registro():
+    """Adherencia a la pirámide del cuestionario de frecuencia, o None sin registros"""
+    registro = st.session_state.registro_alimentos
+    if not registro:
+        return None
+    return memorizar_por_version('evaluacion_piramide', registro, evaluar_frecuencias)
+
+def mostrar_nutrientes():
+    """Totales de nutrientes por día y por comida a partir de la tabla de composición local"""
+    detalle = calcular_nutrientes_registro()
+    if detalle is None:
+        return
+    st.subheader("🧮 Nutrientes")
+    dias = totales_por_dia(detalle)
+    dia = st.selectbox("📅 Día", list(dias.index)[::-1], key="nutrientes_dia")
+    totales = dias.loc[dia]
+    col_kcal, col_prot, col_hc, col_grasa, col_fibra = st.columns(5)
+    col_kcal.metric("🔥 Energía", f"{totales['energia_kcal']:.0f} kcal")
+    col_prot.metric("🥩 Proteínas", f"{totales['proteinas_g']:.0f} g")
+    col_hc.metric("🍞 Hidratos", f"{totales['hidratos_g']:.0f} g")
+    col_grasa.metric("🫒 Grasas", f"{totales['grasas_g']:.0f} g")
+    col_fibra.metric("🌾 Fibra", f"{totales['fibra_g']:.0f} g")
+    
+    with st.expander("🍴 Detalle por comida y micronutrientes"):
+        por_comida = totales_por_comida(detalle).loc[dia].rename(columns=NUTRIENTES)
+        por_comida.loc['Total'] = por_comida.sum()
+        st.dataframe(por_comida.round(1), use_container_width=True)
+    if len(dias) > 1:
+        st.bar_chart(dias['energia_kcal'].rename("Energía (kcal)"))
+    
+    del_dia = detalle[detalle['fecha'] == dia]
+    sin_referencia = sorted(set(del_dia.loc[del_dia['referencia'].isna(), 'alimento']))
+    if sin_referencia:
+        st.caption(f"⚠️ Sin datos de composición (no suman): {', '.join(sin_referencia)}")
+    estimados = sorted(set(del_dia.loc[del_dia['estimado'], 'alimento']))
+    if estimados:
+        st.caption(f"ℹ️ Cantidad no interpretada, se usa la ración habitual: {', '.join(estimados)}")
+
+def mostrar_exportacion(registro, tipo, etiqueta):
+    """Descarga del cuestionario generada solo a petición.
+
+    El fichero se memoriza por formato junto con la versión del registro: se
+    reutiliza mientras el registro no cambie y no se genera en cada ejecución.
+    """
+    col_formato, col_preparar = st.columns(2)
+    with col_formato:
+        formato = st.selectbox("📦 Formato", formatos_disponibles(), key=f"formato_{tipo}")
+    exportaciones = st.session_state.setdefault('exportaciones', {})
+    guardado = exportaciones.get((tipo, formato))
+    
+    if guardado is None or guardado[0] != registro.version:
+        with col_preparar:
+            if st.button("📦 Preparar descarga", key=f"preparar_{tipo}"):
+                try:
+                    guardado = (registro.version, exportar_registros(registro.registros(), formato))
+                    exportaciones[(tipo, formato)] = guardado
+                except ImportError:
+                    st.error(f"⚠️ El formato {formato} no está disponible en este servidor")
+                    return
+    
+    if guardado is not None and guardado[0] == registro.version:
+        extension, mime = FORMATOS_EXPORTACION[formato]
+        st.download_button(
+            label=f"💾 Descargar {etiqueta} ({formato})",
+            data=guardado[1],
+            file_name=f"cuestionario_{tipo}_{datetime.now().strftime('%Y%m%d')}.{extension}",
+            mime=mime,
+            key=f"download_{tipo}"
+        )
+
 # TAB 1: PERFIL DEL PACIENTE
-with tab1:
+@st.fragment
+@cronometrado('pestana', pestana='perfil')
+def mostrar_perfil():
     st.header("👤 Perfil del Paciente")
     
     col1, col2 = st.columns(2)
@@ -417,6 +464,7 @@ with tab1:
                 'altura': altura
             })
             st.success("✅ Perfil guardado exitosamente")
+            # El IMC de la barra lateral y las pestañas de diagnóstico dependen del perfil
             st.rerun()
     
     with col2:
@@ -453,6 +501,10 @@ with tab1:
     st.markdown("---")
     st.subheader("🧪 Analíticas Recientes")
     
+    # Valores leídos de un documento: se fijan antes de crear los campos
+    for parametro, valor in st.session_state.pop('analitica_ocr', {}).items():
+        st.session_state[CAMPOS_ANALITICA[parametro][0]] = float(valor)
+    
     col_analitica1, col_analitica2 = st.columns(2)
     
     with col_analitica1:
@@ -473,6 +525,8 @@ with tab1:
         hierro = st.number_input("Hierro (µg/dL)", min_value=0.0, max_value=500.0, step=1.0, key="hierro")
         ferritina = st.number_input("Ferritina (ng/mL)", min_value=0.0, max_value=1000.0, step=1.0, key="ferritina")
     
+    fecha_analitica = st.date_input("📅 Fecha de la analítica", value=date.today(), key="fecha_analitica")
+    
     if st.button("📊 Guardar y Analizar"):
         analiticas = {
             'Glucosa': glucosa if glucosa > 0 else None,
@@ -489,43 +543,105 @@ with tab1:
         
         # Filtrar valores nulos
         analiticas = {k: v for k, v in analiticas.items() if v is not None}
-        st.session_state.paciente['analiticas'] = analiticas
-        
+        if analiticas:
+            registrar_analitica(st.session_state.paciente, fecha_analitica.strftime("%Y-%m-%d"), analiticas)
+            actualizar_interacciones(st.session_state.paciente)
+            # Rerun completo: Medicación debe ver las interacciones y suplementos nuevos
+            st.session_state.analitica_guardada = analiticas
+            st.rerun()
+        else:
+            st.warning("⚠️ Introduzca al menos un valor de la analítica")
+    
+    analiticas = st.session_state.pop('analitica_guardada', None)
+    if analiticas:
         # Mostrar resultados
         st.success("✅ Analíticas guardadas")
         st.markdown("### 📊 Resultados")
         
-        for param, valor in analiticas.items():
+        resultados = evaluar_panel(analiticas, st.session_state.paciente['edad'], st.session_state.paciente['sexo'])
+        for fila in resultados.itertuples():
             col_a, col_b, col_c = st.columns([2, 1, 1])
             with col_a:
-                st.write(f"**{param}**")
+                st.write(f"**{fila.parametro}**")
+                st.caption(f"Referencia: {fila.min:g}-{fila.max:g} {fila.unidad}" if fila.max < 999 else f"Referencia: ≥{fila.min:g} {fila.unidad}")
             with col_b:
-                st.write(f"{valor} {VALORES_REFERENCIA[param]['unidad']}")
+                st.write(f"{fila.valor} {fila.unidad}")
             with col_c:
-                estado = verificar_analitica(param, valor)
-                st.write(estado)
+                st.write(f"{fila.estado} {fila.icono}")
+    
+    historial = st.session_state.paciente.get('historial_analiticas') or []
+    if len(historial) > 1:
+        with st.expander(f"📈 Evolución de las analíticas ({len(historial)} analíticas)"):
+            evaluado = evaluar_historial(historial, st.session_state.paciente['edad'], st.session_state.paciente['sexo'])
+            tendencias = tendencias_analiticas(evaluado)
+            st.dataframe(tendencias.rename(columns={
+                'fecha_ultimo': 'Última fecha', 'ultimo': 'Último', 'unidad': 'Unidad', 'estado': 'Estado',
+                'icono': '', 'anterior': 'Anterior', 'delta': 'Variación', 'determinaciones': 'Nº',
+            }), use_container_width=True)
+            parametros = st.multiselect("Parámetros", list(tendencias.index), default=list(tendencias.index)[:1], key="evolucion_parametros")
+            if parametros:
+                serie = evaluado[evaluado['parametro'].isin(parametros)].pivot(index='fecha', columns='parametro', values='valor')
+                st.line_chart(serie)
     
     # Subida de imágenes/documentos
     st.markdown("---")
     st.subheader("📷 Subir Documentos o Imágenes")
-    st.info("🚧 Funcionalidad de OCR próximamente disponible. Por ahora, puede subir imágenes para referencia visual.")
     
     uploaded_file = st.file_uploader(
         "Subir analíticas, informes médicos o fotos",
         type=['jpg', 'jpeg', 'png', 'pdf'],
-        help="Los documentos se usarán solo como referencia visual en esta sesión"
+        help="Los documentos solo se usan en esta sesión. De una analítica se pueden leer los valores para rellenar los campos",
+        key="documento_paciente"
     )
     
     if uploaded_file:
-        if uploaded_file.type.startswith('image'):
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Documento subido", use_container_width=True)
-            st.success("✅ Imagen cargada. Puede usarla como referencia visual.")
+        contenido = uploaded_file.getvalue()
+        huella = huella_documento(contenido)
+        es_pdf = uploaded_file.name.lower().endswith('.pdf')
+        if es_pdf:
+            paginas = numero_paginas_pdf(huella, contenido)
+            if paginas:
+                pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, key="pagina_documento") if paginas > 1 else 1
+                st.image(pagina_pdf(huella, contenido, pagina - 1), caption=f"{uploaded_file.name} · página {pagina} de {paginas}", use_container_width=True)
+            else:
+                st.success(f"✅ Archivo {uploaded_file.name} cargado")
+                st.caption("Instale pypdfium2 para ver y leer los PDF")
         else:
-            st.success(f"✅ Archivo {uploaded_file.name} cargado")
-            
+            st.image(miniatura_imagen(huella, contenido), caption="Documento subido", use_container_width=True)
+        
+        if st.button("🔍 Leer analítica del documento"):
+            st.session_state.ocr_documento = (huella, lanzar_ocr(huella, contenido, es_pdf))
+        
+        ocr_huella, resultado = st.session_state.get('ocr_documento') or (None, None)
+        if ocr_huella == huella:
+            if hasattr(resultado, 'done') and not resultado.done():
+                st.info("⏳ Leyendo el documento en segundo plano. Puede seguir trabajando en otras pestañas.")
+                st.button("🔄 Comprobar lectura")
+            else:
+                if hasattr(resultado, 'result'):
+                    resultado = resultado.result()
+                    st.session_state.ocr_documento = (huella, resultado)
+                if resultado['error']:
+                    st.warning(f"⚠️ {resultado['error']}")
+                elif not resultado['valores']:
+                    st.warning("⚠️ No se reconoció ningún valor de analítica en el documento")
+                else:
+                    st.dataframe(
+                        [{'Parámetro': parametro, 'Valor': valor} for parametro, valor in resultado['valores'].items()],
+                        use_container_width=True, hide_index=True
+                    )
+                    st.caption("Revise los valores leídos antes de guardar la analítica")
+                    if st.button("📋 Rellenar analíticas"):
+                        st.session_state.analitica_ocr = resultado['valores']
+                        recargar_pestana()
+
+with tab1:
+    mostrar_perfil()
+
 # TAB 2: ALIMENTACIÓN
-with tab2:
+@st.fragment
+@cronometrado('pestana', pestana='alimentacion')
+def mostrar_alimentacion():
     st.header("🍽️ Registro de Alimentación")
     
     col1, col2 = st.columns([1, 2])
@@ -534,10 +650,10 @@ with tab2:
         st.subheader("➕ Agregar Alimento")
         fecha_alimento = st.date_input("📅 Fecha", value=date.today())
         hora_alimento = st.time_input("⏰ Hora")
-        comida = st.selectbox("🍴 Tipo de Comida", ["Desayuno", "Media Mañana", "Almuerzo", "Merienda", "Cena", "Otro"])
-        frecuencia = st.selectbox("📅 Frecuencia", ["Diaria", "2-3 veces/semana", "4-6 veces/semana", "Semanal", "Ocasional"])
+        comida = st.selectbox("🍴 Tipo de Comida", TIPOS_COMIDA)
+        frecuencia = st.selectbox("📅 Frecuencia", FRECUENCIAS_CONSUMO)
         alimento = st.text_input("🍏 Alimento", placeholder="Ej: Manzana, Arroz integral, Pechuga de pollo")
-        categoria = st.selectbox("🍎 Categoría", ["Cereales y derivados", "Verduras y hortalizas", "Frutas", "Leche y lácteos", "Carnes/pescados/huevos", "Legumbres", "Aceites/grasas"])
+        categoria = st.selectbox("🍎 Categoría", CATEGORIAS_ALIMENTOS)
 
         cantidad = st.text_input("📏 Cantidad", placeholder="Ej: 1 taza, 150g, 1 unidad")
     
@@ -552,8 +668,10 @@ with tab2:
                                         'frecuencia': frecuencia,
                     'cantidad': cantidad
                 }
-                st.session_state.registro_alimentos.append(nuevo_alimento)
+                st.session_state.registro_alimentos.agregar(nuevo_alimento)
                 st.success(f"✅ {alimento} agregado al registro")
+                # Rerun completo: la pirámide de Coaching, el diagnóstico y el
+                # informe dependen del registro de alimentación
                 st.rerun()
             else:
                 st.warning("⚠️ Por favor ingrese el nombre del alimento")
@@ -561,47 +679,34 @@ with tab2:
     with col2:
         st.subheader("📝 Historial de Alimentos")
         
-        if st.session_state.registro_alimentos:
-            # Agrupar por fecha
-            registros_por_fecha = {}
-                    
+        registro = st.session_state.registro_alimentos
+        
         # Botón de descarga
-        if st.session_state.registro_alimentos:
-            csv_data = exportar_alimentacion_csv(st.session_state.registro_alimentos)
-            if csv_data:
-                st.download_button(
-                    label="💾 Descargar Cuestionario de Alimentación (CSV)",
-                    data=csv_data,
-                    file_name=f"cuestionario_alimentacion_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv",
-                    key="download_alimentacion"
-                )
+        if registro:
+            mostrar_exportacion(registro, 'alimentacion', "Cuestionario de Alimentación")
         
-            for reg in st.session_state.registro_alimentos:
-                fecha = reg['fecha']
-                if fecha not in registros_por_fecha:
-                    registros_por_fecha[fecha] = []
-                registros_por_fecha[fecha].append(reg)
+            mostrar_historial_editable(registro, {
+                'fecha': st.column_config.TextColumn("📅 Fecha", required=True),
+                'hora': st.column_config.TextColumn("⏰ Hora"),
+                'comida': st.column_config.SelectboxColumn("🍴 Comida", options=TIPOS_COMIDA),
+                'alimento': st.column_config.TextColumn("🍏 Alimento", required=True),
+                'categoria': st.column_config.SelectboxColumn("🍎 Categoría", options=CATEGORIAS_ALIMENTOS),
+                'cantidad': st.column_config.TextColumn("📏 Cantidad"),
+                'frecuencia': st.column_config.SelectboxColumn("📅 Frecuencia", options=FRECUENCIAS_CONSUMO),
+            }, clave="historial_alimentos")
             
-            # Mostrar por fecha (más reciente primero)
-            for fecha in sorted(registros_por_fecha.keys(), reverse=True):
-                with st.expander(f"📅 {fecha}", expanded=(fecha == date.today().strftime("%Y-%m-%d"))):
-                    registros_dia = registros_por_fecha[fecha]
-                    for i, reg in enumerate(registros_dia):
-                        col_a, col_b, col_c = st.columns([2, 3, 1])
-                        with col_a:
-                            st.write(f"**{reg['hora']} - {reg['comida']}**")
-                        with col_b:
-                            st.write(f"{reg['alimento']} ({reg['cantidad']})")
-                        with col_c:
-                            if st.button("🗑️", key=f"del_alim_{i}_{fecha}"):
-                                st.session_state.registro_alimentos.remove(reg)
-                                st.rerun()
+            st.markdown("---")
+            mostrar_nutrientes()
         else:
             st.info("🍽️ No hay alimentos registrados aún. Agregue su primer alimento.")
 
+with tab2:
+    mostrar_alimentacion()
+
 # TAB 3: ACTIVIDAD FÍSICA
-with tab3:
+@st.fragment
+@cronometrado('pestana', pestana='actividad')
+def mostrar_actividad():
     st.header("🏋️ Registro de Actividad Física")
     
     col1, col2 = st.columns([1, 2])
@@ -609,10 +714,7 @@ with tab3:
     with col1:
         st.subheader("➕ Agregar Actividad")
         fecha_act = st.date_input("📅 Fecha", value=date.today(), key="fecha_act")
-        tipo_act = st.selectbox(
-            "🏋️ Tipo de Actividad",
-            ["Caminata", "Correr", "Ciclismo", "Natación", "Gimnasio", "Yoga", "Deporte en equipo", "Otro"]
-        )
+        tipo_act = st.selectbox("🏋️ Tipo de Actividad", TIPOS_ACTIVIDAD)
                 
         # Campo condicional para "Otro" deporte
         especificar_deporte = None
@@ -624,7 +726,7 @@ with tab3:
         duracion = st.number_input("⏱️ Duración (minutos)", min_value=1, max_value=300, value=30)
         intensidad = st.select_slider(
             "💥 Intensidad",
-            options=["Ligera", "Moderada", "Intensa", "Muy Intensa"]
+            options=INTENSIDADES
         )
         notas_act = st.text_area("📝 Notas", placeholder="Ej: Me sentí bien, tuve dolor en rodilla...")
         
@@ -638,30 +740,21 @@ with tab3:
                 'especificar_deporte': especificar_deporte,
                 'frecuencia_semanal': frecuencia_semanal
             }
-            st.session_state.registro_actividad.append(nueva_actividad)
+            st.session_state.registro_actividad.agregar(nueva_actividad)
             st.success(f"✅ Actividad agregada: {tipo_act} - {duracion} min")
             st.rerun()
     
     with col2:
         st.subheader("📊 Historial de Actividad")
         
-        if st.session_state.registro_actividad:
-            # Calcular estadísticas
-            total_min = sum([act['duracion'] for act in st.session_state.registro_actividad])
-                    
-        # Botón de descarga
-        if st.session_state.registro_actividad:
-            csv_data = exportar_actividad_csv(st.session_state.registro_actividad)
-            if csv_data:
-                st.download_button(
-                    label="💾 Descargar Cuestionario de Actividad Física (CSV)",
-                    data=csv_data,
-                    file_name=f"cuestionario_actividad_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv",
-                    key="download_actividad"
-                )
-        
-            total_sesiones = len(st.session_state.registro_actividad)
+        registro = st.session_state.registro_actividad
+        if registro:
+            # Botón de descarga
+            mostrar_exportacion(registro, 'actividad', "Cuestionario de Actividad Física")
+            
+            # Estadísticas a partir de los agregados incrementales del registro
+            total_min = registro.total_minutos
+            total_sesiones = len(registro)
             
             col_stat1, col_stat2, col_stat3 = st.columns(3)
             with col_stat1:
@@ -672,26 +765,46 @@ with tab3:
                 promedio = total_min // total_sesiones if total_sesiones > 0 else 0
                 st.metric("📊 Promedio/Sesión", f"{promedio} min")
             
+            col_stat4, col_stat5 = st.columns(2)
+            with col_stat4:
+                media = registro.media_semanal()
+                st.metric("📅 Media semanal (4 sem.)", f"{media} min",
+                          delta=f"{media - MINUTOS_SEMANALES_RECOMENDADOS} vs. {MINUTOS_SEMANALES_RECOMENDADOS} recomendados")
+            with col_stat5:
+                st.metric("🔁 Volumen habitual declarado", f"{sum(registro.volumen_habitual().values())} min/sem",
+                          help="Duración × días/semana de la última actividad registrada de cada tipo")
+            
+            with st.expander("📈 Tendencias"):
+                col_periodo, col_por = st.columns(2)
+                with col_periodo:
+                    periodo = st.radio("Periodo", ['semana', 'mes'], horizontal=True, key="tendencia_periodo")
+                with col_por:
+                    por = st.radio("Desglose", ['tipo', 'intensidad'], horizontal=True, key="tendencia_por")
+                import pandas as pd
+                st.bar_chart(pd.DataFrame.from_dict(registro.resumen(periodo, por), orient='index').fillna(0))
+                st.caption("Minutos por semana ISO o por mes")
+            
             st.markdown("---")
             
             # Mostrar actividades
-            for i, act in enumerate(reversed(st.session_state.registro_actividad)):
-                with st.expander(f"🏋️ {act['fecha']} - {act['tipo']}"):
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        st.write(f"**Duración:** {act['duracion']} minutos")
-                        st.write(f"**Intensidad:** {act['intensidad']}")
-                    with col_b:
-                        if act['notas']:
-                            st.write(f"**Notas:** {act['notas']}")
-                    if st.button("🗑️ Eliminar", key=f"del_act_{i}"):
-                        st.session_state.registro_actividad.remove(act)
-                        st.rerun()
+            mostrar_historial_editable(registro, {
+                'fecha': st.column_config.TextColumn("📅 Fecha", required=True),
+                'tipo': st.column_config.SelectboxColumn("🏋️ Tipo", options=TIPOS_ACTIVIDAD),
+                'duracion': st.column_config.NumberColumn("⏱️ Minutos", min_value=1, max_value=300, step=1),
+                'intensidad': st.column_config.SelectboxColumn("💥 Intensidad", options=INTENSIDADES),
+                'frecuencia_semanal': st.column_config.NumberColumn("📅 Días/semana", min_value=1, max_value=7, step=1),
+                'notas': st.column_config.TextColumn("📝 Notas"),
+            }, clave="historial_actividad")
         else:
             st.info("🏋️ No hay actividades registradas. ¡Comience a registrar su actividad física!")
 
+with tab3:
+    mostrar_actividad()
+
 # TAB 4: MEDICACIÓN
-with tab4:
+@st.fragment
+@cronometrado('pestana', pestana='medicacion')
+def mostrar_medicacion():
     st.header("💊 Medicación Actual")
     
     col1, col2 = st.columns([1, 2])
@@ -699,6 +812,15 @@ with tab4:
     with col1:
         st.subheader("➕ Agregar Medicamento")
         medicamento_nombre = st.text_input("💊 Nombre del Medicamento")
+        
+        # Autocompletado con el nomenclátor local (sin red)
+        nomenclator = obtener_nomenclator()
+        if nomenclator and len(medicamento_nombre.strip()) >= 3:
+            sugerencias = nomenclator.sugerencias(medicamento_nombre)
+            if sugerencias:
+                elegido = st.selectbox("🔎 Sugerencias CIMA", ["(usar el texto escrito)"] + sugerencias)
+                if elegido != "(usar el texto escrito)":
+                    medicamento_nombre = elegido
         dosis = st.text_input("📏 Dosis", placeholder="Ej: 500mg, 1 comprimido")
         frecuencia = st.text_input("⏰ Frecuencia", placeholder="Ej: 2 veces al día, cada 12h")
         motivo = st.text_input("🎯 Motivo", placeholder="Para qué se toma")
@@ -709,19 +831,20 @@ with tab4:
                     'nombre': medicamento_nombre,
                     'dosis': dosis,
                     'frecuencia': frecuencia,
-                    'motivo': motivo
+                    'motivo': motivo,
+                    'fecha': datetime.now().strftime("%Y-%m-%d")
                 }
-                if 'medicacion' not in st.session_state.paciente:
-                    st.session_state.paciente['medicacion'] = []
+                registro_medicacion().agregar(nuevo_med)
                 st.session_state.paciente['medicacion'].append(nuevo_med)
                 st.success(f"✅ {medicamento_nombre} agregado")
                 
                 # Buscar en CIMA AEMPS
                 with st.spinner("Buscando en CIMA AEMPS..."):
-                    resultado_cima = buscar_cima_aemps(medicamento_nombre)
-                    if resultado_cima:
+                    resolver_medicacion_cima([nuevo_med])
+                    if nuevo_med.get('cima'):
                         st.info("📊 Información encontrada en CIMA AEMPS")
                         st.caption("Puede consultar más detalles en https://cima.aemps.es")
+                actualizar_interacciones(st.session_state.paciente)
                 
                 st.rerun()
             else:
@@ -731,7 +854,19 @@ with tab4:
         st.subheader("📝 Medicación Actual")
         
         if st.session_state.paciente.get('medicacion'):
-            for i, med in enumerate(st.session_state.paciente['medicacion']):
+            if st.button("🔄 Consultar toda la medicación en CIMA"):
+                with st.spinner("Consultando CIMA AEMPS..."):
+                    resueltas, fallidas = resolver_medicacion_cima(st.session_state.paciente['medicacion'])
+                actualizar_interacciones(st.session_state.paciente)
+                st.session_state.consulta_cima = (resueltas, fallidas)
+                st.rerun()
+            resueltas, fallidas = st.session_state.pop('consulta_cima', (0, 0))
+            if fallidas:
+                st.warning(f"⚠️ {fallidas} medicamento(s) sin respuesta de CIMA. Puede reintentarlo más tarde.")
+            elif resueltas:
+                st.success(f"✅ {resueltas} medicamento(s) consultados en CIMA")
+            
+            for id_med, med in registro_medicacion().items():
                 with st.expander(f"💊 {med['nombre']}", expanded=True):
                     col_a, col_b = st.columns(2)
                     with col_a:
@@ -740,36 +875,87 @@ with tab4:
                     with col_b:
                         if med['motivo']:
                             st.write(f"**Motivo:** {med['motivo']}")
-                    if st.button("🗑️ Eliminar", key=f"del_med_{i}"):
-                        st.session_state.paciente['medicacion'].remove(med)
+                        if med.get('cima'):
+                            st.caption(f"CIMA nº {med['cima']['nregistro']} · {', '.join(med['cima']['pactivos'])}")
+                            if med['cima']['atc']:
+                                st.caption(f"ATC: {', '.join(med['cima']['atc'])}")
+                    if st.button("🗑️ Eliminar", key=f"del_med_{id_med}"):
+                        registro = registro_medicacion()
+                        registro.eliminar(id_med)
+                        st.session_state.paciente['medicacion'] = registro.registros()
+                        actualizar_interacciones(st.session_state.paciente)
                         st.rerun()
+            
+            st.markdown("---")
+            st.subheader("⚠️ Interacciones Fármaco-Nutriente")
+            interacciones = st.session_state.paciente.get('interacciones_detectadas') or []
+            for interaccion in interacciones:
+                if interaccion['gravedad'] == 'alta':
+                    st.error(f"🔴 {interaccion['descripcion']}")
+                elif interaccion['gravedad'] == 'moderada':
+                    st.warning(f"🟠 {interaccion['descripcion']}")
+                else:
+                    st.info(f"🟡 {interaccion['descripcion']}")
+            if not interacciones:
+                st.success("✅ No se han detectado interacciones con nutrientes en la medicación registrada")
+            if st.session_state.paciente.get('suplementos_recomendados'):
+                st.markdown("**💊 Suplementos a valorar:** " + ", ".join(st.session_state.paciente['suplementos_recomendados']))
         else:
             st.info("💊 No hay medicamentos registrados.")
-            
+
+with tab4:
+    mostrar_medicacion()
+
 # TAB 5: DIAGNÓSTICO NUTRICIONAL
-with tab5:
+@st.fragment
+@cronometrado('pestana', pestana='diagnostico')
+def mostrar_diagnostico():
     st.header("🩺 Diagnóstico Nutricional")
     
     if not st.session_state.paciente['nombre']:
         st.warning("⚠️ Complete primero el perfil del paciente en la pestaña 'Perfil'")
     else:
-                if st.button("🔍 Generar Diagnóstico"):
-                        with st.spinner('Analizando información del paciente...'):
+                col_generar, col_regenerar = st.columns(2)
+                with col_generar:
+                        generar = st.button("🔍 Generar Diagnóstico")
+                with col_regenerar:
+                        regenerar = st.button("🔄 Regenerar Diagnóstico", help="Ignora la respuesta guardada y vuelve a consultar a Gemini")
+                if generar or regenerar:
 # Preparar contexto del paciente
-                                contexto = f"""\nPACIENTE:\n- Nombre: {st.session_state.paciente['nombre']}\n- Edad: {st.session_state.paciente['edad']} años\n- Peso: {st.session_state.paciente.get('peso', 'N/A')} kg\n- Altura: {st.session_state.paciente.get('altura', 'N/A')} cm\n- Medicamentos: {', '.join(st.session_state.paciente.get('medicamentos', []))}\n"""
-                                
-                                prompt = f"""Como farmacéutico nutricionista, realiza un diagnóstico nutricional completo basado en:\n{contexto}\n\nIncluye: 1) Valoración nutricional 2) Problemas detectados 3) Barreras potenciales 4) Recomendaciones generales (sin dietas específicas)"""
-                                
-                                respuesta = consultar_gemini(prompt, contexto)
-                                st.session_state.diagnostico = respuesta
-                                st.success("✅ Diagnóstico generado")
+                        contexto = construir_contexto_paciente(st.session_state.paciente)
+                        
+                        prompt = "Realiza el diagnóstico nutricional de este paciente:"
+                        
+                        # Mostrar el diagnóstico a medida que se genera
+                        st.markdown("### 📊 Diagnóstico")
+                        st.session_state.diagnostico = st.write_stream(
+                                consultar_gemini_stream(prompt, contexto, forzar=regenerar, instruccion=INSTRUCCION_DIAGNOSTICO)
+                        )
+                        # El informe incluye el diagnóstico
+                        st.rerun()
                                 
-                if st.session_state.diagnostico:
+                elif st.session_state.diagnostico:
                         st.markdown("### 📊 Diagnóstico")
                         st.markdown(st.session_state.diagnostico)
 
+with tab5:
+    mostrar_diagnostico()
+
 # TAB 6: COACHING NUTRICIONAL
-with tab6:
+def contexto_coaching(incluir_piramide=False):
+    """Contexto del paciente con los resúmenes calculados de sus registros"""
+    resumenes = {
+        'Actividad física registrada': st.session_state.registro_actividad.resumen_para_contexto(),
+        'Ingesta registrada': resumen_para_contexto(calcular_nutrientes_registro()),
+    }
+    evaluacion = evaluar_piramide_registro() if incluir_piramide else None
+    if evaluacion is not None:
+        resumenes['Frecuencia de consumo vs. pirámide'] = resumen_piramide(evaluacion)
+    return construir_contexto_paciente(st.session_state.paciente, resumenes=resumenes)
+
+@st.fragment
+@cronometrado('pestana', pestana='coaching')
+def mostrar_coaching():
     st.header("🧠 Coaching Nutricional")
     
     if not st.session_state.paciente['nombre']:
@@ -778,42 +964,211 @@ with tab6:
         st.subheader("💬 Generador de Preguntas de Coaching")
         st.info("💡 Estas preguntas le ayudarán a guiar una consulta nutricional efectiva")
         
-        if st.button("✨ Generar Preguntas de Coaching"):
-            with st.spinner('Generando preguntas personalizadas...'):
-                prompt = f"""Como coach nutricional, genera 10 preguntas abiertas y efectivas para:
-- Evaluar hábitos alimentarios
-- Identificar barreras y motivaciones
-- Explorar conocimientos nutricionales
-- Entender contexto sociocultural
-Paciente: {st.session_state.paciente['nombre']}, {st.session_state.paciente['edad']} años, Objetivo: {st.session_state.paciente['objetivo']}"""
-                respuesta = consultar_gemini(prompt, json.dumps(st.session_state.paciente, indent=2))
-                st.markdown(respuesta)
+        col_generar, col_regenerar = st.columns(2)
+        with col_generar:
+            generar_preguntas = st.button("✨ Generar Preguntas de Coaching")
+        with col_regenerar:
+            regenerar_preguntas = st.button("🔄 Regenerar Preguntas", help="Ignora la respuesta guardada y vuelve a consultar a Gemini")
+        if generar_preguntas or regenerar_preguntas:
+            prompt = "Genera las preguntas para este paciente:"
+            st.write_stream(consultar_gemini_stream(
+                prompt, contexto_coaching(),
+                forzar=regenerar_preguntas, instruccion=INSTRUCCION_COACHING
+            ))
         
         st.markdown("---")
         st.subheader("🎯 Recomendaciones Basadas en Guías")
         
-        if st.button("📖 Generar Recomendaciones"):
-            with st.spinner('Consultando guías nutricionales...'):
-                prompt = f"""Basado en las guías nutricionales españolas y la pirámide alimentaria, proporciona recomendaciones específicas (NO dietas estrictas) para:
-Paciente: {st.session_state.paciente}
-
-Incluye:
-1. Sugerencias de cambios alimentarios según pirámide nutricional
-2. Frecuencia de consumo de grupos de alimentos
-3. Suplementos nutricionales si necesarios
-4. Hábitos saludables
-5. Referencias a Medynut.com para recetas saludables"""
-                respuesta = consultar_gemini(prompt, json.dumps(st.session_state.paciente, indent=2))
+        evaluacion = evaluar_piramide_registro()
+        if evaluacion is not None:
+            st.markdown("#### ⚡ Feedback rápido (pirámide alimentaria, sin IA)")
+            col_puntuacion, col_tabla = st.columns([1, 3])
+            with col_puntuacion:
+                st.metric("🥗 Adherencia", f"{puntuacion_adherencia(evaluacion)}/100")
+            with col_tabla:
+                st.dataframe(evaluacion.rename(columns={
+                    'raciones_semana': 'Raciones/semana', 'minimo': 'Mínimo', 'maximo': 'Máximo',
+                    'puntuacion': 'Puntuación', 'estado': 'Estado',
+                }), use_container_width=True)
+            mensajes = feedback_rapido(evaluacion)
+            for mensaje in mensajes:
+                st.markdown(f"- {mensaje}")
+            if not mensajes:
+                st.success("✅ Todos los grupos de alimentos están dentro de las raciones recomendadas")
+        
+        col_generar, col_regenerar = st.columns(2)
+        with col_generar:
+            generar_recomendaciones = st.button("📖 Generar Recomendaciones")
+        with col_regenerar:
+            regenerar_recomendaciones = st.button("🔄 Regenerar Recomendaciones", help="Ignora la respuesta guardada y vuelve a consultar a Gemini")
+        if generar_recomendaciones or regenerar_recomendaciones:
+            prompt = "Proporciona las recomendaciones para este paciente:"
+            st.write_stream(consultar_gemini_stream(
+                prompt, contexto_coaching(incluir_piramide=True),
+                forzar=regenerar_recomendaciones, instruccion=INSTRUCCION_GUIAS
+            ))
+
+with tab6:
+    mostrar_coaching()
+
+# TAB 8: INFORME
+def entradas_informe_paciente():
+    """Datos del informe; los que salen de los registros se memorizan por versión"""
+    alimentacion = memorizar_por_version(
+        'informe_alimentacion', st.session_state.registro_alimentos,
+        lambda registro: entradas_alimentacion(registro, calcular_nutrientes_registro(), evaluar_piramide_registro())
+    )
+    actividad = memorizar_por_version('informe_actividad', st.session_state.registro_actividad, entradas_actividad)
+    return entradas_informe(st.session_state.paciente, st.session_state.diagnostico, alimentacion, actividad)
+
+@st.fragment
+@cronometrado('pestana', pestana='informe')
+def mostrar_informe():
+    st.header("📄 Informe del Paciente")
+    
+    if not st.session_state.paciente['nombre']:
+        st.warning("⚠️ Complete primero el perfil del paciente en la pestaña 'Perfil'")
+        return
+    
+    st.info("💡 Perfil, IMC, analíticas, medicación, registros y diagnóstico en un solo documento")
+    formato = st.radio("📦 Formato", list(FORMATOS_INFORME), horizontal=True, key="formato_informe")
+    
+    # El documento se identifica por las huellas de sus secciones: mientras no
+    # cambien los datos, la descarga reutiliza el fichero ya generado
+    entradas = entradas_informe_paciente()
+    huellas = huellas_secciones(entradas)
+    clave_informe = (huella(huellas), formato)
+    documentos = st.session_state.setdefault('informe_documentos', {})
+    guardado = documentos.get(formato)
+    
+    tarea = st.session_state.get('informe_tarea')
+    if tarea and tarea[0] == clave_informe and tarea[1].done():
+        st.session_state.pop('informe_tarea')
+        try:
+            guardado = (clave_informe, tarea[1].result())
+            documentos[formato] = guardado
+        except ImportError:
+            st.error(f"⚠️ El formato {formato} no está disponible en este servidor (falta fpdf2)")
+        tarea = None
+    
+    if guardado is not None and guardado[0] == clave_informe:
+        extension, mime = FORMATOS_INFORME[formato]
+        nombre_archivo = st.session_state.paciente['nombre'].strip().replace(' ', '_')
+        st.download_button(
+            label="⬇️ Descargar informe",
+            data=guardado[1],
+            file_name=f"informe_{nombre_archivo}_{datetime.now().strftime('%Y%m%d')}.{extension}",
+            mime=mime,
+            key="descargar_informe"
+        )
+    elif tarea and tarea[0] == clave_informe:
+        st.info("⏳ Generando el informe en segundo plano. Puede seguir trabajando en otras pestañas.")
+        st.button("🔄 Comprobar informe")
+    else:
+        if guardado is not None:
+            st.caption("ℹ️ Los datos del paciente han cambiado desde el último informe")
+        if st.button("📄 Generar informe"):
+            # Solo se vuelven a generar las secciones cuya huella ha cambiado
+            secciones = st.session_state.setdefault('informe_secciones', {})
+            futuro = obtener_ejecutor_informes().submit(
+                generar_informe, copy.deepcopy(entradas), huellas, secciones, formato
+            )
+            st.session_state.informe_tarea = (clave_informe, futuro)
+            # Los informes sencillos están listos casi al momento
+            wait([futuro], timeout=2)
+            recargar_pestana()
+
+with tab8:
+    mostrar_informe()
+
+# TAB 9: CRIBADO DE CAMPAÑAS
+@st.fragment
+@cronometrado('pestana', pestana='cribado')
+def mostrar_cribado():
+    st.header("👥 Cribado de Campañas")
+    st.info("💡 Suba un CSV o Excel con una fila por persona. Columnas reconocidas: id, nombre, edad, sexo, peso (kg), altura (cm o m) y las analíticas (Glucosa, HbA1c, Colesterol Total, HDL, LDL, Triglicéridos, Vitamina D, Vitamina B12, Hierro, Ferritina).")
+    
+    archivo = st.file_uploader("📂 Datos de la campaña", type=['csv', 'xlsx', 'xls'], key="archivo_cribado")
+    if not archivo:
+        return
+    
+    # La evaluación se guarda por fichero: los reruns de la pestaña no la repiten
+    guardado = st.session_state.get('cribado')
+    if guardado is None or guardado[0] != archivo.file_id:
+        try:
+            campana = leer_campana(archivo, archivo.name)
+            resultado = evaluar_cohorte(campana)
+        except Exception as e:
+            st.error(f"⚠️ No se pudo leer el fichero: {e}")
+            return
+        guardado = (archivo.file_id, resultado, campana.attrs.get('sexo_no_reconocido', []))
+        st.session_state.cribado = guardado
+        st.session_state.cribado_ia = {}
+    resultado = guardado[1]
+    if guardado[2]:
+        st.warning(
+            f"⚠️ Valores de sexo no reconocidos (se dejan sin sexo): {', '.join(guardado[2])}. "
+            "Use Mujer/Hombre, Femenino/Masculino o H/V."
+        )
+    
+    col_total, col_alto, col_moderado, col_bajo = st.columns(4)
+    conteo = resultado['riesgo'].value_counts()
+    col_total.metric("👥 Personas", len(resultado))
+    col_alto.metric("🔴 Riesgo alto", int(conteo.get('alto', 0)))
+    col_moderado.metric("🟠 Riesgo moderado", int(conteo.get('moderado', 0)))
+    col_bajo.metric("🟢 Riesgo bajo", int(conteo.get('bajo', 0)))
+    
+    niveles = st.multiselect("Mostrar riesgo", ['alto', 'moderado', 'bajo'], default=['alto', 'moderado'], key="cribado_niveles")
+    visibles = resultado[resultado['riesgo'].isin(niveles)].sort_values('puntos_riesgo', ascending=False)
+    st.dataframe(visibles, hide_index=True, use_container_width=True)
+    if 'clasificacion_imc' in resultado:
+        st.bar_chart(resultado['clasificacion_imc'].replace('', 'Sin datos').value_counts())
+    st.download_button(
+        "📥 Descargar resultados (CSV)",
+        data=resultado.to_csv(index=False).encode('utf-8-sig'),
+        file_name=f"cribado_{datetime.now().strftime('%Y%m%d')}.csv",
+        mime="text/csv",
+    )
+    
+    st.markdown("---")
+    st.subheader("🤖 Valoración con IA del riesgo alto")
+    riesgo_alto = resultado[resultado['riesgo'] == 'alto'].sort_values('puntos_riesgo', ascending=False)
+    if riesgo_alto.empty:
+        st.success("✅ Nadie con riesgo alto en esta campaña")
+        return
+    # Todas las consultas del lote entran a la vez en la cola de Gemini: más
+    # personas de las que la cuota atiende dentro de la espera máxima fallarían
+    limite = min(len(riesgo_alto), obtener_planificador_gemini().max_peticiones_lote())
+    if st.session_state.get("cribado_max_ia", 0) > limite:
+        st.session_state.cribado_max_ia = limite
+    maximo = st.number_input("Personas a valorar (las de mayor puntuación)", min_value=1, max_value=limite, value=limite, key="cribado_max_ia")
+    if limite < len(riesgo_alto):
+        st.caption(f"ℹ️ La cuota de Gemini permite valorar hasta {limite} personas por tanda")
+    if st.button(f"🤖 Valorar con Gemini ({maximo} personas)"):
+        progreso = st.progress(0.0, text="Consultando Gemini...")
+        respuestas = analizar_riesgo_gemini(
+            riesgo_alto.head(maximo), id_sesion_actual(),
+            al_completar=lambda hechas, total: progreso.progress(hechas / total, text=f"{hechas}/{total} valoraciones"),
+        )
+        st.session_state.cribado_ia.update(respuestas)
+        progreso.empty()
+    for _, fila in riesgo_alto.iterrows():
+        respuesta = st.session_state.cribado_ia.get(fila['id'])
+        if respuesta:
+            with st.expander(f"🔴 {fila.get('nombre') or fila['id']} · {fila['motivos']}"):
                 st.markdown(respuesta)
 
+with tab9:
+    mostrar_cribado()
+
 # Pie de página
 st.markdown("---")
 col_footer1, col_footer2, col_footer3 = st.columns(3)
 with col_footer1:
     st.caption("💻 **NutriFarma Advisor Pro v2.0**")
 with col_footer2:
-    st.caption("🔒 Datos seguros - No se almacenan")
+    st.caption("🔒 Datos seguros - Fichas cifradas solo con autorización" if CLAVE_ALMACEN else "🔒 Datos seguros - No se almacenan")
 with col_footer3:
     st.caption("📞 Actualización: " + datetime.now().strftime("%Y-%m-%d"))
-        
 
+registrar_render(_inicio_script)
@@ -0,0 +1,339 @@
+"""Generador de carga: N sesiones simultáneas de farmacéutico contra una réplica.
+
+Arranca la aplicación con `streamlit run` (o usa una ya arrancada con
+`--url`) y abre N sesiones por websocket, como N navegadores. Cada sesión
+repite un recorrido con datos de paciente aleatorios:
+
+    inicio → consentimiento → perfil → medicación (CIMA) → diagnóstico (Gemini)
+
+Por defecto la réplica atiende Gemini y CIMA desde las grabaciones
+(`NUTRIFARMA_SERVICIOS=reproducir`, ver `nutrifarma/simulacion.py`), así que
+no se gasta cuota ni se consulta a la AEMPS. Al terminar informa del
+rendimiento (recorridos/s y pasos/s), los percentiles p50/p95/p99 de cada paso
+y la CPU y memoria (RSS) del proceso del servidor:
+
+    python -m benchmarks.carga --sesiones 10 --recorridos 3
+    python -m benchmarks.carga --sesiones 25 --pausa 2 --rampa 10 --json carga.json
+    python -m benchmarks.carga --url http://localhost:8501 --pid 1234
+
+Cada paso mide desde que la sesión envía la interacción hasta que el servidor
+termina todas las ejecuciones que provoca (incluidos los `st.rerun()`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, 'app.py')
+
+PASOS = ['inicio', 'consentimiento', 'perfil', 'medicacion', 'diagnostico']
+PERCENTILES = (50, 95, 99)
+# Elementos de la página que el recorrido necesita manejar
+TIPOS_WIDGET = {'button', 'checkbox', 'text_input', 'number_input'}
+NOMBRES = ['María', 'José', 'Carmen', 'Antonio', 'Lucía', 'Manuel', 'Pilar', 'Francisco', 'Elena', 'Javier']
+APELLIDOS = ['García', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz', 'Moreno']
+MEDICAMENTOS = [
+    'Metformina', 'Omeprazol', 'Atorvastatina', 'Levotiroxina', 'Enalapril', 'Furosemida', 'Simvastatina',
+    'Pantoprazol', 'Acenocumarol', 'Prednisona', 'Alopurinol', 'Amlodipino', 'Losartan', 'Sertralina',
+]
+
+
+class SesionSimulada:
+    """Una pestaña del navegador: envía interacciones y espera a que el servidor termine"""
+
+    def __init__(self, conexion, timeout):
+        self.conexion = conexion
+        self.timeout = timeout
+        # etiqueta -> (tipo, id, fragmento) de los widgets vistos en la página
+        self.widgets = {}
+        # id -> WidgetState con el valor actual de cada widget (lo que guarda el navegador)
+        self.estados = {}
+
+    def _estado(self, etiqueta, tipo):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if etiqueta not in self.widgets:
+            raise RuntimeError(f"no aparece «{etiqueta}»")
+        tipo_visto, id_widget, fragmento = self.widgets[etiqueta]
+        if tipo_visto != tipo:
+            raise RuntimeError(f"«{etiqueta}» es un {tipo_visto}, no un {tipo}")
+        self.estados[id_widget] = WidgetState(id=id_widget)
+        return self.estados[id_widget], fragmento
+
+    def escribir(self, etiqueta, valor):
+        self._estado(etiqueta, 'text_input')[0].string_value = valor
+
+    def numero(self, etiqueta, valor):
+        estado, _ = self._estado(etiqueta, 'number_input')
+        if isinstance(valor, int):
+            estado.int_value = valor
+        else:
+            estado.double_value = valor
+
+    def marcar(self, etiqueta):
+        self._estado(etiqueta, 'checkbox')[0].bool_value = True
+
+    async def pulsar(self, etiqueta):
+        estado, fragmento = self._estado(etiqueta, 'button')
+        estado.trigger_value = True
+        try:
+            return await self.ejecutar(fragmento)
+        finally:
+            # Los botones solo valen True en la ejecución que disparan
+            del self.estados[estado.id]
+
+    async def ejecutar(self, fragmento=''):
+        """Pide una ejecución (del fragmento, si el widget está en uno) y espera a que acabe"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensaje = BackMsg()
+        mensaje.rerun_script.query_string = ''
+        mensaje.rerun_script.page_script_hash = ''
+        mensaje.rerun_script.fragment_id = fragmento
+        mensaje.rerun_script.widget_states.widgets.extend(self.estados.values())
+        inicio = time.perf_counter()
+        await self.conexion.send(mensaje.SerializeToString())
+
+        terminado, errores = False, []
+        while True:
+            respuesta = ForwardMsg()
+            respuesta.ParseFromString(await asyncio.wait_for(self.conexion.recv(), self.timeout))
+            tipo = respuesta.WhichOneof('type')
+            if tipo == 'delta' and respuesta.delta.WhichOneof('type') == 'new_element':
+                self._anotar(respuesta.delta.new_element, respuesta.delta.fragment_id, errores)
+            elif tipo == 'script_finished':
+                # Tras un st.rerun() la sesión encadena otra ejecución
+                terminado = respuesta.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN
+            elif tipo == 'session_status_changed' and terminado and not respuesta.session_status_changed.script_is_running:
+                break
+        if errores:
+            raise RuntimeError(errores[0])
+        return time.perf_counter() - inicio
+
+    def _anotar(self, elemento, fragmento, errores):
+        tipo = elemento.WhichOneof('type')
+        if tipo == 'exception':
+            errores.append(f"{elemento.exception.type}: {elemento.exception.message}")
+        elif tipo in TIPOS_WIDGET:
+            widget = getattr(elemento, tipo)
+            self.widgets[widget.label] = (tipo, widget.id, fragmento)
+
+
+async def recorrido(url, aleatorio, tiempos, pausa, timeout):
+    """Una sesión nueva de principio a fin; anota en `tiempos` cada paso"""
+    import websockets
+
+    async def paso(nombre, accion):
+        tiempos[nombre].append(await accion)
+        if pausa:
+            await asyncio.sleep(aleatorio.uniform(0.5, 1.5) * pausa)
+
+    destino = url.replace('http', 'ws', 1).rstrip('/') + '/_stcore/stream'
+    async with websockets.connect(destino, subprotocols=['streamlit'], max_size=None) as conexion:
+        sesion = SesionSimulada(conexion, timeout)
+        await paso('inicio', sesion.ejecutar())
+
+        sesion.marcar("✅ He leído y acepto el tratamiento de mis datos personales conforme a la información proporcionada")
+        await paso('consentimiento', sesion.pulsar("✅ Aceptar"))
+
+        sesion.escribir("🏷️ Nombre Completo", f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} (prueba)")
+        sesion.numero("🎂 Edad", aleatorio.randint(25, 90))
+        sesion.numero("⚖️ Peso (kg)", round(aleatorio.uniform(50, 120), 1))
+        sesion.numero("📏 Altura (cm)", aleatorio.randint(150, 195))
+        await paso('perfil', sesion.pulsar("💾 Guardar Perfil"))
+
+        sesion.escribir("💊 Nombre del Medicamento", aleatorio.choice(MEDICAMENTOS))
+        await paso('medicacion', sesion.pulsar("➕ Agregar Medicamento"))
+
+        tiempos['diagnostico'].append(await sesion.pulsar("🔍 Generar Diagnóstico"))
+
+
+async def _sesion(indice, url, args, retraso, tiempos, errores):
+    aleatorio = random.Random(args.semilla * 1000 + indice)
+    await asyncio.sleep(retraso)
+    for _ in range(args.recorridos):
+        inicio = time.perf_counter()
+        try:
+            await recorrido(url, aleatorio, tiempos, args.pausa, args.timeout)
+        except Exception as e:
+            errores.append(f"sesión {indice}: {type(e).__name__}: {e}")
+        else:
+            tiempos['recorrido'].append(time.perf_counter() - inicio)
+
+
+# CPU y memoria del servidor, leídas de /proc (solo Linux)
+def _cpu_s(pid):
+    try:
+        with open(f'/proc/{pid}/stat', encoding='ascii') as f:
+            campos = f.read().rsplit(')', 1)[1].split()
+    except (OSError, TypeError):
+        return None
+    # utime y stime, en tics de reloj
+    return (int(campos[11]) + int(campos[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except (OSError, TypeError):
+        return None
+
+
+def percentiles(valores):
+    """{pN: ms} de los tiempos dados (en segundos)"""
+    if len(valores) < 2:
+        return {f"p{p}": round(valores[0] * 1000, 1) if valores else None for p in PERCENTILES}
+    cortes = statistics.quantiles(valores, n=100, method='inclusive')
+    return {f"p{p}": round(cortes[p - 1] * 1000, 1) for p in PERCENTILES}
+
+
+async def ejecutar_carga(url, pid, args):
+    tiempos, errores = defaultdict(list), []
+    rss_inicial, cpu_inicial = _rss_mb(pid), _cpu_s(pid)
+    rss_pico = rss_inicial
+
+    async def vigilar_memoria():
+        nonlocal rss_pico
+        while True:
+            await asyncio.sleep(0.5)
+            actual = _rss_mb(pid)
+            if actual is not None:
+                rss_pico = max(rss_pico or 0, actual)
+
+    vigilante = asyncio.create_task(vigilar_memoria())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        _sesion(i, url, args, args.rampa * i / args.sesiones, tiempos, errores) for i in range(args.sesiones)
+    ))
+    duracion = time.perf_counter() - inicio
+    vigilante.cancel()
+    cpu_final = _cpu_s(pid)
+
+    cpu = cpu_final - cpu_inicial if cpu_inicial is not None and cpu_final is not None else None
+    pasos = sum(len(tiempos[paso]) for paso in PASOS)
+    return {
+        'sesiones': args.sesiones, 'recorridos_por_sesion': args.recorridos, 'pausa_s': args.pausa,
+        'rampa_s': args.rampa, 'modo_servicios': None if args.url else args.modo,
+        'duracion_s': round(duracion, 2),
+        'recorridos_completos': len(tiempos['recorrido']),
+        'errores': errores,
+        'recorridos_por_s': round(len(tiempos['recorrido']) / duracion, 3),
+        'pasos_por_s': round(pasos / duracion, 2),
+        'latencias_ms': {
+            paso: {'n': len(tiempos[paso]), **percentiles(tiempos[paso])}
+            for paso in PASOS + ['recorrido'] if tiempos[paso]
+        },
+        'todos_los_pasos_ms': percentiles([t for paso in PASOS for t in tiempos[paso]]),
+        'cpu_s': None if cpu is None else round(cpu, 2),
+        # Núcleos ocupados de media; cerca de 1 el GIL ya limita la réplica
+        'cpu_nucleos': None if cpu is None else round(cpu / duracion, 2),
+        'rss_inicial_mb': rss_inicial and round(rss_inicial, 1),
+        'rss_pico_mb': rss_pico and round(rss_pico, 1),
+    }
+
+
+def arrancar_servidor(args):
+    """Lanza `streamlit run app.py` con los servicios en el modo pedido; devuelve (proceso, url)"""
+    entorno = dict(os.environ, NUTRIFARMA_SERVICIOS=args.modo, NUTRIFARMA_GRABACIONES_SEMILLA=str(args.semilla))
+    if args.grabaciones:
+        entorno['NUTRIFARMA_GRABACIONES'] = args.grabaciones
+    # Sin clave real ni cachés en el directorio del usuario
+    entorno.setdefault('GEMINI_API_KEY', 'carga')
+    entorno.setdefault('NUTRIFARMA_CACHE_DIR', tempfile.mkdtemp(prefix='nutrifarma-carga-'))
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', RUTA_APP, '--server.headless', 'true',
+         '--server.port', str(args.puerto), '--browser.gatherUsageStats', 'false'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    url = f"http://127.0.0.1:{args.puerto}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor no arrancó:\n{proceso.stderr.read().decode(errors='replace')}")
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1):
+                return proceso, url
+        except OSError:
+            time.sleep(0.25)
+    proceso.terminate()
+    raise RuntimeError("El servidor no respondió en 60 s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga de N sesiones simultáneas contra una réplica de la app')
+    parser.add_argument('--sesiones', type=int, default=5, help='Sesiones simultáneas')
+    parser.add_argument('--recorridos', type=int, default=2, help='Recorridos completos por sesión')
+    parser.add_argument('--pausa', type=float, default=0.0, help='Tiempo medio de reflexión entre pasos (s)')
+    parser.add_argument('--rampa', type=float, default=0.0, help='Segundos en los que se van incorporando las sesiones')
+    parser.add_argument(
+        '--modo', choices=['reproducir', 'grabar', 'real'], default='reproducir',
+        help='Gemini y CIMA del servidor: grabaciones (por defecto), reales grabando o reales',
+    )
+    parser.add_argument('--grabaciones', help='Directorio de grabaciones (NUTRIFARMA_GRABACIONES)')
+    parser.add_argument('--puerto', type=int, default=8599, help='Puerto del servidor que se arranca')
+    parser.add_argument('--url', help='Réplica ya arrancada (no se lanza servidor; --modo no se aplica)')
+    parser.add_argument('--pid', type=int, help='PID de la réplica de --url, para medir su CPU y memoria')
+    parser.add_argument('--timeout', type=float, default=120, help='Tiempo máximo de cada paso (s)')
+    parser.add_argument('--semilla', type=int, default=0, help='Semilla de los datos de paciente y de las respuestas reproducidas')
+    parser.add_argument('--json', help='Guarda el resultado en este fichero JSON')
+    args = parser.parse_args()
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        print("El generador de carga necesita websockets: pip install websockets")
+        return 2
+
+    proceso = None
+    if args.url:
+        url, pid = args.url, args.pid
+    else:
+        proceso, url = arrancar_servidor(args)
+        pid = proceso.pid
+    try:
+        resultado = asyncio.run(ejecutar_carga(url, pid, args))
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+
+    print(
+        f"{resultado['sesiones']} sesiones × {resultado['recorridos_por_sesion']} recorridos en "
+        f"{resultado['duracion_s']:.1f} s: {resultado['recorridos_completos']} completos, "
+        f"{len(resultado['errores'])} con error"
+    )
+    print(f"Rendimiento: {resultado['recorridos_por_s']:.2f} recorridos/s, {resultado['pasos_por_s']:.2f} pasos/s")
+    print(f"\n{'paso':<15} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for paso, datos in {**resultado['latencias_ms'], 'todos': resultado['todos_los_pasos_ms']}.items():
+        valores = ' '.join(f"{datos[f'p{p}']:>10.1f}" if datos[f'p{p}'] is not None else f"{'-':>10}" for p in PERCENTILES)
+        print(f"{paso:<15} {datos.get('n', ''):>5} {valores}")
+    if resultado['cpu_s'] is not None:
+        print(
+            f"\nServidor: CPU {resultado['cpu_s']:.1f} s ({resultado['cpu_nucleos']:.2f} núcleos de media), "
+            f"RSS {resultado['rss_inicial_mb']} → pico {resultado['rss_pico_mb']} MB"
+        )
+    for error in resultado['errores'][:10]:
+        print(f"⚠️ {error}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultado guardado en {args.json}")
+    return 1 if resultado['errores'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Tiempo de reejecución de app.py según crece la sesión, con Gemini y CIMA simulados.
+
+Ejecuta la aplicación con el AppTest de Streamlit (sin navegador) con
+registros de alimentación, actividad y medicación de 10, 100, 1.000 y
+10.000 entradas. Por cada tamaño mide:
+
+- la primera ejecución de la sesión y la mediana de las reejecuciones;
+- lo que tarda cada pestaña dentro de una reejecución (cada pestaña es un
+  fragmento `mostrar_*`);
+- el pico de memoria de una reejecución (tracemalloc, en una pasada aparte
+  para no distorsionar los tiempos);
+- generar el diagnóstico y consultar toda la medicación en CIMA.
+
+Gemini y CIMA se sustituyen solo en este proceso por respuestas fijas con
+la latencia indicada, así que no se usa la red ni la cuota. Los resultados se
+comparan con `benchmarks/baseline.json`, que no se versiona: los tiempos
+absolutos solo son comparables con una referencia medida en el mismo equipo.
+
+    python -m benchmarks.rerun                      # compara con la referencia
+    python -m benchmarks.rerun --guardar-referencia # fija la referencia
+    python -m benchmarks.rerun --tamanos 10 1000 --latencia-gemini 0
+
+Sale con código 1 si alguna medida empeora más que la tolerancia; si la
+referencia se midió en otro entorno solo se muestra la comparación.
+"""
+import argparse
+import csv
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+RUTA_APP = os.path.join(RAIZ, 'app.py')
+RUTA_REFERENCIA = os.path.join(RAIZ, 'benchmarks', 'baseline.json')
+
+# Sin clave real ni cachés en el directorio del usuario
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+os.environ.setdefault('NUTRIFARMA_CACHE_DIR', tempfile.mkdtemp(prefix='nutrifarma-bench-'))
+
+TAMANOS = [10, 100, 1000, 10000]
+# Diferencias por debajo de este umbral se consideran ruido
+RUIDO_MS = 5
+RUIDO_MB = 1
+
+MEDICAMENTOS = [
+    'Metformina 850 mg', 'Omeprazol 20 mg', 'Atorvastatina 20 mg', 'Levotiroxina 50 mcg', 'Enalapril 10 mg',
+    'Furosemida 40 mg', 'Hidroclorotiazida 25 mg', 'Simvastatina 40 mg', 'Pantoprazol 40 mg', 'Warfarina 5 mg',
+    'Acenocumarol 4 mg', 'Prednisona 10 mg', 'Alopurinol 100 mg', 'Amlodipino 5 mg', 'Losartan 50 mg',
+    'Sertralina 50 mg', 'Carbamazepina 200 mg', 'Fenitoina 100 mg', 'Metotrexato 2,5 mg', 'Calcio/Vitamina D',
+]
+RESPUESTA_GEMINI = (
+    "## Valoración\n- Datos simulados para el benchmark.\n- **IMC** y analíticas revisados.\n\n"
+    "## Recomendaciones\n1. Mantener la dieta mediterránea.\n2. Caminar 30 minutos al día.\n"
+)
+RESULTADO_CIMA = {'resultados': [{
+    'nregistro': '00000', 'nombre': 'MEDICAMENTO SIMULADO', 'pactivos': 'metformina',
+    'atcs': [{'codigo': 'A10BA02'}],
+}]}
+
+
+def simular_servicios(latencia_gemini, latencia_cima):
+    """Sustituye Gemini y CIMA por respuestas fijas con la latencia dada (segundos)"""
+    import nutrifarma.cima as cima
+    import nutrifarma.cribado as cribado
+    import nutrifarma.gemini as gemini
+
+    def consultar_gemini(prompt, contexto_paciente, forzar=False, instruccion=None, id_sesion=None):
+        time.sleep(latencia_gemini)
+        return RESPUESTA_GEMINI
+
+    def consultar_gemini_stream(prompt, contexto_paciente, forzar=False, instruccion=None):
+        partes = RESPUESTA_GEMINI.split('\n')
+        for parte in partes:
+            time.sleep(latencia_gemini / len(partes))
+            yield parte + '\n'
+
+    def buscar_medicamentos(self, nombre):
+        time.sleep(latencia_cima)
+        return RESULTADO_CIMA
+
+    gemini.consultar_gemini = cribado.consultar_gemini = consultar_gemini
+    gemini.consultar_gemini_stream = consultar_gemini_stream
+    cima.ClienteCIMA.buscar_medicamentos = buscar_medicamentos
+
+
+# Tiempos de cada fragmento (pestaña) en la ejecución en curso
+TIEMPOS_PESTANAS = defaultdict(list)
+
+
+def medir_fragmentos():
+    """Envuelve st.fragment para anotar lo que tarda cada pestaña `mostrar_*`"""
+    import streamlit as st
+
+    fragmento_original = st.fragment
+
+    def fragmento_medido(func=None, **opciones):
+        if func is None:
+            return lambda f: fragmento_medido(f, **opciones)
+
+        @functools.wraps(func)
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TIEMPOS_PESTANAS[func.__name__.removeprefix('mostrar_')].append(
+                    (time.perf_counter() - inicio) * 1000
+                )
+
+        return fragmento_original(medido, **opciones)
+
+    st.fragment = fragmento_medido
+
+
+def sembrar_sesion(at, tamano, semilla=0):
+    """Paciente con `tamano` alimentos, actividades y medicamentos"""
+    import copy
+
+    from nutrifarma.actividad import RegistroActividad
+    from nutrifarma.clinica import registrar_analitica
+    from nutrifarma.constantes import (
+        FRECUENCIAS_CONSUMO, INTENSIDADES, PACIENTE_POR_DEFECTO, TIPOS_ACTIVIDAD, TIPOS_COMIDA,
+    )
+    from nutrifarma.interacciones import actualizar_interacciones
+    from nutrifarma.registros import RegistroIndexado
+
+    aleatorio = random.Random(semilla)
+    with open(os.path.join(RAIZ, 'datos', 'composicion_alimentos.csv'), encoding='utf-8') as f:
+        alimentos = [(fila['alimento'], fila['categoria']) for fila in csv.DictReader(f)]
+    hoy = date.today()
+    # Unas 10 entradas por día, como un cuestionario real
+    fechas = [(hoy - timedelta(days=i // 10)).strftime("%Y-%m-%d") for i in range(tamano)]
+
+    registros_alimentos = []
+    for fecha in fechas:
+        alimento, categoria = aleatorio.choice(alimentos)
+        registros_alimentos.append({
+            'fecha': fecha, 'hora': f"{aleatorio.randint(7, 22):02d}:00", 'comida': aleatorio.choice(TIPOS_COMIDA),
+            'alimento': alimento, 'categoria': categoria,
+            'cantidad': aleatorio.choice(['1 ración', '150 g', '2 unidades', '1 vaso', '']),
+            'frecuencia': aleatorio.choice(FRECUENCIAS_CONSUMO),
+        })
+    registros_actividad = [{
+        'fecha': fecha, 'tipo': aleatorio.choice(TIPOS_ACTIVIDAD[:-1]), 'duracion': aleatorio.randint(15, 90),
+        'intensidad': aleatorio.choice(INTENSIDADES), 'notas': '', 'especificar_deporte': None,
+        'frecuencia_semanal': aleatorio.randint(1, 5),
+    } for fecha in fechas]
+
+    paciente = copy.deepcopy(PACIENTE_POR_DEFECTO)
+    paciente.update({'nombre': 'Paciente Benchmark', 'edad': 58, 'sexo': 'Hombre', 'peso': 88.0, 'altura': 172})
+    paciente['medicacion'] = [{
+        'nombre': MEDICAMENTOS[i % len(MEDICAMENTOS)], 'dosis': '1 comprimido', 'frecuencia': 'Cada 24h', 'motivo': '',
+    } for i in range(tamano)]
+    registrar_analitica(paciente, (hoy - timedelta(days=180)).strftime("%Y-%m-%d"), {'Glucosa': 118, 'LDL': 162, 'Vitamina D': 17})
+    registrar_analitica(paciente, hoy.strftime("%Y-%m-%d"), {'Glucosa': 109, 'LDL': 141, 'Vitamina D': 24, 'Vitamina B12': 190})
+    actualizar_interacciones(paciente)
+
+    at.session_state['consentimiento_aceptado'] = True
+    at.session_state['paciente'] = paciente
+    at.session_state['registro_alimentos'] = RegistroIndexado(registros_alimentos)
+    at.session_state['registro_actividad'] = RegistroActividad.desde_registros(registros_actividad)
+
+
+def _ejecutar(at, accion=None):
+    """Milisegundos de una ejecución completa de la app (tras pulsar `accion`, si se indica)"""
+    TIEMPOS_PESTANAS.clear()
+    inicio = time.perf_counter()
+    (accion(at) if accion else at).run()
+    transcurrido = (time.perf_counter() - inicio) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return transcurrido
+
+
+def _pulsar(etiqueta):
+    def accion(at):
+        return next(b for b in at.button if b.label == etiqueta).click()
+    return accion
+
+
+def medir_tamano(tamano, repeticiones, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(RUTA_APP, default_timeout=timeout)
+    sembrar_sesion(at, tamano)
+    resultado = {'primera_ms': _ejecutar(at)}
+
+    reejecuciones, pestanas = [], defaultdict(list)
+    for _ in range(repeticiones):
+        reejecuciones.append(_ejecutar(at))
+        for pestana, tiempos in TIEMPOS_PESTANAS.items():
+            pestanas[pestana].append(sum(tiempos))
+    resultado['rerun_ms'] = statistics.median(reejecuciones)
+    resultado['pestanas_ms'] = {pestana: statistics.median(t) for pestana, t in pestanas.items()}
+
+    tracemalloc.start()
+    try:
+        _ejecutar(at)
+        resultado['memoria_pico_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+    resultado['diagnostico_ms'] = _ejecutar(at, _pulsar("🔍 Generar Diagnóstico"))
+    resultado['cima_ms'] = _ejecutar(at, _pulsar("🔄 Consultar toda la medicación en CIMA"))
+    return resultado
+
+
+def entorno_actual():
+    """Equipo y versiones con los que se mide; una referencia de otro entorno no es comparable"""
+    import streamlit
+    return {
+        'python': platform.python_version(), 'streamlit': streamlit.__version__,
+        'maquina': platform.machine(), 'equipo': platform.node(), 'cpus': os.cpu_count(),
+    }
+
+
+def _medidas(resultado):
+    """{nombre: valor} plano de un resultado, para comparar con la referencia"""
+    medidas = {clave: valor for clave, valor in resultado.items() if clave != 'pestanas_ms'}
+    medidas.update({f"pestana {pestana}_ms": valor for pestana, valor in resultado.get('pestanas_ms', {}).items()})
+    return medidas
+
+
+def comparar(resultados, referencia, tolerancia):
+    """Líneas (tamaño, medida, referencia, actual, variación, empeora) frente a la referencia"""
+    comparacion = []
+    for tamano, resultado in resultados.items():
+        anterior = _medidas(referencia.get('resultados', {}).get(tamano, {}))
+        for medida, valor in _medidas(resultado).items():
+            if medida not in anterior:
+                continue
+            base = anterior[medida]
+            ruido = RUIDO_MB if medida.endswith('_mb') else RUIDO_MS
+            variacion = (valor - base) / base if base else 0.0
+            comparacion.append((tamano, medida, base, valor, variacion, variacion > tolerancia and valor - base > ruido))
+    return comparacion
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de reejecución de app.py con Gemini y CIMA simulados')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS, help='Entradas de cada registro')
+    parser.add_argument('--repeticiones', type=int, default=5, help='Reejecuciones medidas por tamaño')
+    parser.add_argument('--latencia-gemini', type=float, default=0.5, help='Latencia simulada de Gemini (s)')
+    parser.add_argument('--latencia-cima', type=float, default=0.1, help='Latencia simulada de cada consulta a CIMA (s)')
+    parser.add_argument('--timeout', type=float, default=300, help='Tiempo máximo de cada ejecución de la app (s)')
+    parser.add_argument('--referencia', default=RUTA_REFERENCIA, help='Fichero JSON de referencia')
+    parser.add_argument('--guardar-referencia', action='store_true', help='Guarda los resultados como nueva referencia')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Empeoramiento relativo admitido (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    simular_servicios(args.latencia_gemini, args.latencia_cima)
+    medir_fragmentos()
+
+    resultados = {}
+    for tamano in args.tamanos:
+        resultados[str(tamano)] = resultado = medir_tamano(tamano, args.repeticiones, args.timeout)
+        pestanas = ', '.join(f"{p} {t:.0f}" for p, t in sorted(resultado['pestanas_ms'].items(), key=lambda par: -par[1]))
+        print(
+            f"{tamano:>6} entradas: primera {resultado['primera_ms']:.0f} ms, reejecución {resultado['rerun_ms']:.0f} ms, "
+            f"pico {resultado['memoria_pico_mb']:.1f} MB, diagnóstico {resultado['diagnostico_ms']:.0f} ms, "
+            f"CIMA {resultado['cima_ms']:.0f} ms\n        pestañas (ms): {pestanas}"
+        )
+
+    if args.guardar_referencia:
+        referencia = {
+            'entorno': entorno_actual(),
+            'latencias': {'gemini_s': args.latencia_gemini, 'cima_s': args.latencia_cima},
+            'repeticiones': args.repeticiones,
+            'resultados': json.loads(json.dumps(resultados), parse_float=lambda v: round(float(v), 1)),
+        }
+        with open(args.referencia, 'w', encoding='utf-8') as f:
+            json.dump(referencia, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Referencia guardada en {args.referencia}")
+        return 0
+
+    if not os.path.exists(args.referencia):
+        print("Sin referencia: ejecute con --guardar-referencia para crearla")
+        return 0
+    with open(args.referencia, encoding='utf-8') as f:
+        referencia = json.load(f)
+    if referencia.get('latencias') != {'gemini_s': args.latencia_gemini, 'cima_s': args.latencia_cima}:
+        print("⚠️ La referencia se midió con otras latencias simuladas: diagnóstico y CIMA no son comparables")
+    # Sin la misma máquina y versiones la comparación es orientativa y no hace fallar
+    mismo_entorno = referencia.get('entorno') == entorno_actual()
+    if not mismo_entorno:
+        print("⚠️ La referencia se midió en otro entorno: regenérela aquí con --guardar-referencia")
+
+    empeoran = 0
+    print(f"\n{'tamaño':>6}  {'medida':<28} {'referencia':>10} {'actual':>10} {'variación':>9}")
+    for tamano, medida, base, valor, variacion, empeora in comparar(resultados, referencia, args.tolerancia):
+        empeoran += empeora
+        print(f"{tamano:>6}  {medida:<28} {base:>10.1f} {valor:>10.1f} {variacion:>+9.0%}{'  ⚠️' if empeora else ''}")
+    if empeoran:
+        print(f"\n{empeoran} medida(s) empeoran más de un {args.tolerancia:.0%} respecto a la referencia")
+        return 1 if mismo_entorno else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""NutriFarma Advisor Pro: módulos de la aplicación de Streamlit.
+
+`app.py` solo contiene la interfaz; la lógica vive en estos módulos, que se
+importan una vez por proceso. Las dependencias pesadas (pandas, PIL,
+google-generativeai, requests) se importan en las funciones que las usan.
+"""
+import time
+
+# Primera importación del paquete: referencia para medir el arranque en frío
+INICIO_PROCESO = time.perf_counter()
@@ -0,0 +1,177 @@
+"""Registro de actividad física con agregados incrementales y resúmenes semanales/mensuales."""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from nutrifarma.registros import RegistroIndexado
+
+# Recomendación OMS para adultos: 150 minutos semanales de actividad moderada
+MINUTOS_SEMANALES_RECOMENDADOS = 150
+# Tipo o intensidad vacíos (p. ej. una celda borrada en la tabla editable)
+SIN_ESPECIFICAR = "Sin especificar"
+
+
+def semana_iso(fecha):
+    """'2024-W05' para una fecha 'AAAA-MM-DD'"""
+    anio, semana, _ = datetime.strptime(fecha, "%Y-%m-%d").isocalendar()
+    return f"{anio}-W{semana:02d}"
+
+
+def _categoria(valor):
+    """Tipo o intensidad con los vacíos (None, '', NaN) unificados en SIN_ESPECIFICAR"""
+    return valor if isinstance(valor, str) and valor else SIN_ESPECIFICAR
+
+
+class RegistroActividad(RegistroIndexado):
+    """RegistroIndexado con agregados que se actualizan en cada alta, edición o baja.
+
+    Mantiene los minutos y sesiones por semana ISO y por mes, desglosados por
+    tipo e intensidad, de modo que las estadísticas cuestan O(1) por
+    interacción en lugar de recorrer todo el historial.
+    """
+
+    def __init__(self, registros=()):
+        self.total_minutos = 0
+        # (periodo, tipo, intensidad) -> minutos / sesiones
+        self._minutos_semana = Counter()
+        self._sesiones_semana = Counter()
+        self._minutos_mes = Counter()
+        self._sesiones_mes = Counter()
+        # semana -> minutos totales
+        self._total_semana = Counter()
+        # Última actividad registrada de cada tipo: base del volumen habitual declarado
+        self._ultima_por_tipo = {}
+        super().__init__(registros)
+
+    @classmethod
+    def desde_registros(cls, registros):
+        """Carga un historial completo calculando los agregados de una vez con pandas"""
+        registro = cls()
+        for reg in registros:
+            RegistroIndexado.agregar(registro, reg)
+        registro._recalcular()
+        return registro
+
+    def agregar(self, registro):
+        id_registro = super().agregar(registro)
+        self._aplicar(registro, 1)
+        self._ultima_por_tipo[_categoria(registro.get('tipo'))] = id_registro
+        return id_registro
+
+    def eliminar(self, id_registro):
+        registro = super().eliminar(id_registro)
+        self._aplicar(registro, -1)
+        tipo = _categoria(registro.get('tipo'))
+        if self._ultima_por_tipo.get(tipo) == id_registro:
+            self._buscar_ultima(tipo)
+        return registro
+
+    def actualizar(self, id_registro, cambios):
+        anterior = dict(self.obtener(id_registro))
+        self._aplicar(anterior, -1)
+        registro = super().actualizar(id_registro, cambios)
+        self._aplicar(registro, 1)
+        if _categoria(anterior.get('tipo')) != _categoria(registro.get('tipo')):
+            self._buscar_ultima(_categoria(anterior.get('tipo')))
+            self._buscar_ultima(_categoria(registro.get('tipo')))
+        return registro
+
+    def _aplicar(self, registro, signo):
+        minutos = int(registro.get('duracion') or 0)
+        semana = semana_iso(registro['fecha'])
+        mes = registro['fecha'][:7]
+        clave = (_categoria(registro.get('tipo')), _categoria(registro.get('intensidad')))
+        self.total_minutos += signo * minutos
+        for contador, periodo, valor in (
+            (self._minutos_semana, semana, minutos),
+            (self._sesiones_semana, semana, 1),
+            (self._minutos_mes, mes, minutos),
+            (self._sesiones_mes, mes, 1),
+        ):
+            contador[(periodo, *clave)] += signo * valor
+            if not contador[(periodo, *clave)]:
+                del contador[(periodo, *clave)]
+        self._total_semana[semana] += signo * minutos
+        if not self._total_semana[semana]:
+            del self._total_semana[semana]
+
+    def _buscar_ultima(self, tipo):
+        # Solo al borrar o cambiar de tipo la última actividad de ese tipo
+        self._ultima_por_tipo.pop(tipo, None)
+        for id_registro, registro in reversed(self.items()):
+            if _categoria(registro.get('tipo')) == tipo:
+                self._ultima_por_tipo[tipo] = id_registro
+                break
+
+    def _recalcular(self):
+        import pandas as pd
+
+        for contador in (self._minutos_semana, self._sesiones_semana, self._minutos_mes, self._sesiones_mes, self._total_semana):
+            contador.clear()
+        self._ultima_por_tipo = {}
+        self.total_minutos = 0
+        if not len(self):
+            return
+        df = pd.DataFrame(self.registros(), columns=['fecha', 'tipo', 'intensidad', 'duracion'])
+        df['duracion'] = pd.to_numeric(df['duracion'], errors='coerce').fillna(0).astype(int)
+        fechas = pd.to_datetime(df['fecha'], format="%Y-%m-%d")
+        iso = fechas.dt.isocalendar()
+        df['semana'] = iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)
+        df['mes'] = fechas.dt.strftime("%Y-%m")
+        for columna in ('tipo', 'intensidad'):
+            df[columna] = df[columna].map(_categoria)
+        for periodo, minutos, sesiones in (
+            ('semana', self._minutos_semana, self._sesiones_semana),
+            ('mes', self._minutos_mes, self._sesiones_mes),
+        ):
+            agregado = df.groupby([periodo, 'tipo', 'intensidad'])['duracion'].agg(['sum', 'count'])
+            minutos.update(agregado['sum'].to_dict())
+            sesiones.update(agregado['count'].to_dict())
+        self._total_semana.update(df.groupby('semana')['duracion'].sum().to_dict())
+        self.total_minutos = int(df['duracion'].sum())
+        for id_registro, registro in self.items():
+            self._ultima_por_tipo[_categoria(registro.get('tipo'))] = id_registro
+
+    def resumen(self, periodo='semana', por='tipo', medida='minutos'):
+        """Resumen {periodo: {tipo|intensidad: minutos|sesiones}} ordenado por periodo"""
+        if periodo == 'semana':
+            contador = self._minutos_semana if medida == 'minutos' else self._sesiones_semana
+        else:
+            contador = self._minutos_mes if medida == 'minutos' else self._sesiones_mes
+        posicion = 1 if por == 'tipo' else 2
+        resultado = {}
+        for clave, valor in contador.items():
+            fila = resultado.setdefault(clave[0], {})
+            fila[clave[posicion]] = fila.get(clave[posicion], 0) + valor
+        return dict(sorted(resultado.items()))
+
+    def minutos_semana(self, semana):
+        return self._total_semana[semana]
+
+    def media_semanal(self, semanas=4, hoy=None):
+        """Minutos semanales medios de las últimas `semanas` semanas (incluida la actual)"""
+        hoy = hoy or date.today()
+        total = sum(
+            self._total_semana[semana_iso((hoy - timedelta(weeks=i)).strftime("%Y-%m-%d"))]
+            for i in range(semanas)
+        )
+        return round(total / semanas)
+
+    def volumen_habitual(self):
+        """Minutos/semana declarados: duración × frecuencia semanal de la última actividad de cada tipo"""
+        volumen = {}
+        for tipo, id_registro in self._ultima_por_tipo.items():
+            registro = self.obtener(id_registro)
+            volumen[tipo] = int(registro.get('duracion') or 0) * int(registro.get('frecuencia_semanal') or 1)
+        return volumen
+
+    def resumen_para_contexto(self):
+        """Línea compacta para el contexto del coach"""
+        if not len(self):
+            return ''
+        partes = [f"media {self.media_semanal()} min/semana en las últimas 4 semanas"]
+        habitual = self.volumen_habitual()
+        if habitual:
+            detalle = ', '.join(f"{tipo} {minutos}" for tipo, minutos in habitual.items())
+            partes.append(f"volumen habitual declarado {sum(habitual.values())} min/semana ({detalle})")
+        partes.append(f"recomendación ≥{MINUTOS_SEMANALES_RECOMENDADOS} min/semana")
+        return '; '.join(partes)
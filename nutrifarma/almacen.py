@@ -0,0 +1,138 @@
+"""Almacén local cifrado de fichas de pacientes (opcional).
+
+Solo se activa si se define `NUTRIFARMA_CLAVE_ALMACEN` con una clave Fernet
+(`python -m nutrifarma.almacen` genera una). Cada ficha se guarda en SQLite
+como un bloque cifrado (JSON comprimido + Fernet, AES-128-CBC con HMAC) bajo
+un seudónimo: el HMAC-SHA256 del identificador del paciente (DNI, tarjeta
+sanitaria...) con una clave derivada de la principal. Ni el identificador ni
+el nombre aparecen en claro en la base de datos, y una ficha se localiza por
+clave primaria sin descifrar ninguna otra.
+
+Cada ficha lleva el registro del consentimiento con el que se guardó y se
+puede suprimir en cualquier momento (derecho de supresión); la base usa
+`secure_delete` para sobrescribir el contenido borrado.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+
+import streamlit as st
+
+from nutrifarma.nomenclator import normalizar_texto
+
+RUTA_ALMACEN = os.environ.get(
+    'NUTRIFARMA_ALMACEN',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos', 'pacientes.sqlite'),
+)
+CLAVE_ALMACEN = os.environ.get('NUTRIFARMA_CLAVE_ALMACEN', '')
+
+logger = logging.getLogger('nutrifarma')
+
+
+class AlmacenPacientes:
+    """Fichas de pacientes cifradas e indexadas por seudónimo"""
+
+    def __init__(self, ruta, clave):
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+        self._fernet = Fernet(clave)
+        # Clave independiente para los seudónimos, derivada de la principal
+        self._clave_seudonimo = HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b'nutrifarma-seudonimo'
+        ).derive(clave.encode() if isinstance(clave, str) else clave)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute('PRAGMA journal_mode=WAL')
+        self._conexion.execute('PRAGMA secure_delete=ON')
+        self._conexion.execute(
+            'CREATE TABLE IF NOT EXISTS pacientes ('
+            'seudonimo TEXT PRIMARY KEY, datos BLOB NOT NULL, consentimiento BLOB NOT NULL, actualizado TEXT NOT NULL)'
+        )
+        self._conexion.commit()
+
+    def seudonimo(self, identificador):
+        """HMAC del identificador normalizado (sin espacios, guiones ni mayúsculas)"""
+        normalizado = normalizar_texto(identificador).replace(' ', '').replace('-', '')
+        return hmac.new(self._clave_seudonimo, normalizado.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def _cifrar(self, valor):
+        return self._fernet.encrypt(zlib.compress(json.dumps(valor, ensure_ascii=False, default=str).encode('utf-8')))
+
+    def _descifrar(self, token):
+        return json.loads(zlib.decompress(self._fernet.decrypt(token)))
+
+    def guardar(self, identificador, estado, consentimiento):
+        """Guarda (o sustituye) la ficha. `consentimiento` es el registro que se conserva con ella"""
+        seudonimo = self.seudonimo(identificador)
+        # El seudónimo va dentro del bloque cifrado: una ficha copiada a otra fila no se acepta
+        datos = self._cifrar({'seudonimo': seudonimo, 'estado': estado})
+        with self._lock:
+            self._conexion.execute(
+                'INSERT OR REPLACE INTO pacientes VALUES (?, ?, ?, ?)',
+                (seudonimo, datos, self._cifrar(consentimiento), datetime.now().isoformat(timespec='seconds'))
+            )
+            self._conexion.commit()
+
+    def cargar(self, identificador):
+        """(estado, consentimiento) de la ficha, o None si no existe"""
+        seudonimo = self.seudonimo(identificador)
+        with self._lock:
+            fila = self._conexion.execute(
+                'SELECT datos, consentimiento FROM pacientes WHERE seudonimo = ?', (seudonimo,)
+            ).fetchone()
+        if fila is None:
+            return None
+        contenido = self._descifrar(fila[0])
+        if contenido.get('seudonimo') != seudonimo:
+            raise ValueError("La ficha no corresponde a este identificador")
+        return contenido['estado'], self._descifrar(fila[1])
+
+    def suprimir(self, identificador):
+        """Borra la ficha definitivamente. Devuelve True si existía"""
+        with self._lock:
+            cursor = self._conexion.execute('DELETE FROM pacientes WHERE seudonimo = ?', (self.seudonimo(identificador),))
+            self._conexion.commit()
+            # Vuelca y vacía el WAL para que no queden copias de la ficha borrada
+            self._conexion.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return cursor.rowcount > 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conexion.execute('SELECT COUNT(*) FROM pacientes').fetchone()[0]
+
+
+def registro_consentimiento(texto_consentimiento):
+    """Constancia del consentimiento: fecha y huella del texto que se aceptó"""
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'texto_sha256': hashlib.sha256(texto_consentimiento.encode('utf-8')).hexdigest(),
+        'finalidad': 'Almacenamiento cifrado de la ficha para el seguimiento nutricional en esta farmacia',
+    }
+
+
+@st.cache_resource
+def obtener_almacen():
+    """Almacén compartido por el proceso, o None si no está configurado o falta `cryptography`"""
+    if not CLAVE_ALMACEN:
+        return None
+    try:
+        return AlmacenPacientes(RUTA_ALMACEN, CLAVE_ALMACEN)
+    except ImportError:
+        logger.warning("Almacén de pacientes desactivado: falta el paquete cryptography")
+    except ValueError:
+        logger.warning("Almacén de pacientes desactivado: NUTRIFARMA_CLAVE_ALMACEN no es una clave Fernet válida")
+    return None
+
+
+if __name__ == '__main__':
+    from cryptography.fernet import Fernet
+    print(Fernet.generate_key().decode())
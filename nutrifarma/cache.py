@@ -0,0 +1,119 @@
+"""Caché LRU con caducidad en memoria y copia opcional en SQLite."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DIRECTORIO_CACHE = os.environ.get(
+    'NUTRIFARMA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'nutrifarma')
+)
+
+
+class CachePersistente:
+    """Caché LRU con caducidad compartida por todas las sesiones del proceso.
+
+    Los valores se guardan en memoria y, si se indica `ruta_sqlite`, también
+    en disco para que sobrevivan a los reinicios. `None` no se almacena nunca:
+    `obtener` lo devuelve para indicar un fallo de caché. El disco se purga al
+    abrir y cada décima parte de `max_entradas_disco` escrituras, así que la
+    tabla no crece más de un 10 % por encima del límite.
+    """
+
+    def __init__(self, max_entradas=1000, ttl=86400, ruta_sqlite=None, tabla='cache', max_entradas_disco=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.tabla = tabla
+        self.max_entradas_disco = max_entradas_disco or max_entradas * 10
+        self._purgar_cada = max(1, self.max_entradas_disco // 10)
+        self._escrituras_disco = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexion = None
+        if ruta_sqlite:
+            os.makedirs(os.path.dirname(ruta_sqlite) or '.', exist_ok=True)
+            self._conexion = sqlite3.connect(ruta_sqlite, check_same_thread=False)
+            self._conexion.execute('PRAGMA journal_mode=WAL')
+            self._conexion.execute(
+                f'CREATE TABLE IF NOT EXISTS {tabla} '
+                '(clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL)'
+            )
+            self._purgar_disco()
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                valor, expira = entrada
+                if expira > ahora:
+                    self._memoria.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._memoria[clave]
+            if self._conexion is not None:
+                fila = self._conexion.execute(
+                    f'SELECT valor, expira FROM {self.tabla} WHERE clave = ?', (clave,)
+                ).fetchone()
+                if fila and fila[1] > ahora:
+                    valor = json.loads(fila[0])
+                    self._guardar_en_memoria(clave, valor, fila[1])
+                    self.aciertos += 1
+                    return valor
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor):
+        if valor is None:
+            return
+        expira = time.time() + self.ttl
+        with self._lock:
+            self._guardar_en_memoria(clave, valor, expira)
+            if self._conexion is not None:
+                self._conexion.execute(
+                    f'INSERT OR REPLACE INTO {self.tabla} (clave, valor, expira) VALUES (?, ?, ?)',
+                    (clave, json.dumps(valor, ensure_ascii=False), expira)
+                )
+                self._conexion.commit()
+                self._escrituras_disco += 1
+                if self._escrituras_disco >= self._purgar_cada:
+                    self._purgar_disco()
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._memoria.pop(clave, None)
+            if self._conexion is not None:
+                self._conexion.execute(f'DELETE FROM {self.tabla} WHERE clave = ?', (clave,))
+                self._conexion.commit()
+
+    def estadisticas(self):
+        """Devuelve los contadores de aciertos/fallos y el tamaño actual"""
+        with self._lock:
+            aciertos, fallos, entradas = self.aciertos, self.fallos, len(self._memoria)
+        total = aciertos + fallos
+        return {
+            'aciertos': aciertos,
+            'fallos': fallos,
+            'tasa_aciertos': round(aciertos / total, 3) if total else 0.0,
+            'entradas_memoria': entradas,
+        }
+
+    def _guardar_en_memoria(self, clave, valor, expira):
+        self._memoria[clave] = (valor, expira)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def _purgar_disco(self):
+        # Elimina caducados y, si se supera el límite, las entradas más antiguas
+        self._escrituras_disco = 0
+        self._conexion.execute(f'DELETE FROM {self.tabla} WHERE expira <= ?', (time.time(),))
+        self._conexion.execute(
+            f'DELETE FROM {self.tabla} WHERE clave IN '
+            f'(SELECT clave FROM {self.tabla} ORDER BY expira DESC LIMIT -1 OFFSET ?)',
+            (self.max_entradas_disco,)
+        )
+        self._conexion.commit()
@@ -0,0 +1,179 @@
+"""Consultas a CIMA AEMPS: cliente HTTP compartido, nomenclátor local y resolución concurrente.
+
+`requests` se importa al crear el cliente, no al cargar la aplicación.
+"""
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from nutrifarma.cache import DIRECTORIO_CACHE, CachePersistente
+from nutrifarma.metricas import obtener_metricas, tramo
+from nutrifarma.nomenclator import RUTA_POR_DEFECTO, IndiceNomenclator, normalizar_texto
+from nutrifarma.simulacion import MODO_SERVICIOS, consulta_cima
+
+CIMA_URL_BASE = os.environ.get('NUTRIFARMA_CIMA_URL', 'https://cima.aemps.es/cima/rest')
+# Campos de cada medicamento que se conservan en caché
+CAMPOS_CIMA = (
+    'nregistro', 'nombre', 'pactivos', 'labtitular', 'cpresc', 'comerc', 'receta',
+    'generico', 'atcs', 'vtm', 'dosis', 'formaFarmaceutica', 'viasAdministracion',
+)
+
+RUTA_NOMENCLATOR = os.environ.get('NUTRIFARMA_NOMENCLATOR', RUTA_POR_DEFECTO)
+
+def normalizar_nombre_medicamento(nombre):
+    """Minúsculas, sin tildes y con espacios simples: clave de caché del medicamento"""
+    return normalizar_texto(nombre)
+
+class ClienteCIMA:
+    """Cliente de la API REST de CIMA con conexiones keep-alive y caché compartida.
+
+    Si hay un nomenclátor local importado se consulta primero; la red solo se
+    usa cuando el medicamento no está en el índice.
+    """
+
+    def __init__(self, cache, url_base=CIMA_URL_BASE, timeout=10, max_conexiones=10, nomenclator=None):
+        self.cache = cache
+        self.nomenclator = nomenclator
+        self.url_base = url_base.rstrip('/')
+        self.timeout = timeout
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(
+            pool_connections=max_conexiones,
+            pool_maxsize=max_conexiones,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+        )
+        self.sesion.mount('https://', adaptador)
+        self.sesion.mount('http://', adaptador)
+        self.sesion.headers.update({'Accept': 'application/json', 'User-Agent': 'NutriFarma-Advisor/2.0'})
+        # Petición real, grabada o reproducida según NUTRIFARMA_SERVICIOS
+        self.consultar_red = consulta_cima(self._consultar_red)
+
+    def _consultar_red(self, nombre):
+        response = self.sesion.get(
+            f"{self.url_base}/medicamentos", params={'nombre': nombre.strip()}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def buscar_medicamentos(self, nombre):
+        """Busca por nombre; lanza requests.RequestException si CIMA no responde"""
+        clave = normalizar_nombre_medicamento(nombre)
+        if not clave:
+            return None
+        with tramo('cima') as metrica:
+            if self.nomenclator is not None:
+                # Solo el prefijo exacto es fiable; la búsqueda aproximada queda para autocompletar
+                locales = self.nomenclator.buscar_prefijo(clave)
+                if locales:
+                    metrica['origen'] = 'local'
+                    return {'totalFilas': len(locales), 'resultados': locales, 'origen': 'local'}
+            resultado = self.cache.obtener(clave)
+            if resultado is not None:
+                metrica['origen'] = 'cache'
+                return resultado
+            metrica['origen'] = 'red'
+            datos = self.consultar_red(nombre)
+            resultado = {
+                'totalFilas': datos.get('totalFilas', 0),
+                'resultados': [
+                    {campo: med[campo] for campo in CAMPOS_CIMA if campo in med}
+                    for med in datos.get('resultados', [])
+                ],
+            }
+            self.cache.guardar(clave, resultado)
+            return resultado
+
+@st.cache_resource
+def obtener_nomenclator():
+    """Índice local del nomenclátor CIMA, o None si no se ha importado ningún volcado"""
+    if not os.path.exists(RUTA_NOMENCLATOR):
+        return None
+    try:
+        return IndiceNomenclator.desde_sqlite(RUTA_NOMENCLATOR)
+    except sqlite3.Error:
+        return None
+
+@st.cache_resource
+def obtener_cliente_cima():
+    """Cliente CIMA único por proceso, compartido por todas las sesiones de Streamlit"""
+    max_entradas = int(os.environ.get('NUTRIFARMA_CIMA_CACHE_MAX', 2000))
+    ttl = int(os.environ.get('NUTRIFARMA_CIMA_CACHE_TTL', 7 * 24 * 3600))
+    try:
+        # Las respuestas reproducidas no deben quedarse en la caché en disco
+        ruta = None if MODO_SERVICIOS == 'reproducir' else os.path.join(DIRECTORIO_CACHE, 'cima.sqlite')
+        cache = CachePersistente(max_entradas, ttl, ruta, tabla='cima')
+    except (OSError, sqlite3.Error):
+        # Sistema de ficheros de solo lectura: caché solo en memoria
+        cache = CachePersistente(max_entradas, ttl)
+    obtener_metricas().registrar_colector('cima_cache', cache.estadisticas)
+    return ClienteCIMA(cache, nomenclator=obtener_nomenclator())
+
+@st.cache_resource
+def obtener_ejecutor_cima():
+    """Pool de hilos compartido para las consultas concurrentes a CIMA"""
+    return ThreadPoolExecutor(
+        max_workers=int(os.environ.get('NUTRIFARMA_CIMA_HILOS', 8)), thread_name_prefix='cima'
+    )
+
+def extraer_registro_cima(resultado_cima, nombre):
+    """Resume el resultado de CIMA que mejor encaja: nregistro, principios activos y ATC"""
+    resultados = (resultado_cima or {}).get('resultados') or []
+    if not resultados:
+        return None
+    buscado = normalizar_nombre_medicamento(nombre)
+    mejor = next(
+        (r for r in resultados if normalizar_nombre_medicamento(r.get('nombre', '')).startswith(buscado)),
+        resultados[0]
+    )
+    codigos = [a['codigo'] for a in mejor.get('atcs') or [] if a.get('codigo')]
+    # Solo los códigos ATC más específicos (nivel 5 cuando CIMA lo incluye)
+    longitud = max((len(c) for c in codigos), default=0)
+    return {
+        'nregistro': mejor.get('nregistro'),
+        'nombre_cima': mejor.get('nombre'),
+        'pactivos': [p.strip() for p in (mejor.get('pactivos') or '').split(',') if p.strip()],
+        'atc': [c for c in codigos if len(c) == longitud],
+    }
+
+def resolver_medicacion_cima(medicacion, plazo=15, forzar=False):
+    """Consulta CIMA en paralelo para toda la medicación y adjunta el resultado a cada entrada.
+
+    Cada entrada recibe 'cima' (nregistro, pactivos, atc) y 'cima_estado'
+    ('ok', 'sin_resultados' o 'error'). Las consultas que no terminan dentro
+    del `plazo` (segundos) quedan como 'error' y se reintentan en la próxima
+    llamada; el resto se aplica igualmente. Devuelve (resueltas, fallidas).
+    """
+    pendientes = [
+        med for med in medicacion
+        if forzar or med.get('cima_estado') not in ('ok', 'sin_resultados')
+    ]
+    if not pendientes:
+        return 0, 0
+
+    # Una sola consulta por nombre normalizado
+    nombres = {}
+    for med in pendientes:
+        nombres.setdefault(normalizar_nombre_medicamento(med['nombre']), med['nombre'])
+
+    cliente = obtener_cliente_cima()
+    ejecutor = obtener_ejecutor_cima()
+    futuros = {clave: ejecutor.submit(cliente.buscar_medicamentos, nombre) for clave, nombre in nombres.items()}
+    wait(futuros.values(), timeout=plazo)
+
+    resueltas = fallidas = 0
+    for med in pendientes:
+        futuro = futuros[normalizar_nombre_medicamento(med['nombre'])]
+        if not futuro.done() or futuro.exception() is not None:
+            med['cima_estado'] = 'error'
+            fallidas += 1
+            continue
+        registro = extraer_registro_cima(futuro.result(), med['nombre'])
+        med['cima'] = registro
+        med['cima_estado'] = 'ok' if registro else 'sin_resultados'
+        resueltas += 1
+    return resueltas, fallidas
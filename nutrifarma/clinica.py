@@ -0,0 +1,169 @@
+"""Cálculos clínicos: IMC y valoración de analíticas."""
+from functools import lru_cache
+
+from nutrifarma.constantes import RANGOS_ESTRATIFICADOS, VALORES_REFERENCIA
+
+ICONOS_ESTADO = {'Normal': '🟢', 'Bajo': '🟡', 'Alto': '🔴'}
+
+
+def calcular_imc(peso, altura):
+    altura_m = altura / 100
+    imc = peso / (altura_m ** 2)
+    return round(imc, 1)
+
+def clasificacion_imc(imc):
+    if imc < 18.5:
+        return "Bajo peso", "🟡"
+    elif 18.5 <= imc < 25:
+        return "Peso normal", "🟢"
+    elif 25 <= imc < 30:
+        return "Sobrepeso", "🟠"
+    else:
+        return "Obesidad", "🔴"
+
+def clasificar_imc_serie(imc):
+    """Versión vectorizada de clasificacion_imc: (clasificación, icono) para una Serie de IMC"""
+    import pandas as pd
+    clasificacion = pd.cut(
+        imc, bins=[float('-inf'), 18.5, 25, 30, float('inf')], right=False,
+        labels=["Bajo peso", "Peso normal", "Sobrepeso", "Obesidad"],
+    ).astype(object)
+    iconos = clasificacion.map({"Bajo peso": "🟡", "Peso normal": "🟢", "Sobrepeso": "🟠", "Obesidad": "🔴"})
+    return clasificacion, iconos
+
+def rango_referencia(parametro, edad=None, sexo=None):
+    """(min, max) más específico para la edad y el sexo, o None si no hay referencia.
+
+    Un rango estratificado solo se aplica si se conocen y cumplen sus
+    condiciones; si no, se usa el general de VALORES_REFERENCIA.
+    """
+    mejor = None
+    for param, sexo_rango, edad_min, edad_max, minimo, maximo in RANGOS_ESTRATIFICADOS:
+        if param != parametro or edad is None or not edad_min <= edad <= edad_max:
+            continue
+        if sexo_rango is not None and sexo_rango != sexo:
+            continue
+        especificidad = (sexo_rango is not None, -(edad_max - edad_min))
+        if mejor is None or especificidad > mejor[0]:
+            mejor = (especificidad, (minimo, maximo))
+    if mejor:
+        return mejor[1]
+    if parametro in VALORES_REFERENCIA:
+        ref = VALORES_REFERENCIA[parametro]
+        return ref['min'], ref['max']
+    return None
+
+def verificar_analitica(parametro, valor, edad=None, sexo=None):
+    rango = rango_referencia(parametro, edad, sexo)
+    if rango is None:
+        return "Sin referencia"
+    minimo, maximo = rango
+    if minimo <= valor <= maximo:
+        estado = "Normal"
+    elif valor < minimo:
+        estado = "Bajo"
+    else:
+        estado = "Alto"
+    return f"{estado} {ICONOS_ESTADO[estado]}"
+
+@lru_cache(maxsize=1)
+def tabla_referencia():
+    """Rangos generales y estratificados en un DataFrame (edad_min/edad_max NaN = cualquier edad)"""
+    import pandas as pd
+    filas = [
+        (param, None, None, None, ref['min'], ref['max'], ref['unidad'], 0)
+        for param, ref in VALORES_REFERENCIA.items()
+    ]
+    for param, sexo, edad_min, edad_max, minimo, maximo in RANGOS_ESTRATIFICADOS:
+        unidad = VALORES_REFERENCIA.get(param, {}).get('unidad', '')
+        # Más específico: con sexo antes que sin él y, a igualdad, el tramo de edad más estrecho
+        especificidad = (1000 if sexo else 0) + (200 - (edad_max - edad_min))
+        filas.append((param, sexo, edad_min, edad_max, minimo, maximo, unidad, especificidad))
+    return pd.DataFrame(filas, columns=[
+        'parametro', 'sexo_ref', 'edad_min', 'edad_max', 'min', 'max', 'unidad', 'especificidad',
+    ])
+
+def evaluar_analiticas(valores):
+    """Clasifica muchas determinaciones de una vez frente a los rangos estratificados.
+
+    `valores` es un DataFrame con columnas parametro, valor y, opcionalmente,
+    edad y sexo (una fila por determinación; puede mezclar pacientes y
+    fechas). Cada fila se cruza con los rangos de su parámetro, se descartan
+    los que no aplican por edad o sexo y se queda el más específico. Devuelve
+    las columnas originales más min, max, unidad, estado e icono, en el mismo
+    orden.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = valores.reset_index(drop=True)
+    for columna in ('edad', 'sexo'):
+        if columna not in df:
+            df[columna] = None
+    cruce = df.assign(_fila=np.arange(len(df))).merge(tabla_referencia(), on='parametro', how='left')
+    edad = pd.to_numeric(cruce['edad'], errors='coerce')
+    aplica = (
+        (cruce['sexo_ref'].isna() | (cruce['sexo_ref'] == cruce['sexo']))
+        & (cruce['edad_min'].isna() | ((edad >= cruce['edad_min']) & (edad <= cruce['edad_max'])))
+    )
+    cruce = (
+        cruce[aplica | cruce['especificidad'].isna()]
+        .sort_values(['_fila', 'especificidad'], ascending=[True, False])
+        .drop_duplicates('_fila')
+        .set_index('_fila')
+        .reindex(np.arange(len(df)))
+    )
+    resultado = df.copy()
+    resultado['min'] = cruce['min'].to_numpy()
+    resultado['max'] = cruce['max'].to_numpy()
+    resultado['unidad'] = cruce['unidad'].fillna('').to_numpy()
+    valor = pd.to_numeric(resultado['valor'], errors='coerce')
+    resultado['estado'] = np.select(
+        [resultado['min'].isna() | valor.isna(), valor < resultado['min'], valor > resultado['max']],
+        ['Sin referencia', 'Bajo', 'Alto'],
+        'Normal',
+    )
+    resultado['icono'] = resultado['estado'].map(ICONOS_ESTADO).fillna('')
+    return resultado
+
+def evaluar_panel(analiticas, edad=None, sexo=None):
+    """Evalúa un panel {parámetro: valor} de un paciente"""
+    import pandas as pd
+    return evaluar_analiticas(pd.DataFrame({
+        'parametro': list(analiticas), 'valor': list(analiticas.values()), 'edad': edad, 'sexo': sexo,
+    }))
+
+def evaluar_historial(historial, edad=None, sexo=None):
+    """Evalúa todos los paneles fechados de un paciente en una sola pasada, ordenados por fecha"""
+    import pandas as pd
+    filas = [
+        (panel['fecha'], parametro, valor)
+        for panel in historial
+        for parametro, valor in panel['valores'].items()
+    ]
+    df = pd.DataFrame(filas, columns=['fecha', 'parametro', 'valor']).assign(edad=edad, sexo=sexo)
+    return evaluar_analiticas(df).sort_values(['fecha', 'parametro'], kind='stable')
+
+def tendencias_analiticas(evaluado):
+    """Último valor, anterior y variación de cada parámetro a partir de evaluar_historial"""
+    por_parametro = evaluado.groupby('parametro', sort=False)
+    ultimo = por_parametro.nth(-1).set_index('parametro')
+    anterior = por_parametro.nth(-2).set_index('parametro')['valor']
+    tendencias = ultimo[['fecha', 'valor', 'unidad', 'estado', 'icono']].rename(
+        columns={'fecha': 'fecha_ultimo', 'valor': 'ultimo'}
+    )
+    tendencias['anterior'] = anterior.reindex(tendencias.index)
+    tendencias['delta'] = tendencias['ultimo'] - tendencias['anterior']
+    tendencias['determinaciones'] = por_parametro.size()
+    return tendencias
+
+def registrar_analitica(paciente, fecha, valores):
+    """Guarda un panel fechado en el historial (sustituye el de la misma fecha).
+
+    `paciente['analiticas']` sigue siendo el panel más reciente.
+    """
+    historial = [panel for panel in paciente.get('historial_analiticas') or [] if panel['fecha'] != fecha]
+    historial.append({'fecha': fecha, 'valores': dict(valores)})
+    historial.sort(key=lambda panel: panel['fecha'])
+    paciente['historial_analiticas'] = historial
+    paciente['analiticas'] = dict(historial[-1]['valores'])
@@ -0,0 +1,243 @@
+"""Tabla local de composición de alimentos y cálculo de nutrientes del registro.
+
+Los valores de `datos/composicion_alimentos.csv` son por 100 g de porción
+comestible (aproximados a partir de tablas públicas tipo BEDCA). Cada
+alimento lleva alias para reconocer los nombres escritos libremente, el peso
+de una unidad (`g_unidad`) y el de una ración habitual (`g_racion`).
+
+pandas se importa solo al cargar la tabla o calcular totales.
+"""
+import os
+import re
+from collections import Counter
+
+import streamlit as st
+
+from nutrifarma.constantes import TIPOS_COMIDA
+from nutrifarma.nomenclator import _trigramas, normalizar_texto
+
+RUTA_COMPOSICION = os.environ.get(
+    'NUTRIFARMA_COMPOSICION',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos', 'composicion_alimentos.csv'),
+)
+
+# Columna -> etiqueta, en el orden en que se muestran
+NUTRIENTES = {
+    'energia_kcal': 'Energía (kcal)',
+    'proteinas_g': 'Proteínas (g)',
+    'hidratos_g': 'Hidratos (g)',
+    'azucares_g': 'Azúcares (g)',
+    'grasas_g': 'Grasas (g)',
+    'grasas_saturadas_g': 'Grasas saturadas (g)',
+    'fibra_g': 'Fibra (g)',
+    'sodio_mg': 'Sodio (mg)',
+    'potasio_mg': 'Potasio (mg)',
+    'calcio_mg': 'Calcio (mg)',
+    'hierro_mg': 'Hierro (mg)',
+    'magnesio_mg': 'Magnesio (mg)',
+    'vitamina_c_mg': 'Vitamina C (mg)',
+    'vitamina_d_ug': 'Vitamina D (µg)',
+    'vitamina_b12_ug': 'Vitamina B12 (µg)',
+    'folatos_ug': 'Folatos (µg)',
+}
+
+# Unidades de masa/volumen (gramos por unidad; 1 ml ≈ 1 g)
+UNIDADES_MASA = {
+    'g': 1, 'gr': 1, 'grs': 1, 'gramo': 1, 'gramos': 1,
+    'kg': 1000, 'kilo': 1000, 'kilos': 1000,
+    'ml': 1, 'cl': 10, 'dl': 100, 'l': 1000, 'litro': 1000, 'litros': 1000,
+}
+# Medidas caseras en gramos aproximados
+MEDIDAS_CASERAS = {
+    'taza': 200, 'vaso': 200, 'copa': 150, 'cazo': 150, 'plato': 250, 'bol': 250, 'cuenco': 250,
+    'cucharada': 15, 'cuchara': 15, 'cucharadita': 5, 'punado': 30, 'rebanada': 30, 'loncha': 20,
+    'lata': 80, 'onza': 10, 'chorrito': 10, 'pizca': 1,
+}
+MEDIDAS_CASERAS.update({f"{medida}s": gramos for medida, gramos in list(MEDIDAS_CASERAS.items())})
+UNIDADES_RACION = {'racion', 'raciones', 'porcion', 'porciones'}
+# Un número sin unidad por encima de este valor son gramos ("100"), no unidades
+MAX_UNIDADES_SIN_MEDIDA = 10
+
+_NUMEROS_ESCRITOS = {
+    'medio': '0.5', 'media': '0.5', 'un': '1', 'una': '1', 'uno': '1', 'dos': '2', 'tres': '3',
+    'cuatro': '4', 'cinco': '5', 'seis': '6', 'siete': '7', 'ocho': '8', 'nueve': '9', 'diez': '10',
+}
+_FRACCIONES = {'½': ' 1/2', '¼': ' 1/4', '¾': ' 3/4', '⅓': ' 1/3'}
+_PATRON_CANTIDAD = re.compile(r'(\d+(?:[.,]\d+)?(?:/\d+)?)\s*([a-z]+)?')
+
+
+def _numero(texto):
+    if '/' in texto:
+        numerador, denominador = texto.split('/')
+        return float(numerador) / float(denominador) if float(denominador) else 0.0
+    return float(texto.replace(',', '.'))
+
+
+def interpretar_cantidad(cantidad, g_unidad=None, g_racion=None):
+    """Gramos de una cantidad escrita libremente, o None si no se puede interpretar.
+
+    Prefiere las unidades de masa o volumen ("1 taza, 150g" → 150), después las
+    medidas caseras ("2 cucharadas" → 30) y las raciones. Un número seguido de
+    cualquier otra palabra se toma como nº de unidades ("2 huevos"); sin unidad,
+    hasta MAX_UNIDADES_SIN_MEDIDA son unidades y por encima, gramos.
+
+    >>> interpretar_cantidad("100", g_unidad=60)
+    100.0
+    >>> interpretar_cantidad("2", g_unidad=60)
+    120.0
+    >>> interpretar_cantidad("150 g", g_unidad=60)
+    150.0
+    """
+    texto = cantidad or ''
+    for simbolo, fraccion in _FRACCIONES.items():
+        texto = texto.replace(simbolo, fraccion)
+    palabras = [_NUMEROS_ESCRITOS.get(p, p) for p in normalizar_texto(texto).split(' ')]
+    coincidencias = [
+        (_numero(numero), unidad or '')
+        for numero, unidad in _PATRON_CANTIDAD.findall(' '.join(palabras))
+    ]
+    if not coincidencias:
+        return None
+    for numero, unidad in coincidencias:
+        if unidad in UNIDADES_MASA:
+            return numero * UNIDADES_MASA[unidad]
+    for numero, unidad in coincidencias:
+        if unidad in MEDIDAS_CASERAS:
+            return numero * MEDIDAS_CASERAS[unidad]
+    numero, unidad = coincidencias[0]
+    if not unidad and numero > MAX_UNIDADES_SIN_MEDIDA:
+        return numero
+    if unidad in UNIDADES_RACION:
+        return numero * g_racion if g_racion else None
+    if g_unidad:
+        return numero * g_unidad
+    return numero * g_racion if g_racion else None
+
+
+class TablaComposicion:
+    """Tabla de composición con índice de nombres y alias.
+
+    La búsqueda prueba el nombre exacto, después el nombre o alias más largo
+    contenido en el texto ("pechuga de pollo a la plancha" → pollo) y por
+    último una búsqueda aproximada por trigramas. Los resultados se memorizan
+    por texto normalizado.
+    """
+
+    def __init__(self, tabla):
+        self.tabla = tabla.reset_index(drop=True)
+        self._claves = {}
+        for idx, fila in self.tabla.iterrows():
+            nombres = [fila['alimento']] + str(fila.get('alias') or '').split('|')
+            for nombre in nombres:
+                clave = normalizar_texto(nombre)
+                if clave and clave != 'nan':
+                    self._claves.setdefault(clave, idx)
+        self._max_palabras = max(len(clave.split(' ')) for clave in self._claves)
+        self._trigramas_clave = {clave: _trigramas(clave) for clave in self._claves}
+        self._por_trigrama = {}
+        for clave, trigramas in self._trigramas_clave.items():
+            for trigrama in trigramas:
+                self._por_trigrama.setdefault(trigrama, []).append(clave)
+        self._memo = {}
+
+    @classmethod
+    def desde_csv(cls, ruta=RUTA_COMPOSICION):
+        import pandas as pd
+        return cls(pd.read_csv(ruta))
+
+    def __len__(self):
+        return len(self.tabla)
+
+    def buscar(self, alimento, umbral=0.5):
+        """Índice de fila del alimento en la tabla, o None"""
+        consulta = normalizar_texto(alimento)
+        if consulta not in self._memo:
+            self._memo[consulta] = self._buscar(consulta, umbral)
+        return self._memo[consulta]
+
+    def _buscar(self, consulta, umbral):
+        if not consulta:
+            return None
+        if consulta in self._claves:
+            return self._claves[consulta]
+        palabras = consulta.split(' ')
+        for n in range(min(self._max_palabras, len(palabras)), 0, -1):
+            for i in range(len(palabras) - n + 1):
+                clave = ' '.join(palabras[i:i + n])
+                if clave in self._claves:
+                    return self._claves[clave]
+        trigramas = _trigramas(consulta)
+        comunes = Counter()
+        for trigrama in trigramas:
+            comunes.update(self._por_trigrama.get(trigrama, ()))
+        mejor, similitud_mejor = None, umbral
+        for clave, n in comunes.items():
+            similitud = n / (len(trigramas) + len(self._trigramas_clave[clave]) - n)
+            if similitud >= similitud_mejor:
+                mejor, similitud_mejor = clave, similitud
+        return self._claves[mejor] if mejor else None
+
+    def calcular(self, registros):
+        """Nutrientes de cada registro de alimentación.
+
+        Devuelve un DataFrame con fecha, comida, alimento, `referencia` (nombre
+        en la tabla, NaN si no se reconoce), `gramos`, `estimado` (sin cantidad
+        interpretable: se usa la ración habitual) y una columna por nutriente.
+        Cada nombre y cada cantidad distintos se resuelven una sola vez; el
+        cálculo de nutrientes es una única multiplicación de matrices.
+        """
+        import numpy as np
+        import pandas as pd
+
+        df = pd.DataFrame(list(registros), columns=['fecha', 'comida', 'alimento', 'cantidad'])
+        filas = df['alimento'].map({nombre: self.buscar(nombre) for nombre in df['alimento'].unique()})
+        df['referencia'] = filas.map(self.tabla['alimento'])
+        gramos = {}
+        for fila, cantidad in set(zip(filas, df['cantidad'])):
+            if pd.isna(fila):
+                continue
+            alimento = self.tabla.loc[int(fila)]
+            g_unidad = None if pd.isna(alimento['g_unidad']) else alimento['g_unidad']
+            g_racion = None if pd.isna(alimento['g_racion']) else alimento['g_racion']
+            gramos[(fila, cantidad)] = (interpretar_cantidad(cantidad, g_unidad, g_racion), g_racion)
+        interpretados = [gramos.get((fila, cantidad), (None, None)) for fila, cantidad in zip(filas, df['cantidad'])]
+        df['estimado'] = [g is None and racion is not None for g, racion in interpretados]
+        df['gramos'] = [g if g is not None else racion for g, racion in interpretados]
+        df['gramos'] = df['gramos'].astype(float)
+        valores = self.tabla[list(NUTRIENTES)].reindex(filas.to_numpy()).to_numpy(dtype=float)
+        df[list(NUTRIENTES)] = np.nan_to_num(valores) * (df['gramos'].fillna(0).to_numpy()[:, None] / 100)
+        return df
+
+
+@st.cache_resource
+def obtener_tabla_composicion():
+    """Tabla de composición compartida por todas las sesiones, o None si falta el fichero"""
+    if not os.path.exists(RUTA_COMPOSICION):
+        return None
+    return TablaComposicion.desde_csv(RUTA_COMPOSICION)
+
+
+def totales_por_comida(detalle):
+    """Totales de nutrientes por fecha y comida, en el orden de TIPOS_COMIDA"""
+    import pandas as pd
+    comidas = pd.Categorical(detalle['comida'], categories=TIPOS_COMIDA, ordered=True)
+    return detalle.assign(comida=comidas).groupby(['fecha', 'comida'], observed=True)[list(NUTRIENTES)].sum()
+
+
+def totales_por_dia(detalle):
+    return detalle.groupby('fecha')[list(NUTRIENTES)].sum().sort_index()
+
+
+def resumen_para_contexto(detalle):
+    """Media diaria de energía y macronutrientes para el contexto del coach"""
+    if detalle is None:
+        return ''
+    reconocidos = detalle[detalle['referencia'].notna()]
+    if reconocidos.empty:
+        return ''
+    media = totales_por_dia(reconocidos).mean()
+    return (
+        f"media {media['energia_kcal']:.0f} kcal/día (proteínas {media['proteinas_g']:.0f} g, "
+        f"hidratos {media['hidratos_g']:.0f} g, grasas {media['grasas_g']:.0f} g, fibra {media['fibra_g']:.0f} g, "
+        f"sodio {media['sodio_mg']:.0f} mg) en {reconocidos['fecha'].nunique()} día(s) registrados"
+    )
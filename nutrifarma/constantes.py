@@ -0,0 +1,241 @@
+"""Constantes de la aplicación: estilos, textos legales y tablas de referencia.
+
+Se cargan una sola vez por proceso al importar el módulo, en lugar de
+reconstruirse en cada ejecución del script de Streamlit.
+"""
+
+# CSS personalizado para interfaz atractiva
+CSS_PERSONALIZADO = """
+<style>
+    /* Estilos generales */
+    .main {
+        background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
+    }
+    
+    /* Tarjetas */
+    .stCard {
+        background: white;
+        padding: 20px;
+        border-radius: 15px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+        margin: 10px 0;
+    }
+    
+    /* Encabezados */
+    h1 {
+        color: #2c3e50;
+        text-align: center;
+        padding: 20px;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        -webkit-background-clip: text;
+        -webkit-text-fill-color: transparent;
+        font-weight: 800;
+    }
+    
+    h2 {
+        color: #34495e;
+        border-bottom: 3px solid #3498db;
+        padding-bottom: 10px;
+    }
+    
+    /* Botones */
+    .stButton>button {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        border: none;
+        padding: 12px 30px;
+        border-radius: 25px;
+        font-weight: 600;
+        transition: transform 0.3s ease;
+    }
+    
+    .stButton>button:hover {
+        transform: scale(1.05);
+        box-shadow: 0 6px 12px rgba(0,0,0,0.2);
+    }
+    
+    /* Tabs */
+    .stTabs [data-baseweb="tab-list"] {
+        gap: 10px;
+    }
+    
+    .stTabs [data-baseweb="tab"] {
+        background-color: #f0f2f6;
+        border-radius: 10px 10px 0 0;
+        padding: 10px 20px;
+    }
+    
+    .stTabs [aria-selected="true"] {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white !important;
+    }
+    
+    /* Inputs */
+    .stTextInput>div>div>input, .stTextArea>div>div>textarea {
+        border-radius: 10px;
+        border: 2px solid #e0e0e0;
+    }
+    
+    /* Métricas */
+    [data-testid="stMetricValue"] {
+        font-size: 28px;
+        font-weight: 700;
+        color: #667eea;
+    }
+</style>
+"""
+
+# Texto del consentimiento informado (RGPD/LOPD)
+TEXTO_CONSENTIMIENTO = """
+### Información sobre el Tratamiento de Datos Personales
+
+De acuerdo con el **Reglamento General de Protección de Datos (RGPD)** y la 
+**Ley Orgánica de Protección de Datos (LOPD)**, le informamos:
+
+#### 📁 Datos que se recopilan:
+- Datos identificativos (nombre, edad, sexo)
+- Datos de salud (medidas antropométricas, analíticas, enfermedades, medicación)
+- Datos de hábitos alimentarios y actividad física
+
+#### 🎯 Finalidad del tratamiento:
+- Asesoramiento nutricional personalizado
+- Seguimiento de hábitos saludables
+- Análisis de interacciones medicamento-nutriente
+
+#### 🔒 Seguridad de los datos:
+- **Sus datos NO se almacenan en ningún servidor**
+- La información permanece únicamente en **esta sesión del navegador**
+- Al cerrar la aplicación, todos los datos se eliminan automáticamente
+
+#### ⚖️ Sus derechos (ARCO):
+- **Acceso**: Puede consultar sus datos en cualquier momento
+- **Rectificación**: Puede modificar cualquier dato erróneo
+- **Cancelación**: Puede eliminar todos sus datos (botón "Limpiar Todo")
+- **Oposición**: Puede rechazar este consentimiento y cerrar la aplicación
+
+#### 🏭 Responsable del tratamiento:
+- **NutriFarma Advisor Pro**
+- Herramienta de asesoramiento nutricional para farmacias
+
+---
+"""
+
+# Se añade al consentimiento cuando el almacén cifrado de fichas está activado
+TEXTO_CONSENTIMIENTO_ALMACEN = """
+#### 🗄️ Ficha de seguimiento (opcional):
+- Solo si usted lo **autoriza expresamente**, la farmacia puede guardar su ficha para próximas visitas
+- La ficha se guarda **cifrada en el equipo de la farmacia**, nunca en servidores externos
+- Se identifica con un **seudónimo** calculado a partir de su documento: su nombre y documento no se guardan en claro
+- Se registra la fecha de su autorización
+- Puede pedir en cualquier momento que se **suprima** definitivamente
+
+---
+"""
+
+# Plantilla de un paciente nuevo
+PACIENTE_POR_DEFECTO = {
+    'nombre': '',
+    'edad': 30,
+    'sexo': 'Mujer',
+    'peso': 70.0,
+    'altura': 165,
+    'analiticas': {},
+    'enfermedades': [],
+    'medicacion': [],
+    'alergias': [],
+    'objetivo': '',
+    # Contexto del paciente
+    'estado_civil': '',
+    'hijos': 0,
+    'personas_cargo': '',
+    'profesion': '',
+    'horario_laboral': '',
+    'estres_laboral': 'Medio',
+    'tiempo_disponible': 'Medio',
+    'recursos_economicos': 'Medios',
+    # Sueño y descanso
+    'horas_sueno': 7,
+    'calidad_sueno': 'Buena',
+    'trastornos_sueno': [],
+    # Actividad física detallada
+    'tipo_actividad': [],
+    'frecuencia_semanal': 0,
+    'intensidad_actividad': 'Moderada',
+    # Determinantes del cambio
+    'barreras': [],
+    'beneficios_percibidos': [],
+    'creencias_alimentacion': '',
+    'emociones_comida': '',
+    'entorno_familiar': '',
+    'habilidades_cocina': 'Intermedias',
+    'conocimientos_nutricionales': 'Básicos',
+    'comidas_fuera_casa': 0,
+    'apoyo_social': '',
+    # Evaluación motivacional
+    'etapa_cambio': 'Contemplación',
+    'nivel_importancia': 5,
+    'nivel_confianza': 5,
+    # Diagnóstico PES
+    'problema_pes': '',
+    'etiologia_pes': '',
+    'signos_sintomas_pes': '',
+    # Objetivos SMART/PRAMPE
+    'objetivo_smart': '',
+    'objetivos_especificos': [],
+    # Plan de acción
+    'acciones_concretas': [],
+    'estrategias_motivacionales': [],
+    # Medicación e interacciones
+    'interacciones_detectadas': [],
+    'suplementos_recomendados': [],
+    # Analíticas anteriores: [{'fecha': 'AAAA-MM-DD', 'valores': {parámetro: valor}}]
+    'historial_analiticas': []
+}
+
+# Valores de referencia para analíticas
+VALORES_REFERENCIA = {
+    'Glucosa': {'min': 70, 'max': 100, 'unidad': 'mg/dL'},
+    'Colesterol Total': {'min': 0, 'max': 200, 'unidad': 'mg/dL'},
+    'HDL': {'min': 40, 'max': 999, 'unidad': 'mg/dL'},
+    'LDL': {'min': 0, 'max': 100, 'unidad': 'mg/dL'},
+    'Triglicéridos': {'min': 0, 'max': 150, 'unidad': 'mg/dL'},
+    'HbA1c': {'min': 4.0, 'max': 5.6, 'unidad': '%'},
+    'Vitamina D': {'min': 30, 'max': 100, 'unidad': 'ng/mL'},
+    'Vitamina B12': {'min': 200, 'max': 900, 'unidad': 'pg/mL'},
+    'Hierro': {'min': 60, 'max': 170, 'unidad': 'µg/dL'},
+    'Ferritina': {'min': 20, 'max': 200, 'unidad': 'ng/mL'},
+}
+
+# Rangos específicos por sexo y edad que prevalecen sobre VALORES_REFERENCIA:
+# (parámetro, sexo o None, edad mínima, edad máxima, min, max)
+RANGOS_ESTRATIFICADOS = [
+    ('HDL', 'Hombre', 18, 120, 40, 999),
+    ('HDL', 'Mujer', 18, 120, 50, 999),
+    ('Ferritina', 'Hombre', 18, 120, 30, 400),
+    ('Ferritina', 'Mujer', 18, 120, 15, 150),
+    ('Hierro', 'Hombre', 18, 120, 65, 175),
+    ('Hierro', 'Mujer', 18, 120, 50, 170),
+    # Población pediátrica
+    ('Colesterol Total', None, 0, 17, 0, 170),
+    ('LDL', None, 0, 17, 0, 110),
+    ('HDL', None, 0, 17, 45, 999),
+    ('Triglicéridos', None, 0, 9, 0, 75),
+    ('Triglicéridos', None, 10, 17, 0, 90),
+]
+
+ENFERMEDADES_COMUNES = [
+    'Diabetes Tipo 1', 'Diabetes Tipo 2', 'Prediabetes',
+    'Hipertensión', 'Hipercolesterolemia', 'Obesidad',
+    'Enfermedad Celíaca', 'Intolerancia a la Lactosa',
+    'Síndrome de Intestino Irritable', 'Reflujo Gastroesofágico',
+    'Hipotiroidismo', 'Hipertiroidismo', 'Anemia',
+    'Osteoporosis', 'Artritis', 'Enfermedad Renal Crónica',
+    'Hígado Graso', 'Gota', 'Ninguna'
+]
+
+# Opciones de los registros de alimentación y actividad
+TIPOS_COMIDA = ["Desayuno", "Media Mañana", "Almuerzo", "Merienda", "Cena", "Otro"]
+FRECUENCIAS_CONSUMO = ["Diaria", "2-3 veces/semana", "4-6 veces/semana", "Semanal", "Ocasional"]
+CATEGORIAS_ALIMENTOS = ["Cereales y derivados", "Verduras y hortalizas", "Frutas", "Leche y lácteos", "Carnes/pescados/huevos", "Legumbres", "Aceites/grasas"]
+TIPOS_ACTIVIDAD = ["Caminata", "Correr", "Ciclismo", "Natación", "Gimnasio", "Yoga", "Deporte en equipo", "Otro"]
+INTENSIDADES = ["Ligera", "Moderada", "Intensa", "Muy Intensa"]
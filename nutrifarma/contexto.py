@@ -0,0 +1,149 @@
+"""Contexto compacto del paciente para los prompts de Gemini."""
+import os
+
+from nutrifarma.clinica import calcular_imc, clasificacion_imc
+from nutrifarma.constantes import PACIENTE_POR_DEFECTO, VALORES_REFERENCIA
+from nutrifarma.gemini import obtener_modelo_gemini
+
+PRESUPUESTO_TOKENS_CONTEXTO = int(os.environ.get('NUTRIFARMA_CONTEXTO_TOKENS', 1500))
+# Longitud máxima de cada campo de texto libre en el contexto
+MAX_CARACTERES_CAMPO = 400
+
+# Campos del paciente en orden de prioridad: si no cabe todo, se descartan los últimos
+CAMPOS_CONTEXTO = {
+    'nombre': 'Nombre',
+    'edad': 'Edad (años)',
+    'sexo': 'Sexo',
+    'peso': 'Peso (kg)',
+    'altura': 'Altura (cm)',
+    'objetivo': 'Objetivo',
+    'enfermedades': 'Enfermedades',
+    'alergias': 'Alergias/intolerancias',
+    'medicacion': 'Medicación',
+    'analiticas': 'Analíticas',
+    'interacciones_detectadas': 'Interacciones detectadas',
+    'suplementos_recomendados': 'Suplementos recomendados',
+    'etapa_cambio': 'Etapa de cambio',
+    'nivel_importancia': 'Importancia del cambio (0-10)',
+    'nivel_confianza': 'Confianza en el cambio (0-10)',
+    'problema_pes': 'Problema (PES)',
+    'etiologia_pes': 'Etiología (PES)',
+    'signos_sintomas_pes': 'Signos y síntomas (PES)',
+    'objetivo_smart': 'Objetivo SMART',
+    'objetivos_especificos': 'Objetivos específicos',
+    'tipo_actividad': 'Actividad física',
+    'frecuencia_semanal': 'Días de actividad/semana',
+    'intensidad_actividad': 'Intensidad de la actividad',
+    'horas_sueno': 'Horas de sueño',
+    'calidad_sueno': 'Calidad del sueño',
+    'trastornos_sueno': 'Trastornos del sueño',
+    'barreras': 'Barreras',
+    'beneficios_percibidos': 'Beneficios percibidos',
+    'creencias_alimentacion': 'Creencias sobre alimentación',
+    'emociones_comida': 'Emociones y comida',
+    'entorno_familiar': 'Entorno familiar',
+    'habilidades_cocina': 'Habilidades de cocina',
+    'conocimientos_nutricionales': 'Conocimientos nutricionales',
+    'comidas_fuera_casa': 'Comidas fuera de casa/semana',
+    'apoyo_social': 'Apoyo social',
+    'estado_civil': 'Estado civil',
+    'hijos': 'Hijos',
+    'personas_cargo': 'Personas a cargo',
+    'profesion': 'Profesión',
+    'horario_laboral': 'Horario laboral',
+    'estres_laboral': 'Estrés laboral',
+    'tiempo_disponible': 'Tiempo disponible',
+    'recursos_economicos': 'Recursos económicos',
+    'acciones_concretas': 'Acciones concretas',
+    'estrategias_motivacionales': 'Estrategias motivacionales',
+}
+# Los resúmenes calculados a partir de los registros (actividad, dieta...) van
+# justo antes de este campo: tras los datos clínicos y por delante del coaching
+CAMPO_RESUMENES = 'interacciones_detectadas'
+# Datos básicos que se envían aunque conserven el valor por defecto
+CAMPOS_SIEMPRE_PRESENTES = {'edad', 'sexo', 'peso', 'altura'}
+
+def estimar_tokens(texto):
+    """Estimación local (≈4 caracteres por token) para no llamar a la API en cada petición"""
+    return len(texto) // 4 + 1
+
+def contar_tokens_gemini(texto):
+    """Tokens según el contador del modelo; estimación local si la API no responde"""
+    try:
+        return obtener_modelo_gemini().count_tokens(texto).total_tokens
+    except Exception:
+        return estimar_tokens(texto)
+
+def _formatear_valor_contexto(campo, valor):
+    if campo == 'medicacion':
+        partes = []
+        for med in valor:
+            texto = ' '.join(p for p in (med.get('nombre'), med.get('dosis'), med.get('frecuencia')) if p)
+            if med.get('cima') and med['cima'].get('pactivos'):
+                texto += f" [{', '.join(med['cima']['pactivos'])}]"
+            partes.append(texto)
+        return '; '.join(partes)
+    if campo == 'analiticas':
+        return '; '.join(
+            f"{param} {v} {VALORES_REFERENCIA.get(param, {}).get('unidad', '')}".rstrip()
+            for param, v in valor.items()
+        )
+    if campo == 'interacciones_detectadas':
+        return '; '.join(i['descripcion'] if isinstance(i, dict) else str(i) for i in valor)
+    if isinstance(valor, dict):
+        return '; '.join(f"{k} {v}" for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return '; '.join(str(v) for v in valor if v)
+    texto = ' '.join(str(valor).split())
+    if len(texto) > MAX_CARACTERES_CAMPO:
+        texto = texto[:MAX_CARACTERES_CAMPO] + '…'
+    return texto
+
+def _lineas_contexto(paciente, resumenes=None):
+    lineas = []
+    for campo, etiqueta in CAMPOS_CONTEXTO.items():
+        if campo == CAMPO_RESUMENES and resumenes:
+            lineas.extend(f"{nombre}: {texto}" for nombre, texto in resumenes.items() if texto)
+        valor = paciente.get(campo)
+        if valor in (None, '', [], {}):
+            continue
+        if campo not in CAMPOS_SIEMPRE_PRESENTES and valor == PACIENTE_POR_DEFECTO.get(campo):
+            continue
+        texto = _formatear_valor_contexto(campo, valor)
+        if texto:
+            lineas.append(f"{etiqueta}: {texto}")
+        if campo == 'altura' and paciente.get('peso') and paciente.get('altura'):
+            imc = calcular_imc(paciente['peso'], paciente['altura'])
+            lineas.append(f"IMC: {imc} ({clasificacion_imc(imc)[0]})")
+    return lineas
+
+def construir_contexto_paciente(paciente, presupuesto_tokens=PRESUPUESTO_TOKENS_CONTEXTO, contar_tokens=contar_tokens_gemini, resumenes=None):
+    """Serializa de forma compacta solo los campos del paciente que tienen valor.
+
+    `resumenes` ({etiqueta: texto}) añade líneas calculadas fuera del perfil,
+    como el volumen semanal de actividad.
+
+    Si el texto no cabe en `presupuesto_tokens` se descartan los campos de menor
+    prioridad. El contador del modelo solo se consulta cuando la estimación
+    local se acerca al presupuesto.
+    """
+    lineas = _lineas_contexto(paciente, resumenes)
+    limite = presupuesto_tokens
+    for _ in range(3):
+        seleccion = []
+        usados = 0
+        for linea in lineas:
+            coste = estimar_tokens(linea)
+            if usados + coste > limite and seleccion:
+                break
+            seleccion.append(linea)
+            usados += coste
+        texto = "\n".join(seleccion)
+        if contar_tokens is None or usados < presupuesto_tokens * 0.8:
+            return texto
+        reales = contar_tokens(texto)
+        if reales <= presupuesto_tokens:
+            return texto
+        # La estimación se quedó corta: ajustar el límite a la proporción real
+        limite = int(limite * presupuesto_tokens / reales * 0.95)
+    return texto
@@ -0,0 +1,175 @@
+"""Cribado de campañas: muchas personas a la vez desde un CSV o Excel.
+
+El IMC, la clasificación y la valoración de todas las analíticas se calculan
+por columnas con pandas. Solo las personas marcadas como de riesgo alto se
+envían a Gemini, con un número acotado de consultas simultáneas.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from nutrifarma.clinica import clasificar_imc_serie, evaluar_analiticas
+from nutrifarma.constantes import VALORES_REFERENCIA
+from nutrifarma.gemini import INSTRUCCION_CRIBADO, consultar_gemini
+from nutrifarma.nomenclator import normalizar_texto
+
+# Consultas simultáneas a Gemini al analizar una campaña
+HILOS_CRIBADO = int(os.environ.get('NUTRIFARMA_CRIBADO_HILOS', 4))
+
+# Nombre normalizado de la columna -> columna canónica
+ALIAS_COLUMNAS = {
+    'id': 'id', 'identificador': 'id', 'codigo': 'id', 'n': 'id',
+    'nombre': 'nombre', 'paciente': 'nombre',
+    'edad': 'edad', 'sexo': 'sexo', 'genero': 'sexo',
+    'peso': 'peso', 'peso kg': 'peso', 'peso (kg)': 'peso',
+    'altura': 'altura', 'talla': 'altura', 'altura cm': 'altura', 'altura (cm)': 'altura', 'talla (cm)': 'altura',
+    'colesterol': 'Colesterol Total', 'trigliceridos': 'Triglicéridos',
+}
+ALIAS_COLUMNAS.update({normalizar_texto(parametro): parametro for parametro in VALORES_REFERENCIA})
+# Sin 'm'/'f' sueltas: en ficheros mixtos español/inglés 'm' puede ser mujer o male
+ALIAS_SEXO = {
+    'mujer': 'Mujer', 'femenino': 'Mujer', 'female': 'Mujer',
+    'h': 'Hombre', 'v': 'Hombre', 'hombre': 'Hombre', 'varon': 'Hombre', 'masculino': 'Hombre', 'male': 'Hombre',
+}
+
+# (columna, comparación, umbral, nivel, motivo): criterios de derivación en cribados de farmacia
+CRITERIOS_RIESGO = [
+    ('Glucosa', '>=', 126, 'alto', 'glucosa en rango de diabetes'),
+    ('Glucosa', 'entre', (100, 126), 'moderado', 'glucosa alterada en ayunas'),
+    ('HbA1c', '>=', 6.5, 'alto', 'HbA1c en rango de diabetes'),
+    ('HbA1c', 'entre', (5.7, 6.5), 'moderado', 'HbA1c de prediabetes'),
+    ('Colesterol Total', '>=', 240, 'alto', 'colesterol total muy elevado'),
+    ('Colesterol Total', 'entre', (200, 240), 'moderado', 'colesterol total elevado'),
+    ('LDL', '>=', 160, 'alto', 'LDL muy elevado'),
+    ('Triglicéridos', '>=', 500, 'alto', 'triglicéridos muy elevados'),
+    ('Triglicéridos', 'entre', (150, 500), 'moderado', 'triglicéridos elevados'),
+    ('imc', '>=', 35, 'alto', 'obesidad grado II o superior'),
+    ('imc', 'entre', (30, 35), 'moderado', 'obesidad grado I'),
+    ('imc', '<', 18.5, 'moderado', 'bajo peso'),
+    ('Vitamina D', '<', 20, 'moderado', 'déficit de vitamina D'),
+    ('Vitamina B12', '<', 200, 'moderado', 'déficit de vitamina B12'),
+]
+# Puntos por criterio; riesgo alto desde PUNTOS_RIESGO['alto'] (un criterio alto o tres moderados)
+PUNTOS_RIESGO = {'alto': 3, 'moderado': 1}
+
+
+def leer_campana(archivo, nombre_archivo):
+    """DataFrame de la campaña con columnas canónicas, a partir de un CSV o Excel.
+
+    Los valores de sexo que no están en ALIAS_SEXO quedan vacíos y se listan
+    en `df.attrs['sexo_no_reconocido']`.
+    """
+    import pandas as pd
+
+    if nombre_archivo.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(archivo)
+    else:
+        # Detecta ',' o ';' (Excel en español exporta con ';' y coma decimal)
+        df = pd.read_csv(archivo, sep=None, engine='python', decimal=',')
+    df = df.rename(columns=lambda columna: ALIAS_COLUMNAS.get(normalizar_texto(str(columna)), columna))
+    if 'id' not in df:
+        df.insert(0, 'id', range(1, len(df) + 1))
+    for columna in ['edad', 'peso', 'altura', *VALORES_REFERENCIA]:
+        if columna in df:
+            df[columna] = pd.to_numeric(df[columna].astype(str).str.replace(',', '.'), errors='coerce')
+    if 'sexo' in df:
+        sexo = df['sexo'].fillna('').astype(str).map(normalizar_texto)
+        df['sexo'] = sexo.map(ALIAS_SEXO)
+        df.attrs['sexo_no_reconocido'] = sorted(set(sexo[df['sexo'].isna() & (sexo != '')]))
+    # Altura en metros (1,65) -> centímetros
+    if 'altura' in df:
+        df.loc[df['altura'] < 3, 'altura'] = (df['altura'] * 100).round(1)
+    return df
+
+
+def evaluar_cohorte(df):
+    """IMC, valoración de analíticas y nivel de riesgo de todas las filas.
+
+    Añade `imc`, `clasificacion_imc`, una columna `estado <parámetro>` por
+    analítica presente, `puntos_riesgo`, `riesgo` (alto/moderado/bajo) y
+    `motivos`. Las analíticas se valoran en una sola llamada a
+    evaluar_analiticas con la tabla en formato largo.
+    """
+    import numpy as np
+    import pandas as pd
+
+    resultado = df.copy()
+    if {'peso', 'altura'} <= set(resultado.columns):
+        resultado['imc'] = (resultado['peso'] / (resultado['altura'] / 100) ** 2).round(1)
+        clasificacion, iconos = clasificar_imc_serie(resultado['imc'])
+        resultado['clasificacion_imc'] = (clasificacion + ' ' + iconos).where(clasificacion.notna(), '')
+
+    parametros = [p for p in VALORES_REFERENCIA if p in resultado]
+    if parametros:
+        largo = resultado.reset_index(names='_fila').melt(
+            id_vars=['_fila'] + [c for c in ('edad', 'sexo') if c in resultado],
+            value_vars=parametros, var_name='parametro', value_name='valor',
+        ).dropna(subset=['valor'])
+        evaluado = evaluar_analiticas(largo)
+        estados = evaluado.assign(estado=evaluado['estado'] + ' ' + evaluado['icono']).pivot(
+            index='_fila', columns='parametro', values='estado'
+        )
+        for parametro in parametros:
+            resultado[f"estado {parametro}"] = estados.get(parametro, pd.Series(dtype=object)).reindex(resultado.index)
+
+    puntos = np.zeros(len(resultado), dtype=int)
+    motivos = [[] for _ in range(len(resultado))]
+    for columna, comparacion, umbral, nivel, motivo in CRITERIOS_RIESGO:
+        if columna not in resultado:
+            continue
+        valores = resultado[columna]
+        if comparacion == '>=':
+            cumple = valores >= umbral
+        elif comparacion == '<':
+            cumple = valores < umbral
+        else:
+            cumple = (valores >= umbral[0]) & (valores < umbral[1])
+        cumple = cumple.fillna(False).to_numpy(dtype=bool)
+        puntos += cumple * PUNTOS_RIESGO[nivel]
+        for i in np.flatnonzero(cumple):
+            motivos[i].append(motivo)
+    resultado['puntos_riesgo'] = puntos
+    resultado['riesgo'] = np.select(
+        [puntos >= PUNTOS_RIESGO['alto'], puntos >= PUNTOS_RIESGO['moderado']], ['alto', 'moderado'], 'bajo'
+    )
+    resultado['motivos'] = ['; '.join(m) for m in motivos]
+    return resultado
+
+
+def contexto_cribado(fila):
+    """Datos de una persona para Gemini, sin nombre ni identificador"""
+    partes = []
+    for columna, etiqueta in (('edad', 'Edad (años)'), ('sexo', 'Sexo'), ('peso', 'Peso (kg)'), ('altura', 'Altura (cm)'), ('imc', 'IMC')):
+        if columna in fila and fila[columna] == fila[columna] and fila[columna] is not None:
+            partes.append(f"{etiqueta}: {fila[columna]}")
+    for parametro, ref in VALORES_REFERENCIA.items():
+        if parametro in fila and fila[parametro] == fila[parametro]:
+            partes.append(f"{parametro}: {fila[parametro]} {ref['unidad']}")
+    partes.append(f"Motivos de riesgo: {fila['motivos']}")
+    return "\n".join(partes)
+
+
+def analizar_riesgo_gemini(filas, id_sesion, max_hilos=HILOS_CRIBADO, al_completar=None):
+    """Consulta a Gemini por cada fila de riesgo con como mucho `max_hilos` consultas a la vez.
+
+    Todas las consultas usan el `id_sesion` de quien lanza el cribado, así que
+    el planificador las reparte por turnos con el resto de sesiones en lugar de
+    acaparar la cuota. Devuelve {id: respuesta}; `al_completar(hechas, total)`
+    permite mostrar el progreso.
+    """
+    respuestas = {}
+    if not len(filas):
+        return respuestas
+    prompt = "Valora a esta persona del cribado:"
+    with ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='cribado') as ejecutor:
+        futuros = {
+            ejecutor.submit(
+                consultar_gemini, prompt, contexto_cribado(fila),
+                instruccion=INSTRUCCION_CRIBADO, id_sesion=id_sesion,
+            ): fila['id']
+            for _, fila in filas.iterrows()
+        }
+        for hechas, futuro in enumerate(as_completed(futuros), 1):
+            respuestas[futuros[futuro]] = futuro.result()
+            if al_completar:
+                al_completar(hechas, len(futuros))
+    return respuestas
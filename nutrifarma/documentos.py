@@ -0,0 +1,194 @@
+"""Documentos subidos: miniaturas, páginas de PDF y OCR de analíticas.
+
+Las imágenes se decodifican en modo borrador (JPEG a escala reducida) y las
+miniaturas se guardan por huella SHA-256 del contenido, así que un fichero
+que sigue adjunto no se vuelve a decodificar en cada ejecución. Las páginas
+de un PDF se rasterizan solo cuando se muestran. El OCR se ejecuta en un
+hilo de fondo y su resultado también se memoriza por huella.
+
+Dependencias opcionales: `pypdfium2` (PDF) y `pytesseract` con el binario
+tesseract-ocr (OCR de imágenes y PDF escaneados).
+"""
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from nutrifarma.cache import CachePersistente
+from nutrifarma.nomenclator import normalizar_texto
+
+# Lado máximo de las miniaturas y de las imágenes que se pasan al OCR
+LADO_MINIATURA = 1024
+LADO_OCR = 2000
+IDIOMA_OCR = os.environ.get('NUTRIFARMA_OCR_IDIOMA', 'spa')
+
+# Parámetro -> nombres con los que aparece en los informes (normalizados), del más largo al más corto
+NOMBRES_ANALITICA = {
+    'HbA1c': ['hemoglobina glicosilada', 'hemoglobina glicada', 'hba1c', 'hb a1c'],
+    'Glucosa': ['glucosa basal', 'glucosa', 'glucemia'],
+    'Colesterol Total': ['colesterol total', 'colesterol'],
+    'HDL': ['colesterol hdl', 'hdl colesterol', 'c-hdl', 'hdl'],
+    'LDL': ['colesterol ldl', 'ldl colesterol', 'c-ldl', 'ldl'],
+    'Triglicéridos': ['trigliceridos', 'triglicerido'],
+    'Vitamina D': ['25-hidroxivitamina d', '25 oh vitamina d', 'vitamina d', 'calcidiol'],
+    'Vitamina B12': ['vitamina b12', 'cianocobalamina', 'cobalamina'],
+    'Ferritina': ['ferritina'],
+    'Hierro': ['hierro serico', 'sideremia', 'hierro'],
+}
+# Parámetro -> (clave del campo en la pestaña Perfil, máximo que admite el campo)
+CAMPOS_ANALITICA = {
+    'Glucosa': ('glucosa', 500.0), 'HbA1c': ('hba1c', 20.0), 'Colesterol Total': ('colesterol', 500.0),
+    'HDL': ('hdl', 200.0), 'LDL': ('ldl', 300.0), 'Triglicéridos': ('trig', 1000.0), 'Vitamina D': ('vitd', 200.0),
+    'Vitamina B12': ('vitb12', 2000.0), 'Hierro': ('hierro', 500.0), 'Ferritina': ('ferritina', 1000.0),
+}
+# Número suelto: no el "1" de "HbA1c" ni el "12" de "B12"
+_NUMERO = re.compile(r'(?<![\w.,])(\d+(?:[.,]\d+)?)')
+_ALIAS = sorted(
+    ((alias, parametro) for parametro, nombres in NOMBRES_ANALITICA.items() for alias in nombres),
+    key=lambda par: -len(par[0]),
+)
+
+
+def huella_documento(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+@st.cache_resource
+def obtener_cache_documentos():
+    """Miniaturas, páginas y resultados de OCR por huella (solo en memoria)"""
+    return CachePersistente(max_entradas=64, ttl=3600)
+
+
+@st.cache_resource
+def obtener_ejecutor_ocr():
+    """Hilo de fondo para el OCR: uno basta y evita saturar la CPU del servidor"""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='ocr')
+
+
+def _abrir_reducida(contenido, lado):
+    from PIL import Image, ImageOps
+    imagen = Image.open(io.BytesIO(contenido))
+    # En JPEG decodifica directamente a 1/2, 1/4 u 1/8 de resolución
+    imagen.draft('RGB', (lado, lado))
+    imagen = ImageOps.exif_transpose(imagen)
+    imagen.thumbnail((lado, lado))
+    return imagen.convert('RGB')
+
+
+def _a_jpeg(imagen):
+    salida = io.BytesIO()
+    imagen.save(salida, format='JPEG', quality=85)
+    return salida.getvalue()
+
+
+def miniatura_imagen(huella, contenido):
+    """JPEG de como mucho LADO_MINIATURA px, memorizado por huella"""
+    cache = obtener_cache_documentos()
+    clave = f"miniatura:{huella}"
+    miniatura = cache.obtener(clave)
+    if miniatura is None:
+        miniatura = _a_jpeg(_abrir_reducida(contenido, LADO_MINIATURA))
+        cache.guardar(clave, miniatura)
+    return miniatura
+
+
+def numero_paginas_pdf(huella, contenido):
+    """Páginas del PDF, o None si pypdfium2 no está instalado o el PDF no se puede abrir"""
+    cache = obtener_cache_documentos()
+    clave = f"paginas:{huella}"
+    paginas = cache.obtener(clave)
+    if paginas is None:
+        try:
+            import pypdfium2 as pdfium
+            paginas = len(pdfium.PdfDocument(contenido))
+        except Exception:
+            return None
+        cache.guardar(clave, paginas)
+    return paginas
+
+
+def _renderizar_pagina(contenido, indice, lado):
+    import pypdfium2 as pdfium
+    pagina = pdfium.PdfDocument(contenido)[indice]
+    ancho, alto = pagina.get_size()
+    imagen = pagina.render(scale=lado / max(ancho, alto)).to_pil()
+    return imagen.convert('RGB')
+
+
+def pagina_pdf(huella, contenido, indice):
+    """JPEG de una página del PDF, rasterizada solo la primera vez que se pide"""
+    cache = obtener_cache_documentos()
+    clave = f"pagina:{huella}:{indice}"
+    imagen = cache.obtener(clave)
+    if imagen is None:
+        imagen = _a_jpeg(_renderizar_pagina(contenido, indice, LADO_MINIATURA))
+        cache.guardar(clave, imagen)
+    return imagen
+
+
+def extraer_valores_analitica(texto):
+    """{parámetro: valor} a partir del texto de un informe de laboratorio.
+
+    En cada línea se busca el nombre más largo de un parámetro y se toma el
+    primer número que le sigue. La glucosa en mmol/L se convierte a mg/dL y
+    se descartan los valores que no caben en el campo (lecturas erróneas).
+    """
+    valores = {}
+    for linea in (texto or '').splitlines():
+        normalizada = normalizar_texto(linea)
+        for alias, parametro in _ALIAS:
+            posicion = normalizada.find(alias)
+            if posicion < 0:
+                continue
+            # Nombre completo: "hdl" no debe casar dentro de otra palabra
+            fin = posicion + len(alias)
+            if (posicion and normalizada[posicion - 1].isalnum()) or (fin < len(normalizada) and normalizada[fin].isalpha()):
+                continue
+            numero = _NUMERO.search(normalizada, fin)
+            if numero and parametro not in valores:
+                valor = float(numero.group(1).replace(',', '.'))
+                if parametro == 'Glucosa' and 'mmol' in normalizada and valor < 35:
+                    valor = round(valor * 18, 1)
+                if valor <= CAMPOS_ANALITICA[parametro][1]:
+                    valores[parametro] = valor
+            break
+    return valores
+
+
+def _texto_documento(contenido, es_pdf):
+    if es_pdf:
+        import pypdfium2 as pdfium
+        documento = pdfium.PdfDocument(contenido)
+        # PDF generado por el laboratorio: la capa de texto evita el OCR
+        texto = '\n'.join(pagina.get_textpage().get_text_range() for pagina in documento)
+        if texto.strip():
+            return texto
+        imagenes = [_renderizar_pagina(contenido, i, LADO_OCR) for i in range(len(documento))]
+    else:
+        imagenes = [_abrir_reducida(contenido, LADO_OCR)]
+    import pytesseract
+    return '\n'.join(pytesseract.image_to_string(imagen.convert('L'), lang=IDIOMA_OCR) for imagen in imagenes)
+
+
+def _procesar_ocr(huella, contenido, es_pdf):
+    try:
+        texto = _texto_documento(contenido, es_pdf)
+    except ImportError:
+        resultado = {'valores': {}, 'error': "OCR no disponible: instale pypdfium2 (PDF) y pytesseract con tesseract-ocr"}
+    except Exception as e:
+        resultado = {'valores': {}, 'error': f"No se pudo leer el documento: {e}"}
+    else:
+        resultado = {'valores': extraer_valores_analitica(texto), 'error': None}
+    obtener_cache_documentos().guardar(f"ocr:{huella}", resultado)
+    return resultado
+
+
+def lanzar_ocr(huella, contenido, es_pdf):
+    """Resultado del OCR si ya está hecho; si no, lo encola en segundo plano y devuelve un Future"""
+    resultado = obtener_cache_documentos().obtener(f"ocr:{huella}")
+    if resultado is not None:
+        return resultado
+    return obtener_ejecutor_ocr().submit(_procesar_ocr, huella, contenido, es_pdf)
@@ -0,0 +1,50 @@
+"""Exportación de los cuestionarios de alimentación y actividad.
+
+pandas (y openpyxl/pyarrow para XLSX/Parquet) se importa solo al exportar
+para no penalizar el arranque.
+"""
+import gzip
+import importlib.util
+import io
+import json
+
+# Formato -> (extensión, tipo MIME)
+FORMATOS_EXPORTACION = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel (XLSX)': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'JSON comprimido': ('json.gz', 'application/gzip'),
+}
+# Formatos que dependen de un paquete fuera de requirements.txt
+DEPENDENCIA_FORMATO = {'Parquet': 'pyarrow'}
+
+
+def formatos_disponibles():
+    """Formatos de exportación cuya dependencia opcional está instalada"""
+    return [
+        formato for formato in FORMATOS_EXPORTACION
+        if formato not in DEPENDENCIA_FORMATO or importlib.util.find_spec(DEPENDENCIA_FORMATO[formato])
+    ]
+
+
+def exportar_registros(registros, formato='CSV'):
+    """Serializa los registros en uno de los FORMATOS_EXPORTACION.
+
+    Lanza ImportError si falta la dependencia opcional del formato.
+    """
+    if not registros:
+        return None
+    if formato == 'JSON comprimido':
+        return gzip.compress(json.dumps(registros, ensure_ascii=False, default=str).encode('utf-8'))
+    import pandas as pd
+    df = pd.DataFrame(registros)
+    if formato == 'CSV':
+        return df.to_csv(index=False).encode('utf-8')
+    buffer = io.BytesIO()
+    if formato == 'Excel (XLSX)':
+        df.to_excel(buffer, index=False, engine='openpyxl')
+    elif formato == 'Parquet':
+        df.to_parquet(buffer, index=False)
+    else:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+    return buffer.getvalue()
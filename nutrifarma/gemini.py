@@ -0,0 +1,359 @@
+"""Acceso a Gemini: modelos compartidos, caché de respuestas, planificador y streaming.
+
+`google.generativeai` se importa al crear el primer modelo, no al cargar la
+aplicación.
+"""
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from functools import lru_cache
+from itertools import chain
+
+import streamlit as st
+
+from nutrifarma.cache import DIRECTORIO_CACHE, CachePersistente
+from nutrifarma.metricas import obtener_metricas, tramo
+from nutrifarma.simulacion import MODO_SERVICIOS, modelo_gemini
+
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+
+MODELO_GEMINI = 'gemini-2.0-flash-exp'
+HERRAMIENTAS_GEMINI = 'google_search_retrieval'
+
+# Instrucciones de sistema estáticas: se envían una vez por modelo, no en cada petición
+INSTRUCCION_DIAGNOSTICO = """Como farmacéutico nutricionista, realiza un diagnóstico nutricional completo del paciente cuyos datos se indican.
+
+Incluye: 1) Valoración nutricional 2) Problemas detectados 3) Barreras potenciales 4) Recomendaciones generales (sin dietas específicas)"""
+
+INSTRUCCION_COACHING = """Como coach nutricional, genera 10 preguntas abiertas y efectivas para:
+- Evaluar hábitos alimentarios
+- Identificar barreras y motivaciones
+- Explorar conocimientos nutricionales
+- Entender contexto sociocultural"""
+
+INSTRUCCION_GUIAS = """Basado en las guías nutricionales españolas y la pirámide alimentaria, proporciona recomendaciones específicas (NO dietas estrictas) para el paciente cuyos datos se indican.
+
+Incluye:
+1. Sugerencias de cambios alimentarios según pirámide nutricional
+2. Frecuencia de consumo de grupos de alimentos
+3. Suplementos nutricionales si necesarios
+4. Hábitos saludables
+5. Referencias a Medynut.com para recetas saludables"""
+
+INSTRUCCION_CRIBADO = """Como farmacéutico comunitario, valora a una persona detectada como de riesgo alto en una campaña de cribado en farmacia a partir de sus datos.
+
+Responde en 3-5 viñetas breves: 1) Riesgo principal 2) Si debe derivarse al médico y con qué urgencia 3) Consejos nutricionales inmediatos. No hagas diagnósticos definitivos."""
+
+# Función de la aplicación de cada instrucción, para las métricas de latencia y tokens
+FUNCIONES_GEMINI = {
+    INSTRUCCION_DIAGNOSTICO: 'diagnostico',
+    INSTRUCCION_COACHING: 'coaching',
+    INSTRUCCION_GUIAS: 'recomendaciones',
+    INSTRUCCION_CRIBADO: 'cribado',
+}
+
+# Configurar Gemini (una sola vez por proceso)
+@st.cache_resource
+def configurar_gemini(api_key):
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return True
+
+@st.cache_resource
+def obtener_modelo_gemini(instruccion_sistema=None):
+    """Modelo de Gemini compartido por todas las sesiones, uno por instrucción de sistema.
+
+    Las instrucciones son demasiado cortas para la caché de contexto de Gemini
+    (exige miles de tokens), así que viajan como `system_instruction`.
+    Con NUTRIFARMA_SERVICIOS=grabar o reproducir el modelo se envuelve o se
+    sustituye (ver nutrifarma.simulacion).
+    """
+    return modelo_gemini(
+        lambda: _crear_modelo_gemini(instruccion_sistema),
+        FUNCIONES_GEMINI.get(instruccion_sistema, 'general'),
+        MODELO_GEMINI,
+    )
+
+def _crear_modelo_gemini(instruccion_sistema):
+    import google.generativeai as genai
+    configurar_gemini(GEMINI_API_KEY)
+    return genai.GenerativeModel(
+        MODELO_GEMINI,
+        tools=HERRAMIENTAS_GEMINI,
+        system_instruction=instruccion_sistema
+    )
+
+@st.cache_resource
+def obtener_cache_gemini():
+    """Caché de respuestas de Gemini compartida por las sesiones del proceso.
+
+    Las respuestas incluyen datos de salud, así que el nivel en disco solo se
+    activa de forma explícita con NUTRIFARMA_GEMINI_CACHE_DISCO=1.
+    """
+    max_entradas = int(os.environ.get('NUTRIFARMA_GEMINI_CACHE_MAX', 500))
+    ttl = int(os.environ.get('NUTRIFARMA_GEMINI_CACHE_TTL', 3600))
+    ruta = None
+    if os.environ.get('NUTRIFARMA_GEMINI_CACHE_DISCO') == '1' and MODO_SERVICIOS != 'reproducir':
+        ruta = os.path.join(DIRECTORIO_CACHE, 'gemini.sqlite')
+    try:
+        cache = CachePersistente(max_entradas, ttl, ruta, tabla='gemini')
+    except (OSError, sqlite3.Error):
+        cache = CachePersistente(max_entradas, ttl)
+    obtener_metricas().registrar_colector('gemini_cache', cache.estadisticas)
+    return cache
+
+# Planificador global de peticiones a Gemini
+class GeminiSaturado(Exception):
+    """La cola de Gemini está llena o la petición ha esperado demasiado su turno"""
+
+@lru_cache(maxsize=1)
+def errores_reintentables():
+    """Errores transitorios de la API de Google (429 y 5xx)"""
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+    )
+
+class PlanificadorGemini:
+    """Reparte la cuota de Gemini entre todas las sesiones del proceso.
+
+    Un token bucket limita el ritmo de peticiones a la cuota contratada. Las
+    peticiones esperan en una cola acotada que atiende a las sesiones por
+    turnos, de modo que una sesión con muchas peticiones no bloquea al resto.
+    Los errores transitorios (429, 5xx) se reintentan con backoff exponencial
+    y jitter.
+    """
+
+    def __init__(self, peticiones_por_minuto=10, rafaga=3, max_cola=50, espera_maxima=120,
+                 max_reintentos=4, backoff_base=1.0, backoff_max=30.0):
+        self.tasa = peticiones_por_minuto / 60.0
+        self.capacidad = max(1, rafaga)
+        self.max_cola = max_cola
+        self.espera_maxima = espera_maxima
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.atendidas = 0
+        self.rechazadas = 0
+        self.reintentos = 0
+        self._tokens = float(self.capacidad)
+        self._ultima_recarga = time.monotonic()
+        self._colas = OrderedDict()  # id_sesion -> deque de turnos pendientes
+        self._en_cola = 0
+        self._esperas = deque(maxlen=1000)
+        self._condicion = threading.Condition()
+
+    def ejecutar(self, id_sesion, funcion):
+        """Ejecuta `funcion()` cuando le toca a la sesión, con reintentos ante errores transitorios"""
+        for intento in range(self.max_reintentos + 1):
+            self._esperar_turno(id_sesion)
+            try:
+                return funcion()
+            except errores_reintentables():
+                if intento == self.max_reintentos:
+                    raise
+                with self._condicion:
+                    self.reintentos += 1
+                    # Cuota agotada: frenar también al resto de sesiones
+                    self._tokens = min(self._tokens, 0.0)
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** intento)))
+
+    def max_peticiones_lote(self):
+        """Peticiones que un lote puede encolar de golpe sin agotar la espera máxima"""
+        return min(self.max_cola, int(self.tasa * self.espera_maxima) + self.capacidad)
+
+    def metricas(self):
+        """Profundidad de la cola y tiempos de espera recientes (segundos)"""
+        with self._condicion:
+            self._recargar()
+            esperas = sorted(self._esperas)
+            return {
+                'en_cola': self._en_cola,
+                'sesiones_en_cola': len(self._colas),
+                'tokens_disponibles': round(self._tokens, 2),
+                'atendidas': self.atendidas,
+                'rechazadas': self.rechazadas,
+                'reintentos': self.reintentos,
+                'espera_media': round(sum(esperas) / len(esperas), 3) if esperas else 0.0,
+                'espera_p95': round(esperas[int(len(esperas) * 0.95) - 1], 3) if esperas else 0.0,
+                'espera_max': round(esperas[-1], 3) if esperas else 0.0,
+            }
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultima_recarga) * self.tasa)
+        self._ultima_recarga = ahora
+
+    def _esperar_turno(self, id_sesion):
+        turno = object()
+        inicio = time.monotonic()
+        with self._condicion:
+            if self._en_cola >= self.max_cola:
+                self.rechazadas += 1
+                raise GeminiSaturado("Cola de Gemini llena")
+            self._colas.setdefault(id_sesion, deque()).append(turno)
+            self._en_cola += 1
+            try:
+                while True:
+                    self._recargar()
+                    # Turno: primera petición de la primera sesión en la rotación
+                    sesion, pendientes = next(iter(self._colas.items()))
+                    mi_turno = sesion == id_sesion and pendientes[0] is turno
+                    if mi_turno and self._tokens >= 1:
+                        break
+                    restante = self.espera_maxima - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self.rechazadas += 1
+                        raise GeminiSaturado("Tiempo de espera agotado en la cola de Gemini")
+                    espera = (1 - self._tokens) / self.tasa if mi_turno else restante
+                    self._condicion.wait(min(espera, restante))
+            except BaseException:
+                self._retirar(id_sesion, turno)
+                raise
+            self._tokens -= 1
+            self._retirar(id_sesion, turno)
+            self.atendidas += 1
+            self._esperas.append(time.monotonic() - inicio)
+
+    def _retirar(self, id_sesion, turno):
+        pendientes = self._colas[id_sesion]
+        pendientes.remove(turno)
+        self._en_cola -= 1
+        if pendientes:
+            # La sesión pasa al final de la rotación
+            self._colas.move_to_end(id_sesion)
+        else:
+            del self._colas[id_sesion]
+        self._condicion.notify_all()
+
+@st.cache_resource
+def obtener_planificador_gemini():
+    """Planificador único por proceso, ajustado a la cuota configurada"""
+    planificador = PlanificadorGemini(
+        peticiones_por_minuto=int(os.environ.get('NUTRIFARMA_GEMINI_RPM', 10)),
+        rafaga=int(os.environ.get('NUTRIFARMA_GEMINI_RAFAGA', 3)),
+        max_cola=int(os.environ.get('NUTRIFARMA_GEMINI_MAX_COLA', 50)),
+        espera_maxima=int(os.environ.get('NUTRIFARMA_GEMINI_ESPERA_MAX', 120))
+    )
+    obtener_metricas().registrar_colector('gemini_cola', planificador.metricas)
+    return planificador
+
+def id_sesion_actual():
+    """Identificador de la sesión de Streamlit, para repartir la cola de Gemini por turnos"""
+    if 'id_sesion' not in st.session_state:
+        st.session_state.id_sesion = uuid.uuid4().hex
+    return st.session_state.id_sesion
+
+MENSAJE_GEMINI_SATURADO = "⏳ Hay muchas consultas en curso. Inténtelo de nuevo en unos segundos."
+
+def _abrir_stream(model, contenido):
+    # La primera lectura dispara la petición: así los 429 se reintentan en el planificador
+    respuesta = iter(model.generate_content(contenido, stream=True))
+    return next(respuesta, None), respuesta
+
+def clave_gemini(prompt, contexto_paciente, instruccion=None, modelo=MODELO_GEMINI, herramientas=HERRAMIENTAS_GEMINI):
+    """Hash del modelo, las herramientas y el contenido completo de la petición"""
+    contenido = json.dumps([modelo, herramientas, instruccion, prompt, contexto_paciente], ensure_ascii=False)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+def _anotar_tokens(metrica, uso):
+    """Tokens de `usage_metadata` en el tramo y en el contador de cuota por función"""
+    if uso is None:
+        return
+    metrica['tokens_prompt'] = getattr(uso, 'prompt_token_count', 0) or 0
+    metrica['tokens_respuesta'] = getattr(uso, 'candidates_token_count', 0) or 0
+    metricas = obtener_metricas()
+    etiquetas = {'funcion': metrica['funcion'], 'modelo': metrica['modelo']}
+    metricas.incrementar('gemini_tokens_total', metrica['tokens_prompt'], {**etiquetas, 'tipo': 'prompt'})
+    metricas.incrementar('gemini_tokens_total', metrica['tokens_respuesta'], {**etiquetas, 'tipo': 'respuesta'})
+
+def consultar_gemini(prompt, contexto_paciente, forzar=False, instruccion=None, id_sesion=None):
+    """Consulta Gemini reutilizando la respuesta en caché salvo que se pida `forzar`.
+
+    Las peticiones pasan por el planificador global; `id_sesion` permite
+    llamarla desde hilos sin sesión de Streamlit.
+    """
+    cache = obtener_cache_gemini()
+    clave = clave_gemini(prompt, contexto_paciente, instruccion)
+    with tramo('gemini', funcion=FUNCIONES_GEMINI.get(instruccion, 'general'), modelo=MODELO_GEMINI) as metrica:
+        if not forzar:
+            respuesta = cache.obtener(clave)
+            if respuesta is not None:
+                metrica['estado'] = 'cache'
+                return respuesta
+        try:
+            # Modelo con búsqueda web compartido entre sesiones
+            model = obtener_modelo_gemini(instruccion)
+            
+            # Generar respuesta
+            response = obtener_planificador_gemini().ejecutar(
+                id_sesion or id_sesion_actual(),
+                lambda: model.generate_content(prompt + "\n\n" + contexto_paciente)
+            )
+            _anotar_tokens(metrica, getattr(response, 'usage_metadata', None))
+            texto = response.text
+            # Una respuesta vacía no se guarda: la siguiente consulta vuelve a intentarlo
+            if texto.strip():
+                cache.guardar(clave, texto)
+            return texto
+        except GeminiSaturado:
+            metrica['estado'] = 'saturado'
+            return MENSAJE_GEMINI_SATURADO
+        except Exception as e:
+            metrica['estado'] = 'error'
+            return f"Error al consultar: {str(e)}"
+
+def consultar_gemini_stream(prompt, contexto_paciente, forzar=False, instruccion=None):
+    """Como consultar_gemini, pero va entregando el texto a medida que Gemini lo genera.
+
+    Pensado para `st.write_stream`: una respuesta en caché se entrega en un
+    único fragmento y la respuesta completa, si no está vacía, se guarda en
+    caché al terminar.
+    """
+    cache = obtener_cache_gemini()
+    clave = clave_gemini(prompt, contexto_paciente, instruccion)
+    with tramo('gemini', funcion=FUNCIONES_GEMINI.get(instruccion, 'general'), modelo=MODELO_GEMINI) as metrica:
+        if not forzar:
+            respuesta = cache.obtener(clave)
+            if respuesta is not None:
+                metrica['estado'] = 'cache'
+                yield respuesta
+                return
+        partes = []
+        uso = None
+        try:
+            model = obtener_modelo_gemini(instruccion)
+            primero, resto = obtener_planificador_gemini().ejecutar(
+                id_sesion_actual(),
+                lambda: _abrir_stream(model, prompt + "\n\n" + contexto_paciente)
+            )
+            for chunk in chain([primero] if primero is not None else [], resto):
+                # El recuento de tokens llega completo en el último fragmento
+                uso = getattr(chunk, 'usage_metadata', None) or uso
+                try:
+                    texto = chunk.text
+                except ValueError:
+                    # Fragmento sin texto (p. ej. solo metadatos de búsqueda)
+                    continue
+                partes.append(texto)
+                yield texto
+            _anotar_tokens(metrica, uso)
+            respuesta = ''.join(partes)
+            if respuesta.strip():
+                cache.guardar(clave, respuesta)
+        except GeminiSaturado:
+            metrica['estado'] = 'saturado'
+            yield MENSAJE_GEMINI_SATURADO
+        except Exception as e:
+            metrica['estado'] = 'error'
+            yield f"\n\nError al consultar: {str(e)}"
@@ -0,0 +1,293 @@
+"""Informe del paciente en HTML o PDF.
+
+El informe se divide en secciones (perfil, analíticas, medicación,
+alimentación, actividad y diagnóstico). Cada sección se identifica por la
+huella SHA-256 de sus datos de entrada y su HTML se guarda con esa huella:
+al cambiar los datos del paciente solo se vuelven a generar las secciones
+afectadas. El documento completo se genera en un hilo de fondo.
+
+El PDF necesita el paquete opcional `fpdf2`; el HTML no tiene dependencias.
+"""
+import hashlib
+import html
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import streamlit as st
+
+from nutrifarma.actividad import MINUTOS_SEMANALES_RECOMENDADOS
+from nutrifarma.clinica import calcular_imc, clasificacion_imc, evaluar_historial, evaluar_panel, tendencias_analiticas
+from nutrifarma.composicion import NUTRIENTES, totales_por_dia
+from nutrifarma.piramide import carencias, puntuacion_adherencia
+
+# Formato -> (extensión, tipo MIME)
+FORMATOS_INFORME = {
+    'HTML': ('html', 'text/html'),
+    'PDF': ('pdf', 'application/pdf'),
+}
+
+ESTILO_INFORME = """
+body { font-family: Helvetica, Arial, sans-serif; color: #2c3e50; max-width: 800px; margin: 2em auto; }
+h1 { color: #27ae60; } h2 { border-bottom: 2px solid #27ae60; padding-bottom: 4px; }
+table { border-collapse: collapse; width: 100%; margin: 0.5em 0; }
+th, td { border: 1px solid #ddd; padding: 4px 8px; text-align: left; }
+th { background: #ecf0f1; }
+.pie { color: #7f8c8d; font-size: 0.85em; margin-top: 2em; }
+"""
+
+
+@st.cache_resource
+def obtener_ejecutor_informes():
+    """Hilos de fondo compartidos por todas las sesiones para generar informes"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix='informe')
+
+
+def huella(datos):
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def entradas_alimentacion(registro, detalle=None, evaluacion=None):
+    """Datos de la sección de alimentación: se memorizan con la versión del registro"""
+    entradas = {'registros': len(registro), 'dias': len(registro.fechas())}
+    if detalle is not None:
+        reconocidos = detalle[detalle['referencia'].notna()]
+        if not reconocidos.empty:
+            media = totales_por_dia(reconocidos).mean()
+            entradas['media_nutrientes'] = {nutriente: round(float(media[nutriente]), 1) for nutriente in NUTRIENTES}
+    if evaluacion is not None:
+        entradas['adherencia'] = puntuacion_adherencia(evaluacion)
+        entradas['carencias'] = carencias(evaluacion)
+    return entradas
+
+
+def entradas_actividad(registro):
+    """Datos de la sección de actividad: se memorizan con la versión del registro"""
+    return {
+        'sesiones': len(registro),
+        'total_minutos': registro.total_minutos,
+        'media_semanal': registro.media_semanal(),
+        'habitual': registro.volumen_habitual(),
+    }
+
+
+def entradas_informe(paciente, diagnostico=None, alimentacion=None, actividad=None):
+    """{sección: datos} con solo lo que necesita cada sección"""
+    return {
+        'perfil': {campo: paciente.get(campo) for campo in (
+            'nombre', 'edad', 'sexo', 'peso', 'altura', 'enfermedades', 'alergias', 'objetivo'
+        )},
+        'analiticas': {
+            'actual': paciente.get('analiticas') or {},
+            'historial': paciente.get('historial_analiticas') or [],
+            'edad': paciente.get('edad'),
+            'sexo': paciente.get('sexo'),
+        },
+        'medicacion': {
+            'medicacion': [
+                {campo: med.get(campo) for campo in ('nombre', 'dosis', 'frecuencia', 'motivo')}
+                for med in paciente.get('medicacion') or []
+            ],
+            'interacciones': paciente.get('interacciones_detectadas') or [],
+            'suplementos': paciente.get('suplementos_recomendados') or [],
+        },
+        'alimentacion': alimentacion,
+        'actividad': actividad,
+        'diagnostico': diagnostico,
+    }
+
+
+def _e(valor):
+    return html.escape('' if valor is None else str(valor))
+
+
+def _tabla(cabeceras, filas):
+    cabecera = ''.join(f"<th>{_e(c)}</th>" for c in cabeceras)
+    cuerpo = ''.join('<tr>' + ''.join(f"<td>{_e(v)}</td>" for v in fila) + '</tr>' for fila in filas)
+    return f"<table><thead><tr>{cabecera}</tr></thead><tbody>{cuerpo}</tbody></table>"
+
+
+def _lista(elementos):
+    return '<ul>' + ''.join(f"<li>{_e(e)}</li>" for e in elementos) + '</ul>'
+
+
+def _seccion_perfil(datos):
+    imc = calcular_imc(datos['peso'], datos['altura'])
+    clasificacion, _ = clasificacion_imc(imc)
+    filas = [
+        ('Nombre', datos['nombre']), ('Edad', f"{datos['edad']} años"), ('Sexo', datos['sexo']),
+        ('Peso', f"{datos['peso']} kg"), ('Altura', f"{datos['altura']} cm"), ('IMC', f"{imc:.1f} ({clasificacion})"),
+    ]
+    if datos['enfermedades']:
+        filas.append(('Enfermedades', ', '.join(datos['enfermedades'])))
+    alergias = [a for a in datos['alergias'] or [] if a.strip()]
+    if alergias:
+        filas.append(('Alergias e intolerancias', ', '.join(alergias)))
+    if datos['objetivo']:
+        filas.append(('Objetivo', datos['objetivo']))
+    return _tabla(['Dato', 'Valor'], filas)
+
+
+def _seccion_analiticas(datos):
+    if not datos['actual']:
+        return "<p>Sin analíticas registradas.</p>"
+    panel = evaluar_panel(datos['actual'], datos['edad'], datos['sexo'])
+    fecha = datos['historial'][-1]['fecha'] if datos['historial'] else ''
+    partes = [f"<p>Última analítica: {_e(fecha)}</p>" if fecha else '']
+    partes.append(_tabla(['Parámetro', 'Valor', 'Referencia', 'Estado'], [
+        (f.parametro, f"{f.valor:g} {f.unidad}", f"{f.min:g}-{f.max:g}" if f.max < 999 else f">= {f.min:g}", f.estado)
+        for f in panel.itertuples()
+    ]))
+    if len(datos['historial']) > 1:
+        tendencias = tendencias_analiticas(evaluar_historial(datos['historial'], datos['edad'], datos['sexo']))
+        tendencias = tendencias[tendencias['anterior'].notna()]
+        if not tendencias.empty:
+            partes.append("<h3>Evolución</h3>")
+            partes.append(_tabla(['Parámetro', 'Anterior', 'Último', 'Variación'], [
+                (parametro, f"{f['anterior']:g}", f"{f['ultimo']:g} {f['unidad']}", f"{f['delta']:+g}")
+                for parametro, f in tendencias.iterrows()
+            ]))
+    return ''.join(partes)
+
+
+def _seccion_medicacion(datos):
+    if not datos['medicacion']:
+        return "<p>Sin medicación registrada.</p>"
+    partes = [_tabla(['Medicamento', 'Dosis', 'Frecuencia', 'Motivo'], [
+        (med['nombre'], med['dosis'], med['frecuencia'], med['motivo']) for med in datos['medicacion']
+    ])]
+    if datos['interacciones']:
+        partes.append("<h3>Interacciones fármaco-nutriente</h3>")
+        partes.append(_lista(f"[{i['gravedad']}] {i['descripcion']}" for i in datos['interacciones']))
+    if datos['suplementos']:
+        partes.append(f"<p><b>Suplementos a valorar:</b> {_e(', '.join(datos['suplementos']))}</p>")
+    return ''.join(partes)
+
+
+def _seccion_alimentacion(datos):
+    if not datos or not datos['registros']:
+        return "<p>Sin registros de alimentación.</p>"
+    partes = [f"<p>{datos['registros']} alimentos registrados en {datos['dias']} día(s).</p>"]
+    if 'media_nutrientes' in datos:
+        partes.append("<h3>Ingesta media diaria</h3>")
+        partes.append(_tabla(['Nutriente', 'Media/día'], [
+            (NUTRIENTES[n], f"{v:g}") for n, v in datos['media_nutrientes'].items()
+        ]))
+    if 'adherencia' in datos:
+        partes.append(f"<h3>Pirámide alimentaria</h3><p>Adherencia: {datos['adherencia']}/100</p>")
+        if datos['carencias']:
+            partes.append(_tabla(['Grupo', 'Estado', 'Raciones/semana', 'Objetivo'], [
+                (c['grupo'], c['estado'], f"{c['raciones_semana']:g}", f"{c['objetivo']:g}") for c in datos['carencias']
+            ]))
+    return ''.join(partes)
+
+
+def _seccion_actividad(datos):
+    if not datos or not datos['sesiones']:
+        return "<p>Sin registros de actividad física.</p>"
+    partes = [
+        f"<p>{datos['sesiones']} sesiones, {datos['total_minutos']} minutos en total. "
+        f"Media de las últimas 4 semanas: {datos['media_semanal']} min/semana "
+        f"(recomendado: al menos {MINUTOS_SEMANALES_RECOMENDADOS}).</p>"
+    ]
+    if datos['habitual']:
+        partes.append(_tabla(['Actividad', 'Min/semana declarados'], list(datos['habitual'].items())))
+    return ''.join(partes)
+
+
+def _en_linea(texto):
+    texto = _e(texto)
+    texto = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', texto)
+    return re.sub(r'(?<!\*)\*(?!\s)(.+?)\*', r'<i>\1</i>', texto)
+
+
+def markdown_a_html(texto):
+    """Markdown sencillo de Gemini (títulos, listas, negrita y cursiva) a HTML"""
+    partes, lista = [], None
+    for linea in texto.splitlines():
+        linea = linea.strip()
+        elemento = re.match(r'^(?:[-*•]|\d+[.)])\s+(.*)', linea)
+        etiqueta = ('ol' if linea[:1].isdigit() else 'ul') if elemento else None
+        if lista and lista != etiqueta:
+            partes.append(f"</{lista}>")
+            lista = None
+        if elemento:
+            if not lista:
+                partes.append(f"<{etiqueta}>")
+                lista = etiqueta
+            partes.append(f"<li>{_en_linea(elemento.group(1))}</li>")
+        elif linea.startswith('#'):
+            # Los títulos del diagnóstico quedan por debajo del título de la sección
+            nivel = min(len(linea) - len(linea.lstrip('#')) + 2, 6)
+            partes.append(f"<h{nivel}>{_en_linea(linea.lstrip('#').strip())}</h{nivel}>")
+        elif linea:
+            partes.append(f"<p>{_en_linea(linea)}</p>")
+    if lista:
+        partes.append(f"</{lista}>")
+    return ''.join(partes)
+
+
+def _seccion_diagnostico(datos):
+    return markdown_a_html(datos) if datos else "<p>Diagnóstico no generado.</p>"
+
+
+# (clave, título, función que genera el HTML de la sección)
+SECCIONES_INFORME = [
+    ('perfil', 'Perfil del paciente', _seccion_perfil),
+    ('analiticas', 'Analíticas', _seccion_analiticas),
+    ('medicacion', 'Medicación', _seccion_medicacion),
+    ('alimentacion', 'Alimentación', _seccion_alimentacion),
+    ('actividad', 'Actividad física', _seccion_actividad),
+    ('diagnostico', 'Diagnóstico nutricional', _seccion_diagnostico),
+]
+
+
+def huellas_secciones(entradas):
+    return {clave: huella(entradas.get(clave)) for clave, _, _ in SECCIONES_INFORME}
+
+
+def informe_html(entradas, huellas, secciones):
+    """Documento HTML completo.
+
+    `secciones` es {clave: (huella, html)} y se actualiza en el sitio: solo
+    se generan las secciones cuya huella ha cambiado.
+    """
+    cuerpo = []
+    for clave, titulo, generar in SECCIONES_INFORME:
+        guardada = secciones.get(clave)
+        if guardada is None or guardada[0] != huellas[clave]:
+            guardada = (huellas[clave], generar(entradas.get(clave)))
+            secciones[clave] = guardada
+        cuerpo.append(f"<h2>{_e(titulo)}</h2>{guardada[1]}")
+    return (
+        "<!DOCTYPE html><html lang='es'><head><meta charset='utf-8'>"
+        f"<title>Informe nutricional</title><style>{ESTILO_INFORME}</style></head><body>"
+        "<h1>Informe nutricional</h1>" + ''.join(cuerpo) +
+        f"<p class='pie'>Generado por NutriFarma Advisor Pro el {datetime.now():%d/%m/%Y %H:%M}. "
+        "Orientativo: no sustituye la valoración del médico.</p></body></html>"
+    )
+
+
+def _html_a_pdf(documento):
+    from fpdf import FPDF
+
+    # Las fuentes básicas de PDF son Latin-1: sin emojis ni símbolos fuera de rango
+    documento = re.sub(r'<style>.*?</style>', '', documento, flags=re.S).replace('≥', '>=')
+    documento = documento.encode('latin-1', 'ignore').decode('latin-1')
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font('Helvetica', size=10)
+    pdf.write_html(documento)
+    return bytes(pdf.output())
+
+
+def generar_informe(entradas, huellas, secciones, formato='HTML'):
+    """Bytes del informe en uno de los FORMATOS_INFORME.
+
+    Lanza ImportError si el formato necesita una dependencia opcional que falta.
+    """
+    documento = informe_html(entradas, huellas, secciones)
+    if formato == 'PDF':
+        return _html_a_pdf(documento)
+    return documento.encode('utf-8')
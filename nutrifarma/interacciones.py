@@ -0,0 +1,315 @@
+"""Índice local de interacciones fármaco-nutriente.
+
+Las reglas se indexan al importar el módulo por principio activo normalizado
+y por prefijo ATC, de modo que comprobar toda la medicación es una serie de
+búsquedas en diccionarios: por cada medicamento, las palabras de su nombre y
+sus principios activos de CIMA, y los prefijos de sus códigos ATC (uno por
+nivel). Las reglas con analíticas asociadas se cruzan con `analiticas` para
+marcar la interacción como confirmada y proponer el suplemento.
+"""
+from nutrifarma.clinica import verificar_analitica
+from nutrifarma.nomenclator import normalizar_texto
+
+# Suplemento a valorar cuando la analítica confirma el déficit
+SUPLEMENTO_POR_ANALITICA = {
+    'Vitamina B12': 'Vitamina B12',
+    'Hierro': 'Hierro',
+    'Ferritina': 'Hierro',
+    'Vitamina D': 'Vitamina D (colecalciferol) y calcio',
+}
+
+# pactivos: principios activos (normalizados); atc: prefijos ATC de cualquier nivel;
+# analiticas: (parámetro, 'Bajo'|'Alto') que confirman la interacción;
+# suplemento: recomendación que no depende de la analítica
+REGLAS_INTERACCION = [
+    {
+        'id': 'metformina_b12',
+        'pactivos': ('metformina',),
+        # Solo las combinaciones de A10BD que llevan metformina
+        'atc': (
+            'A10BA02', 'A10BD02', 'A10BD03', 'A10BD05', 'A10BD07', 'A10BD08', 'A10BD10', 'A10BD11', 'A10BD13',
+            'A10BD14', 'A10BD15', 'A10BD16', 'A10BD17', 'A10BD18', 'A10BD20', 'A10BD22', 'A10BD23', 'A10BD25',
+            'A10BD26', 'A10BD27',
+        ),
+        'nutriente': 'Vitamina B12',
+        'efecto': 'el uso prolongado reduce la absorción de vitamina B12',
+        'recomendacion': 'controlar la B12 al menos una vez al año e incluir alimentos de origen animal o enriquecidos',
+        'analiticas': (('Vitamina B12', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'ibp_micronutrientes',
+        'pactivos': ('omeprazol', 'esomeprazol', 'pantoprazol', 'lansoprazol', 'rabeprazol'),
+        'atc': ('A02BC',),
+        'nutriente': 'Vitamina B12, hierro, magnesio y calcio',
+        'efecto': 'la supresión ácida prolongada reduce la absorción de B12, hierro, magnesio y calcio',
+        'recomendacion': 'revisar la necesidad del tratamiento a largo plazo y vigilar B12 y ferritina',
+        'analiticas': (('Vitamina B12', 'Bajo'), ('Hierro', 'Bajo'), ('Ferritina', 'Bajo')),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'antih2_b12',
+        'pactivos': ('ranitidina', 'famotidina', 'cimetidina'),
+        'atc': ('A02BA',),
+        'nutriente': 'Vitamina B12',
+        'efecto': 'la reducción de la acidez gástrica disminuye la absorción de B12',
+        'recomendacion': 'vigilar la B12 en tratamientos prolongados',
+        'analiticas': (('Vitamina B12', 'Bajo'),),
+        'gravedad': 'leve',
+    },
+    {
+        'id': 'levotiroxina_absorcion',
+        'pactivos': ('levotiroxina',),
+        'atc': ('H03AA',),
+        'nutriente': 'Calcio, hierro, soja, café y fibra',
+        'efecto': 'calcio, hierro, soja, café y exceso de fibra reducen su absorción',
+        'recomendacion': 'tomarla en ayunas con agua, 30-60 min antes del desayuno, y separar 4 h los suplementos de calcio o hierro',
+        'analiticas': (),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'antivitamina_k',
+        'pactivos': ('warfarina', 'acenocumarol'),
+        'atc': ('B01AA',),
+        'nutriente': 'Vitamina K',
+        'efecto': 'los cambios bruscos en el consumo de vitamina K (verduras de hoja verde) alteran el INR',
+        'recomendacion': 'mantener un consumo estable de verduras de hoja verde, sin eliminarlas, y evitar suplementos de vitamina K sin control',
+        'analiticas': (),
+        'gravedad': 'alta',
+    },
+    {
+        'id': 'estatinas_pomelo',
+        'pactivos': ('simvastatina', 'atorvastatina', 'lovastatina'),
+        'atc': ('C10AA01', 'C10AA03', 'C10AA05'),
+        'nutriente': 'Pomelo',
+        'efecto': 'el pomelo inhibe el CYP3A4 y aumenta los niveles del fármaco (riesgo de miopatía)',
+        'recomendacion': 'evitar el pomelo y su zumo',
+        'analiticas': (),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'diureticos_potasio',
+        'pactivos': ('hidroclorotiazida', 'clortalidona', 'indapamida', 'furosemida', 'torasemida'),
+        'atc': ('C03AA', 'C03BA', 'C03CA'),
+        'nutriente': 'Potasio y magnesio',
+        'efecto': 'aumentan la pérdida urinaria de potasio y magnesio',
+        'recomendacion': 'asegurar frutas, verduras y legumbres ricas en potasio',
+        'analiticas': (),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'ieca_ara_potasio',
+        'pactivos': (
+            'enalapril', 'ramipril', 'lisinopril', 'captopril', 'perindopril', 'losartan', 'valsartan',
+            'candesartan', 'irbesartan', 'olmesartan', 'telmisartan', 'espironolactona', 'eplerenona',
+        ),
+        'atc': ('C09A', 'C09B', 'C09C', 'C09D', 'C03DA'),
+        'nutriente': 'Potasio',
+        'efecto': 'retienen potasio: riesgo de hiperpotasemia con sales de régimen o suplementos de potasio',
+        'recomendacion': 'evitar sustitutos de la sal con cloruro potásico y suplementos de potasio',
+        'analiticas': (),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'corticoides_sistemicos',
+        'pactivos': ('prednisona', 'prednisolona', 'metilprednisolona', 'deflazacort', 'dexametasona', 'hidrocortisona'),
+        'atc': ('H02AB',),
+        'nutriente': 'Calcio, vitamina D, glucosa y sodio',
+        'efecto': 'reducen la absorción de calcio, elevan la glucemia y favorecen la retención de sodio',
+        'recomendacion': 'asegurar calcio y vitamina D, limitar azúcares simples y sal',
+        'analiticas': (('Vitamina D', 'Bajo'), ('Glucosa', 'Alto')),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'metotrexato_folico',
+        'pactivos': ('metotrexato',),
+        'atc': ('L01BA01', 'L04AX03'),
+        'nutriente': 'Ácido fólico',
+        'efecto': 'antagoniza el ácido fólico',
+        'recomendacion': 'suplementar ácido fólico según la pauta médica (no el mismo día de la dosis semanal)',
+        'analiticas': (),
+        'suplemento': 'Ácido fólico (según pauta médica)',
+        'gravedad': 'alta',
+    },
+    {
+        'id': 'antiepilepticos_vitd',
+        'pactivos': ('fenitoina', 'fenobarbital', 'carbamazepina', 'valproico', 'primidona'),
+        'atc': ('N03AA', 'N03AB', 'N03AF', 'N03AG01'),
+        'nutriente': 'Vitamina D y folato',
+        'efecto': 'los inductores enzimáticos aceleran el metabolismo de la vitamina D y del folato',
+        'recomendacion': 'vigilar la vitamina D y asegurar folatos en la dieta',
+        'analiticas': (('Vitamina D', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'imao_tiramina',
+        'pactivos': ('tranilcipromina', 'moclobemida', 'selegilina', 'rasagilina'),
+        'atc': ('N06AF', 'N06AG', 'N04BD'),
+        'nutriente': 'Tiramina',
+        'efecto': 'los alimentos ricos en tiramina (quesos curados, embutidos, fermentados) pueden provocar crisis hipertensivas',
+        'recomendacion': 'limitar quesos curados, embutidos, soja fermentada y bebidas alcohólicas fermentadas',
+        'analiticas': (),
+        'gravedad': 'alta',
+    },
+    {
+        'id': 'litio_sodio',
+        'pactivos': ('litio',),
+        'atc': ('N05AN01',),
+        'nutriente': 'Sodio y líquidos',
+        'efecto': 'los cambios en la ingesta de sal o líquidos alteran los niveles de litio',
+        'recomendacion': 'mantener un consumo estable de sal y una hidratación regular',
+        'analiticas': (),
+        'gravedad': 'alta',
+    },
+    {
+        'id': 'bifosfonatos_ayunas',
+        'pactivos': ('alendronico', 'risedronico', 'ibandronico'),
+        'atc': ('M05BA', 'M05BB'),
+        'nutriente': 'Calcio y alimentos',
+        'efecto': 'cualquier alimento, café o calcio reduce mucho su absorción',
+        'recomendacion': 'tomarlo en ayunas con agua, 30 min antes de comer, y asegurar calcio y vitamina D en otro momento del día',
+        'analiticas': (('Vitamina D', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'quinolonas_tetraciclinas_cationes',
+        'pactivos': ('ciprofloxacino', 'levofloxacino', 'moxifloxacino', 'doxiciclina', 'minociclina', 'tetraciclina'),
+        'atc': ('J01MA', 'J01AA'),
+        'nutriente': 'Lácteos, calcio, hierro y magnesio',
+        'efecto': 'los cationes de lácteos y suplementos forman complejos que reducen su absorción',
+        'recomendacion': 'separar al menos 2 h de lácteos y suplementos de calcio, hierro o magnesio',
+        'analiticas': (),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'orlistat_liposolubles',
+        'pactivos': ('orlistat',),
+        'atc': ('A08AB01',),
+        'nutriente': 'Vitaminas A, D, E y K',
+        'efecto': 'reduce la absorción de las vitaminas liposolubles',
+        'recomendacion': 'tomar un multivitamínico al acostarse, separado al menos 2 h del fármaco',
+        'analiticas': (('Vitamina D', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'resinas_liposolubles',
+        'pactivos': ('colestiramina', 'colesevelam', 'colestipol'),
+        'atc': ('C10AC',),
+        'nutriente': 'Vitaminas liposolubles y folato',
+        'efecto': 'las resinas secuestran vitaminas liposolubles y folato',
+        'recomendacion': 'separar otros fármacos y suplementos 4 h y vigilar la vitamina D',
+        'analiticas': (('Vitamina D', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'aines_hierro',
+        'pactivos': ('ibuprofeno', 'naproxeno', 'diclofenaco', 'dexketoprofeno', 'acetilsalicilico'),
+        # AINE de M01A; M01AX incluye glucosamina y condroitina, solo sus AINE
+        'atc': (
+            'M01AA', 'M01AB', 'M01AC', 'M01AE', 'M01AG', 'M01AH', 'M01AX01', 'M01AX17', 'N02BA01', 'B01AC06',
+        ),
+        'nutriente': 'Hierro',
+        'efecto': 'pueden causar pérdidas digestivas de sangre y ferropenia en uso crónico',
+        'recomendacion': 'tomarlos con alimentos y vigilar hierro y ferritina si el uso es prolongado',
+        'analiticas': (('Hierro', 'Bajo'), ('Ferritina', 'Bajo')),
+        'gravedad': 'leve',
+    },
+    {
+        'id': 'hipoglucemiantes_alcohol',
+        'pactivos': ('glibenclamida', 'gliclazida', 'glimepirida', 'glipizida', 'repaglinida', 'insulina'),
+        'atc': ('A10A', 'A10BB', 'A10BX02'),
+        'nutriente': 'Alcohol y horarios de comida',
+        'efecto': 'el alcohol y saltarse comidas aumentan el riesgo de hipoglucemia',
+        'recomendacion': 'mantener horarios regulares de comidas con hidratos de carbono y evitar el alcohol en ayunas',
+        'analiticas': (('Glucosa', 'Bajo'),),
+        'gravedad': 'moderada',
+    },
+    {
+        'id': 'metronidazol_alcohol',
+        'pactivos': ('metronidazol', 'tinidazol'),
+        'atc': ('J01XD', 'P01AB'),
+        'nutriente': 'Alcohol',
+        'efecto': 'efecto antabús con el alcohol',
+        'recomendacion': 'no tomar alcohol durante el tratamiento ni 72 h después',
+        'analiticas': (),
+        'gravedad': 'alta',
+    },
+]
+
+# Índices: principio activo -> reglas y prefijo ATC -> reglas
+_POR_PACTIVO = {}
+_POR_ATC = {}
+for _regla in REGLAS_INTERACCION:
+    for _pactivo in _regla['pactivos']:
+        _POR_PACTIVO.setdefault(_pactivo, []).append(_regla)
+    for _prefijo in _regla['atc']:
+        _POR_ATC.setdefault(_prefijo.upper(), []).append(_regla)
+_MAX_PALABRAS_PACTIVO = max(len(p.split(' ')) for p in _POR_PACTIVO)
+# Longitudes de los niveles ATC (A, A10, A10B, A10BA, A10BA02)
+_NIVELES_ATC = (1, 3, 4, 5, 7)
+
+
+def reglas_medicamento(med):
+    """Reglas aplicables a un medicamento por nombre, principios activos de CIMA y ATC"""
+    textos = [med.get('nombre', '')]
+    if med.get('cima'):
+        textos.extend(med['cima'].get('pactivos') or [])
+    encontradas = {}
+    for texto in textos:
+        palabras = normalizar_texto(texto).split(' ')
+        for n in range(1, _MAX_PALABRAS_PACTIVO + 1):
+            for i in range(len(palabras) - n + 1):
+                for regla in _POR_PACTIVO.get(' '.join(palabras[i:i + n]), ()):
+                    encontradas[regla['id']] = regla
+    for codigo in (med.get('cima') or {}).get('atc') or []:
+        for nivel in _NIVELES_ATC:
+            for regla in _POR_ATC.get(codigo[:nivel].upper(), ()):
+                encontradas[regla['id']] = regla
+    return list(encontradas.values())
+
+
+def detectar_interacciones(medicacion, analiticas=None, edad=None, sexo=None):
+    """Interacciones de toda la medicación y suplementos a valorar.
+
+    Devuelve (interacciones, suplementos). Cada interacción es un dict con
+    `medicamento`, `nutriente`, `gravedad`, `confirmada` (analíticas fuera de
+    rango que la apoyan) y `descripcion`, la línea que va al contexto de Gemini.
+    """
+    analiticas = analiticas or {}
+    interacciones = []
+    suplementos = []
+    for med in medicacion or []:
+        for regla in reglas_medicamento(med):
+            confirmada = []
+            pendientes = []
+            for parametro, sentido in regla['analiticas']:
+                if parametro not in analiticas:
+                    pendientes.append(parametro)
+                elif verificar_analitica(parametro, analiticas[parametro], edad, sexo).startswith(sentido):
+                    confirmada.append(f"{parametro} {analiticas[parametro]} ({sentido.lower()})")
+                    suplemento = SUPLEMENTO_POR_ANALITICA.get(parametro) if sentido == 'Bajo' else None
+                    if suplemento and suplemento not in suplementos:
+                        suplementos.append(suplemento)
+            if regla.get('suplemento') and regla['suplemento'] not in suplementos:
+                suplementos.append(regla['suplemento'])
+            descripcion = f"{med['nombre']} – {regla['nutriente']}: {regla['efecto']}; {regla['recomendacion']}"
+            if confirmada:
+                descripcion += f" [confirmada por analítica: {', '.join(confirmada)}]"
+            elif pendientes:
+                descripcion += f" [valorar analítica: {', '.join(pendientes)}]"
+            interacciones.append({
+                'medicamento': med['nombre'],
+                'regla': regla['id'],
+                'nutriente': regla['nutriente'],
+                'gravedad': 'alta' if confirmada else regla['gravedad'],
+                'confirmada': confirmada,
+                'descripcion': descripcion,
+            })
+    return interacciones, suplementos
+
+
+def actualizar_interacciones(paciente):
+    """Rellena `interacciones_detectadas` y `suplementos_recomendados` del paciente"""
+    paciente['interacciones_detectadas'], paciente['suplementos_recomendados'] = detectar_interacciones(
+        paciente.get('medicacion'), paciente.get('analiticas'), paciente.get('edad'), paciente.get('sexo')
+    )
@@ -0,0 +1,220 @@
+"""Métricas de rendimiento: tramos cronometrados, histogramas y tokens de Gemini.
+
+Cada tramo (render de una pestaña, ejecución del script, consulta a Gemini o
+a CIMA) se mide con `tramo()` y se acumula en un histograma por nombre y
+etiquetas (función, modelo, estado...). Las métricas se pueden consultar:
+
+- en formato de texto de Prometheus con `texto_prometheus()`, y por HTTP en
+  `/metrics` si se define `NUTRIFARMA_METRICAS_PUERTO`;
+- como JSON Lines, una línea por tramo, en el fichero
+  `NUTRIFARMA_METRICAS_JSONL` (para seguirlo con `tail -f`).
+
+Las etiquetas nunca llevan datos del paciente: solo nombres de función,
+modelo, origen y estado.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+RUTA_JSONL = os.environ.get('NUTRIFARMA_METRICAS_JSONL', '')
+PUERTO_METRICAS = int(os.environ.get('NUTRIFARMA_METRICAS_PUERTO', 0))
+HOST_METRICAS = os.environ.get('NUTRIFARMA_METRICAS_HOST', '127.0.0.1')
+
+# Límites superiores de los cubos del histograma (segundos)
+CUBOS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Valores por tramo que no se usan como etiqueta (cardinalidad ilimitada)
+ATRIBUTOS_EVENTO = {'tokens_prompt', 'tokens_respuesta'}
+
+logger = logging.getLogger('nutrifarma')
+
+
+def _etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ''
+    pares = ','.join(
+        '{}="{}"'.format(clave, str(valor).replace('\\', '\\\\').replace('"', '\\"'))
+        for clave, valor in etiquetas
+    )
+    return '{' + pares + '}'
+
+
+class RegistroMetricas:
+    """Histogramas de duración y contadores del proceso, seguros entre hilos"""
+
+    def __init__(self, ruta_jsonl=''):
+        self.ruta_jsonl = ruta_jsonl
+        self._lock = threading.Lock()
+        # (tramo, etiquetas) -> [cuentas por cubo..., +Inf], suma, total
+        self._histogramas = {}
+        # (nombre, etiquetas) -> valor
+        self._contadores = {}
+        self._colectores = {}
+
+    def observar(self, tramo, segundos, etiquetas=None):
+        clave = (tramo, tuple(sorted((etiquetas or {}).items())))
+        with self._lock:
+            histograma = self._histogramas.setdefault(clave, [[0] * (len(CUBOS_SEGUNDOS) + 1), 0.0, 0])
+            histograma[0][bisect.bisect_left(CUBOS_SEGUNDOS, segundos)] += 1
+            histograma[1] += segundos
+            histograma[2] += 1
+
+    def incrementar(self, nombre, valor=1, etiquetas=None):
+        clave = (nombre, tuple(sorted((etiquetas or {}).items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def registrar_colector(self, nombre, funcion):
+        """`funcion()` devuelve {clave: número}; se exporta como indicadores al generar el texto"""
+        self._colectores[nombre] = funcion
+
+    def escribir_evento(self, evento):
+        if not self.ruta_jsonl:
+            return
+        linea = json.dumps(evento, ensure_ascii=False, default=str) + '\n'
+        try:
+            with self._lock, open(self.ruta_jsonl, 'a', encoding='utf-8') as f:
+                f.write(linea)
+        except OSError:
+            logger.warning("No se pudo escribir en %s; se desactiva el registro JSONL", self.ruta_jsonl)
+            self.ruta_jsonl = ''
+
+    def resumen(self):
+        """{tramo: {llamadas, media_ms, p95_ms}} agregando todas las etiquetas"""
+        with self._lock:
+            histogramas = [(clave[0], datos) for clave, datos in self._histogramas.items()]
+        agregados = {}
+        for tramo, (cuentas, suma, total) in histogramas:
+            agregado = agregados.setdefault(tramo, [[0] * len(cuentas), 0.0, 0])
+            agregado[0] = [a + b for a, b in zip(agregado[0], cuentas)]
+            agregado[1] += suma
+            agregado[2] += total
+        resultado = {}
+        for tramo, (cuentas, suma, total) in agregados.items():
+            # p95 aproximado: límite superior del cubo que lo contiene
+            acumulado, p95 = 0, float('inf')
+            for limite, cuenta in zip(CUBOS_SEGUNDOS + (float('inf'),), cuentas):
+                acumulado += cuenta
+                if acumulado >= 0.95 * total:
+                    p95 = limite
+                    break
+            resultado[tramo] = {'llamadas': total, 'media_ms': round(suma / total * 1000, 1), 'p95_ms': p95 * 1000}
+        return resultado
+
+    def texto_prometheus(self):
+        """Métricas en el formato de exposición de texto de Prometheus"""
+        with self._lock:
+            histogramas = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+        lineas = [
+            '# HELP nutrifarma_duracion_segundos Duración de cada tramo (pestaña, script, Gemini, CIMA)',
+            '# TYPE nutrifarma_duracion_segundos histogram',
+        ]
+        for (tramo, etiquetas), (cuentas, suma, total) in histogramas:
+            base = (('tramo', tramo),) + etiquetas
+            acumulado = 0
+            for limite, cuenta in zip(CUBOS_SEGUNDOS + ('+Inf',), cuentas):
+                acumulado += cuenta
+                lineas.append(f"nutrifarma_duracion_segundos_bucket{_etiquetas_prometheus(base + (('le', limite),))} {acumulado}")
+            lineas.append(f"nutrifarma_duracion_segundos_sum{_etiquetas_prometheus(base)} {suma:.6f}")
+            lineas.append(f"nutrifarma_duracion_segundos_count{_etiquetas_prometheus(base)} {total}")
+        nombres = sorted({nombre for (nombre, _), _ in contadores})
+        for nombre in nombres:
+            lineas.append(f"# TYPE nutrifarma_{nombre} counter")
+            for (nombre_contador, etiquetas), valor in contadores:
+                if nombre_contador == nombre:
+                    lineas.append(f"nutrifarma_{nombre}{_etiquetas_prometheus(etiquetas)} {valor}")
+        for nombre, funcion in list(self._colectores.items()):
+            try:
+                valores = funcion()
+            except Exception:
+                continue
+            for clave, valor in valores.items():
+                lineas.append(f"# TYPE nutrifarma_{nombre}_{clave} gauge")
+                lineas.append(f"nutrifarma_{nombre}_{clave} {valor}")
+        return '\n'.join(lineas) + '\n'
+
+
+def _servir_metricas(registro, host, puerto):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            cuerpo = registro.texto_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    threading.Thread(target=servidor.serve_forever, name='metricas', daemon=True).start()
+    logger.info("Métricas en http://%s:%d/metrics", host, puerto)
+    return servidor
+
+
+@st.cache_resource
+def obtener_metricas():
+    """Registro de métricas único por proceso; arranca el endpoint HTTP si se configura"""
+    registro = RegistroMetricas(RUTA_JSONL)
+    if PUERTO_METRICAS:
+        try:
+            _servir_metricas(registro, HOST_METRICAS, PUERTO_METRICAS)
+        except OSError as e:
+            logger.warning("No se pudo abrir el puerto de métricas %d: %s", PUERTO_METRICAS, e)
+    return registro
+
+
+def registrar_tramo(nombre, segundos, **datos):
+    """Anota un tramo ya medido en el histograma y en el registro JSONL"""
+    datos.setdefault('estado', 'ok')
+    registro = obtener_metricas()
+    registro.observar(nombre, segundos, {k: v for k, v in datos.items() if k not in ATRIBUTOS_EVENTO})
+    registro.escribir_evento({
+        'ts': datetime.now().isoformat(timespec='milliseconds'), 'tramo': nombre,
+        'duracion_ms': round(segundos * 1000, 2), **datos,
+    })
+
+
+@contextmanager
+def tramo(nombre, **etiquetas):
+    """Cronometra el bloque y lo registra con `estado` ok/error.
+
+    El diccionario que se entrega permite añadir etiquetas durante el tramo
+    (p. ej. `origen` o `estado`); las claves de `ATRIBUTOS_EVENTO` solo van
+    al evento JSONL, no al histograma.
+    """
+    datos = dict(etiquetas)
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    # st.rerun()/st.stop() derivan de BaseException: no son errores
+    except Exception:
+        datos['estado'] = 'error'
+        raise
+    finally:
+        registrar_tramo(nombre, time.perf_counter() - inicio, **datos)
+
+
+def cronometrado(nombre, **etiquetas):
+    """Decorador: cada llamada a la función es un tramo"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with tramo(nombre, **etiquetas):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
@@ -0,0 +1,196 @@
+"""Nomenclátor local de medicamentos de CIMA AEMPS.
+
+Importa un volcado del catálogo de medicamentos de CIMA (JSON o JSON Lines)
+a una base SQLite y construye en memoria un índice de prefijos y trigramas
+para resolver y autocompletar nombres, principios activos y códigos ATC sin
+acceso a red y con tolerancia a errores tipográficos.
+
+Uso:
+    python -m nutrifarma.nomenclator volcado.json [más_páginas.json ...] [-o datos/nomenclator_cima.sqlite]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+RUTA_POR_DEFECTO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos', 'nomenclator_cima.sqlite'
+)
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(texto.lower().split())
+
+
+def _trigramas(termino):
+    relleno = f"  {termino} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _leer_volcado(ruta):
+    """Devuelve los medicamentos de un volcado: lista, página de la API o JSON Lines"""
+    with open(ruta, encoding='utf-8') as f:
+        if ruta.endswith(('.jsonl', '.ndjson')):
+            return [json.loads(linea) for linea in f if linea.strip()]
+        datos = json.load(f)
+    if isinstance(datos, dict):
+        return datos.get('resultados', [])
+    return datos
+
+
+def importar_volcado(rutas, ruta_db=RUTA_POR_DEFECTO):
+    """Carga uno o varios volcados de CIMA en SQLite. Devuelve el nº de medicamentos importados"""
+    os.makedirs(os.path.dirname(ruta_db) or '.', exist_ok=True)
+    conexion = sqlite3.connect(ruta_db)
+    try:
+        conexion.execute(
+            'CREATE TABLE IF NOT EXISTS medicamentos ('
+            'nregistro TEXT PRIMARY KEY, nombre TEXT NOT NULL, pactivos TEXT, '
+            'atc TEXT, atc_nombre TEXT, comerc INTEGER)'
+        )
+        filas = []
+        for ruta in rutas:
+            for med in _leer_volcado(ruta):
+                if not med.get('nregistro') or not med.get('nombre'):
+                    continue
+                atcs = [a for a in med.get('atcs') or [] if a.get('codigo')]
+                longitud = max((len(a['codigo']) for a in atcs), default=0)
+                atcs = [a for a in atcs if len(a['codigo']) == longitud]
+                filas.append((
+                    str(med['nregistro']),
+                    med['nombre'],
+                    med.get('pactivos') or '',
+                    ','.join(a['codigo'] for a in atcs),
+                    ','.join(a.get('nombre', '') for a in atcs),
+                    int(bool(med.get('comerc', True))),
+                ))
+        with conexion:
+            conexion.executemany('INSERT OR REPLACE INTO medicamentos VALUES (?, ?, ?, ?, ?, ?)', filas)
+        return len(filas)
+    finally:
+        conexion.close()
+
+
+class IndiceNomenclator:
+    """Índice en memoria del nomenclátor: búsqueda por prefijo y aproximada por trigramas"""
+
+    def __init__(self, filas):
+        self._medicamentos = []
+        entradas = []
+        terminos = {}
+        for nregistro, nombre, pactivos, atc, atc_nombre, comerc in filas:
+            codigos = [c for c in (atc or '').split(',') if c]
+            nombres_atc = (atc_nombre or '').split(',')
+            idx = len(self._medicamentos)
+            self._medicamentos.append({
+                'nregistro': nregistro,
+                'nombre': nombre,
+                'pactivos': pactivos,
+                'atcs': [
+                    {'codigo': c, 'nombre': nombres_atc[i] if i < len(nombres_atc) else ''}
+                    for i, c in enumerate(codigos)
+                ],
+                'comerc': bool(comerc),
+            })
+            claves = {normalizar_texto(nombre)}
+            claves.update(normalizar_texto(p) for p in (pactivos or '').split(',') if p.strip())
+            claves.update(c.lower() for c in codigos)
+            for clave in claves:
+                entradas.append((clave, idx))
+                # Términos para la búsqueda aproximada: primera palabra de cada clave
+                terminos.setdefault(clave.split(' ')[0], set()).add(idx)
+        entradas.sort()
+        self._claves = [clave for clave, _ in entradas]
+        self._ids = [idx for _, idx in entradas]
+        self._terminos = terminos
+        self._trigramas_termino = {t: _trigramas(t) for t in terminos}
+        self._por_trigrama = {}
+        for termino, trigramas in self._trigramas_termino.items():
+            for trigrama in trigramas:
+                self._por_trigrama.setdefault(trigrama, []).append(termino)
+
+    @classmethod
+    def desde_sqlite(cls, ruta_db=RUTA_POR_DEFECTO):
+        conexion = sqlite3.connect(ruta_db)
+        try:
+            filas = conexion.execute(
+                'SELECT nregistro, nombre, pactivos, atc, atc_nombre, comerc FROM medicamentos ORDER BY nombre'
+            ).fetchall()
+        finally:
+            conexion.close()
+        return cls(filas)
+
+    def __len__(self):
+        return len(self._medicamentos)
+
+    def _prefijo(self, prefijo, limite):
+        encontrados = []
+        i = bisect_left(self._claves, prefijo)
+        while i < len(self._claves) and self._claves[i].startswith(prefijo):
+            if self._ids[i] not in encontrados:
+                encontrados.append(self._ids[i])
+                if len(encontrados) >= limite:
+                    break
+            i += 1
+        return encontrados
+
+    def buscar_prefijo(self, texto, limite=10):
+        """Medicamentos cuyo nombre, principio activo o ATC empieza por `texto`"""
+        consulta = normalizar_texto(texto)
+        if not consulta:
+            return []
+        ids = self._prefijo(consulta, limite)
+        if not ids and ' ' in consulta:
+            # "metformina 850": prefijo por la primera palabra y filtro por el resto
+            primera, *resto = consulta.split(' ')
+            ids = [
+                idx for idx in self._prefijo(primera, limite * 20)
+                if all(palabra in normalizar_texto(self._medicamentos[idx]['nombre']) for palabra in resto)
+            ][:limite]
+        return [self._medicamentos[idx] for idx in ids]
+
+    def buscar_aproximado(self, texto, limite=10, umbral=0.45):
+        """Búsqueda tolerante a erratas sobre la primera palabra de nombres y principios activos"""
+        consulta = normalizar_texto(texto).split(' ')[0]
+        if not consulta:
+            return []
+        trigramas = _trigramas(consulta)
+        comunes = Counter()
+        for trigrama in trigramas:
+            comunes.update(self._por_trigrama.get(trigrama, ()))
+        candidatos = []
+        for termino, n in comunes.items():
+            similitud = n / (len(trigramas) + len(self._trigramas_termino[termino]) - n)
+            if similitud >= umbral:
+                candidatos.append((similitud, termino))
+        candidatos.sort(reverse=True)
+        ids = []
+        for _, termino in candidatos:
+            for idx in sorted(self._terminos[termino]):
+                if idx not in ids:
+                    ids.append(idx)
+            if len(ids) >= limite:
+                break
+        return [self._medicamentos[idx] for idx in ids[:limite]]
+
+    def buscar(self, texto, limite=10):
+        """Prefijo exacto y, si no hay coincidencias, búsqueda aproximada"""
+        return self.buscar_prefijo(texto, limite) or self.buscar_aproximado(texto, limite)
+
+    def sugerencias(self, texto, limite=8):
+        """Nombres de medicamento para autocompletar"""
+        return [med['nombre'] for med in self.buscar(texto, limite)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importa un volcado del nomenclátor CIMA a SQLite')
+    parser.add_argument('volcados', nargs='+', help='Ficheros JSON/JSONL descargados de CIMA')
+    parser.add_argument('-o', '--salida', default=RUTA_POR_DEFECTO, help='Base de datos SQLite de destino')
+    args = parser.parse_args()
+    total = importar_volcado(args.volcados, args.salida)
+    print(f"{total} medicamentos importados en {args.salida}")
@@ -0,0 +1,128 @@
+"""Puntuación del cuestionario de frecuencia de consumo frente a la pirámide alimentaria.
+
+Cada registro de alimentación (`categoria` + `frecuencia`) se convierte en
+raciones semanales por grupo y se compara con los rangos de la pirámide SENC
+2017 y las recomendaciones AESAN 2022. El resultado es determinista y no
+necesita a Gemini: sirve como feedback rápido y como resumen compacto para el
+prompt de recomendaciones.
+"""
+from nutrifarma.nomenclator import normalizar_texto
+
+# Veces por semana de cada opción de FRECUENCIAS_CONSUMO
+VECES_SEMANA = {
+    "Diaria": 7,
+    "4-6 veces/semana": 5,
+    "2-3 veces/semana": 2.5,
+    "Semanal": 1,
+    "Ocasional": 0.25,
+}
+
+# Grupo -> (mínimo, máximo) de raciones por semana; None = sin límite
+RACIONES_RECOMENDADAS = {
+    "Cereales y derivados": (28, 42),      # 4-6 al día, preferentemente integrales
+    "Verduras y hortalizas": (14, None),   # ≥2 al día
+    "Frutas": (21, None),                  # ≥3 al día
+    "Leche y lácteos": (14, 28),           # 2-4 al día
+    "Carnes/pescados/huevos": (7, 21),     # 1-3 al día alternando pescado, aves y huevos
+    "Legumbres": (4, None),                # ≥4 a la semana
+    "Aceites/grasas": (21, 42),            # 3-6 al día, aceite de oliva
+}
+
+# Consejo breve por grupo y estado para el feedback sin IA
+CONSEJOS = {
+    ("Cereales y derivados", "déficit"): "Incluya pan, arroz, pasta o avena (mejor integrales) en las comidas principales.",
+    ("Cereales y derivados", "exceso"): "Reduzca raciones de cereales y priorice verduras y proteína en el plato.",
+    ("Verduras y hortalizas", "déficit"): "Añada verdura en comida y cena: medio plato de verduras u hortalizas.",
+    ("Frutas", "déficit"): "Tome fruta entera a diario: 3 piezas repartidas en desayuno, postres o media mañana.",
+    ("Leche y lácteos", "déficit"): "Incluya 2-3 lácteos al día (leche, yogur natural, queso fresco).",
+    ("Leche y lácteos", "exceso"): "Limite los lácteos a 2-4 raciones al día y elija opciones sin azúcar.",
+    ("Carnes/pescados/huevos", "déficit"): "Asegure una ración de proteína al día alternando pescado, aves, huevos y legumbres.",
+    ("Carnes/pescados/huevos", "exceso"): "Reduzca carnes, sobre todo rojas y procesadas; sustituya por legumbres o pescado.",
+    ("Legumbres", "déficit"): "Tome legumbres al menos 4 veces por semana (lentejas, garbanzos, alubias).",
+    ("Aceites/grasas", "déficit"): "Use aceite de oliva virgen extra para cocinar y aliñar.",
+    ("Aceites/grasas", "exceso"): "Mida el aceite con cuchara y limite mantequilla, margarina y salsas.",
+}
+
+
+def evaluar_frecuencias(registros):
+    """Raciones semanales por grupo comparadas con la pirámide.
+
+    Cada alimento cuenta una vez por tipo de comida (su registro más
+    reciente), porque la frecuencia ya expresa la repetición: "leche, diaria"
+    registrada tres días en el desayuno son 7 raciones, no 21. Devuelve un
+    DataFrame indexado por grupo con `raciones_semana`, `minimo`, `maximo`,
+    `puntuacion` (0-10) y `estado` (déficit/adecuado/exceso).
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(list(registros), columns=['alimento', 'comida', 'categoria', 'frecuencia'])
+    df['clave'] = df['alimento'].map(normalizar_texto)
+    df = df.drop_duplicates(['clave', 'comida'], keep='last')
+    raciones = (
+        df.assign(veces=df['frecuencia'].map(VECES_SEMANA).fillna(0))
+        .groupby('categoria')['veces'].sum()
+        .reindex(list(RACIONES_RECOMENDADAS), fill_value=0)
+    )
+    evaluacion = pd.DataFrame({
+        'raciones_semana': raciones.astype(float),
+        'minimo': [minimo for minimo, _ in RACIONES_RECOMENDADAS.values()],
+        'maximo': [np.nan if maximo is None else maximo for _, maximo in RACIONES_RECOMENDADAS.values()],
+    }, index=raciones.index)
+    actual = evaluacion['raciones_semana'].to_numpy()
+    minimo = evaluacion['minimo'].to_numpy(dtype=float)
+    maximo = evaluacion['maximo'].to_numpy(dtype=float)
+    deficit = actual < minimo
+    exceso = ~np.isnan(maximo) & (actual > maximo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        puntuacion = np.where(deficit, 10 * actual / minimo, np.where(exceso, 10 * maximo / actual, 10))
+    evaluacion['puntuacion'] = np.round(puntuacion, 1)
+    evaluacion['estado'] = np.select([deficit, exceso], ['déficit', 'exceso'], 'adecuado')
+    return evaluacion
+
+
+def puntuacion_adherencia(evaluacion):
+    """Adherencia global 0-100: media de las puntuaciones de los grupos"""
+    return round(float(evaluacion['puntuacion'].mean()) * 10)
+
+
+def carencias(evaluacion):
+    """Grupos fuera de rango, del más alejado al más cercano a la recomendación"""
+    fuera = evaluacion[evaluacion['estado'] != 'adecuado'].sort_values('puntuacion')
+    resultado = []
+    for grupo, fila in fuera.iterrows():
+        objetivo = fila['minimo'] if fila['estado'] == 'déficit' else fila['maximo']
+        resultado.append({
+            'grupo': grupo,
+            'estado': fila['estado'],
+            'raciones_semana': fila['raciones_semana'],
+            'objetivo': objetivo,
+            'diferencia': round(fila['raciones_semana'] - objetivo, 1),
+        })
+    return resultado
+
+
+def _rango(fila):
+    if fila['maximo'] != fila['maximo']:  # NaN: sin máximo
+        return f"≥{fila['minimo']:g}"
+    return f"{fila['minimo']:g}-{fila['maximo']:g}"
+
+
+def resumen_para_contexto(evaluacion):
+    """Línea compacta con la adherencia y los grupos fuera de rango"""
+    partes = [f"adherencia {puntuacion_adherencia(evaluacion)}/100"]
+    for grupo, fila in evaluacion[evaluacion['estado'] != 'adecuado'].iterrows():
+        partes.append(f"{grupo} {fila['raciones_semana']:g} raciones/semana ({fila['estado']}; pirámide {_rango(fila)})")
+    return '; '.join(partes)
+
+
+def feedback_rapido(evaluacion):
+    """Mensajes deterministas para los grupos fuera de rango, sin consultar a Gemini"""
+    mensajes = []
+    for carencia in carencias(evaluacion):
+        consejo = CONSEJOS.get((carencia['grupo'], carencia['estado']), '')
+        mensajes.append(
+            f"**{carencia['grupo']}** ({carencia['estado']}: {carencia['raciones_semana']:g} raciones/semana, "
+            f"objetivo {_rango(evaluacion.loc[carencia['grupo']])}). {consejo}".rstrip()
+        )
+    return mensajes
@@ -0,0 +1,100 @@
+"""Registros de alimentación y actividad con identificadores estables."""
+
+
+class RegistroIndexado:
+    """Colección de registros con id estable e índice por fecha.
+
+    Los registros se guardan en un dict por id (que conserva el orden de
+    inserción) y el índice por fecha se mantiene al añadir, editar o borrar,
+    así que todas esas operaciones son O(1) y no hace falta reagrupar el
+    historial en cada ejecución. Los registros siguen siendo dicts simples;
+    el id no forma parte de ellos. `version` aumenta con cada cambio y sirve
+    para invalidar lo que se calcule a partir del registro (p. ej. exportaciones).
+    """
+
+    def __init__(self, registros=()):
+        self._entradas = {}
+        self._por_fecha = {}
+        self._siguiente_id = 1
+        self.version = 0
+        for registro in registros:
+            self.agregar(registro)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __iter__(self):
+        return iter(self._entradas.values())
+
+    def __contains__(self, id_registro):
+        return id_registro in self._entradas
+
+    def agregar(self, registro):
+        """Añade un registro y devuelve su id"""
+        id_registro = self._siguiente_id
+        self._siguiente_id += 1
+        self._entradas[id_registro] = registro
+        self._por_fecha.setdefault(registro['fecha'], {})[id_registro] = None
+        self.version += 1
+        return id_registro
+
+    def eliminar(self, id_registro):
+        """Elimina un registro por id y lo devuelve"""
+        registro = self._entradas.pop(id_registro)
+        ids_fecha = self._por_fecha[registro['fecha']]
+        del ids_fecha[id_registro]
+        if not ids_fecha:
+            del self._por_fecha[registro['fecha']]
+        self.version += 1
+        return registro
+
+    def actualizar(self, id_registro, cambios):
+        """Modifica campos de un registro, reindexándolo si cambia la fecha"""
+        registro = self._entradas[id_registro]
+        fecha_anterior = registro['fecha']
+        registro.update(cambios)
+        if registro['fecha'] != fecha_anterior:
+            ids_fecha = self._por_fecha[fecha_anterior]
+            del ids_fecha[id_registro]
+            if not ids_fecha:
+                del self._por_fecha[fecha_anterior]
+            self._por_fecha.setdefault(registro['fecha'], {})[id_registro] = None
+        self.version += 1
+        return registro
+
+    def obtener(self, id_registro):
+        return self._entradas[id_registro]
+
+    def items(self):
+        """Pares (id, registro) en orden de inserción"""
+        return list(self._entradas.items())
+
+    def registros(self):
+        """Lista de registros en orden de inserción (para exportar)"""
+        return list(self._entradas.values())
+
+    def fechas(self, recientes_primero=True):
+        return sorted(self._por_fecha, reverse=recientes_primero)
+
+    def por_fecha(self, fecha):
+        """Pares (id, registro) de una fecha, en orden de inserción"""
+        return [(id_registro, self._entradas[id_registro]) for id_registro in self._por_fecha.get(fecha, ())]
+
+    def pagina(self, desplazamiento, limite):
+        """Pares (id, registro) de una página, de la fecha más reciente a la más antigua.
+
+        Los días anteriores a la página se saltan por su tamaño, sin recorrer
+        sus registros: el coste depende del nº de días y del tamaño de página.
+        """
+        resultado = []
+        for fecha in self.fechas():
+            ids_fecha = self._por_fecha[fecha]
+            if desplazamiento >= len(ids_fecha):
+                desplazamiento -= len(ids_fecha)
+                continue
+            for id_registro in list(ids_fecha)[desplazamiento:]:
+                resultado.append((id_registro, self._entradas[id_registro]))
+                if len(resultado) >= limite:
+                    return resultado
+            desplazamiento = 0
+        return resultado
@@ -0,0 +1,28 @@
+"""Medición del arranque en frío y de la duración de cada ejecución del script."""
+import logging
+import time
+
+from nutrifarma import INICIO_PROCESO
+from nutrifarma.metricas import registrar_tramo
+
+logger = logging.getLogger('nutrifarma')
+
+_primer_render_ms = None
+
+
+def registrar_render(inicio_script):
+    """Anota la duración de la ejecución del script que empezó en `inicio_script`.
+
+    La primera ejecución del proceso se mide desde la primera importación del
+    paquete (`INICIO_PROCESO`), de modo que incluye la carga de los módulos:
+    es el tiempo hasta el primer render tras un arranque en frío.
+    Devuelve ese tiempo en milisegundos.
+    """
+    global _primer_render_ms
+    ahora = time.perf_counter()
+    if _primer_render_ms is None:
+        _primer_render_ms = (ahora - INICIO_PROCESO) * 1000
+        logger.info("Primer render tras el arranque: %.0f ms", _primer_render_ms)
+    logger.debug("Ejecución del script: %.1f ms", (ahora - inicio_script) * 1000)
+    registrar_tramo('script', ahora - inicio_script)
+    return _primer_render_ms
@@ -0,0 +1,224 @@
+"""Grabación y reproducción de las respuestas de Gemini y CIMA.
+
+`NUTRIFARMA_SERVICIOS` elige cómo se atienden las consultas:
+
+- `real` (por defecto): Gemini y la API de CIMA.
+- `grabar`: servicios reales, y cada respuesta se añade con su latencia a
+  `gemini.jsonl` o `cima.jsonl` en `NUTRIFARMA_GRABACIONES`.
+- `reproducir`: sin red ni cuota. Se devuelven las respuestas grabadas con
+  una latencia tomada de la distribución grabada para esa función.
+
+La sustitución se hace al nivel más bajo (el modelo de Gemini y la petición
+HTTP a CIMA), así que la caché, el planificador y las métricas funcionan igual
+que en producción. Una consulta que no está grabada recibe otra respuesta
+grabada de la misma función de la aplicación. Las grabaciones contienen las
+respuestas de Gemini: deben hacerse con pacientes de prueba.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import streamlit as st
+
+from nutrifarma.nomenclator import normalizar_texto
+
+MODOS_SERVICIOS = ('real', 'grabar', 'reproducir')
+MODO_SERVICIOS = os.environ.get('NUTRIFARMA_SERVICIOS', 'real')
+if MODO_SERVICIOS not in MODOS_SERVICIOS:
+    raise ValueError(f"NUTRIFARMA_SERVICIOS debe ser uno de {', '.join(MODOS_SERVICIOS)}")
+DIRECTORIO_GRABACIONES = os.environ.get(
+    'NUTRIFARMA_GRABACIONES',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datos', 'grabaciones'),
+)
+# Semilla de la elección de respuestas no grabadas: las pruebas de carga son repetibles
+SEMILLA_GRABACIONES = int(os.environ.get('NUTRIFARMA_GRABACIONES_SEMILLA', 0))
+
+# Latencia (s) cuando no hay nada grabado para un servicio
+LATENCIA_POR_DEFECTO = {'gemini': 3.0, 'cima': 0.3}
+TEXTO_SIN_GRABACION = "Respuesta simulada: no hay respuestas de Gemini grabadas para esta función."
+# Fragmentos en los que se reparte una respuesta reproducida en streaming
+FRAGMENTOS_STREAM = 8
+
+
+def clave_contenido(*partes):
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class Grabaciones:
+    """Respuestas grabadas por servicio, indexadas por clave y por función"""
+
+    def __init__(self, directorio, semilla=0):
+        self.directorio = directorio
+        self._aleatorio = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._por_clave = {}
+        self._por_funcion = defaultdict(list)
+        for servicio in LATENCIA_POR_DEFECTO:
+            ruta = self._ruta(servicio)
+            if not os.path.exists(ruta):
+                continue
+            with open(ruta, encoding='utf-8') as f:
+                for linea in f:
+                    if linea.strip():
+                        self._indexar(json.loads(linea))
+
+    def _ruta(self, servicio):
+        return os.path.join(self.directorio, f"{servicio}.jsonl")
+
+    def _indexar(self, entrada):
+        self._por_clave[(entrada['servicio'], entrada['clave'])] = entrada
+        self._por_funcion[(entrada['servicio'], entrada.get('funcion'))].append(entrada)
+
+    def guardar(self, entrada):
+        with self._lock:
+            os.makedirs(self.directorio, exist_ok=True)
+            with open(self._ruta(entrada['servicio']), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            self._indexar(entrada)
+
+    def buscar(self, servicio, clave, funcion=None):
+        """(entrada, latencia): la grabación exacta o, si no existe, una de la misma función.
+
+        Una consulta no grabada recibe al azar una de las grabadas para esa
+        función, con su latencia, de modo que se reproduce su distribución.
+        """
+        exacta = self._por_clave.get((servicio, clave))
+        if exacta is not None:
+            return exacta, exacta['latencia_s']
+        candidatas = self._por_funcion.get((servicio, funcion))
+        if servicio == 'gemini' and not candidatas:
+            candidatas = [e for (s, _), entradas in self._por_funcion.items() if s == servicio for e in entradas]
+        if not candidatas:
+            return None, LATENCIA_POR_DEFECTO[servicio]
+        with self._lock:
+            elegida = self._aleatorio.choice(candidatas)
+        return elegida, elegida['latencia_s']
+
+
+@st.cache_resource
+def obtener_grabaciones():
+    """Grabaciones compartidas por el proceso (se leen una vez)"""
+    return Grabaciones(DIRECTORIO_GRABACIONES, SEMILLA_GRABACIONES)
+
+
+# Gemini
+def _uso(entrada):
+    return SimpleNamespace(
+        prompt_token_count=entrada.get('tokens_prompt', 0), candidates_token_count=entrada.get('tokens_respuesta', 0)
+    )
+
+
+class ModeloReproducido:
+    """Sustituye a genai.GenerativeModel devolviendo respuestas grabadas"""
+
+    def __init__(self, funcion):
+        self.funcion = funcion
+
+    def generate_content(self, contenido, stream=False):
+        entrada, latencia = obtener_grabaciones().buscar('gemini', clave_contenido(self.funcion, contenido), self.funcion)
+        entrada = entrada or {'texto': TEXTO_SIN_GRABACION}
+        if stream:
+            return self._stream(entrada, latencia)
+        time.sleep(latencia)
+        return SimpleNamespace(text=entrada['texto'], usage_metadata=_uso(entrada))
+
+    def _stream(self, entrada, latencia):
+        texto = entrada['texto']
+        primero = min(entrada.get('primer_fragmento_s', latencia), latencia)
+        time.sleep(primero)
+        paso = max(1, -(-len(texto) // FRAGMENTOS_STREAM))
+        trozos = [texto[i:i + paso] for i in range(0, len(texto), paso)] or ['']
+        for i, trozo in enumerate(trozos):
+            if i:
+                time.sleep((latencia - primero) / (len(trozos) - 1))
+            yield SimpleNamespace(text=trozo, usage_metadata=_uso(entrada) if i == len(trozos) - 1 else None)
+
+
+class ModeloGrabador:
+    """Envuelve el modelo real y graba cada respuesta completa con su latencia"""
+
+    def __init__(self, modelo, funcion, modelo_nombre):
+        self._modelo = modelo
+        self.funcion = funcion
+        self.modelo_nombre = modelo_nombre
+
+    def _grabar(self, contenido, texto, latencia, primer_fragmento, uso):
+        obtener_grabaciones().guardar({
+            'servicio': 'gemini', 'funcion': self.funcion, 'modelo': self.modelo_nombre,
+            'clave': clave_contenido(self.funcion, contenido), 'latencia_s': round(latencia, 3),
+            'primer_fragmento_s': round(primer_fragmento, 3), 'texto': texto,
+            'tokens_prompt': getattr(uso, 'prompt_token_count', 0) or 0,
+            'tokens_respuesta': getattr(uso, 'candidates_token_count', 0) or 0,
+        })
+
+    def generate_content(self, contenido, stream=False):
+        if stream:
+            return self._stream(contenido)
+        inicio = time.perf_counter()
+        respuesta = self._modelo.generate_content(contenido)
+        latencia = time.perf_counter() - inicio
+        try:
+            self._grabar(contenido, respuesta.text, latencia, latencia, getattr(respuesta, 'usage_metadata', None))
+        except ValueError:
+            pass  # Respuesta bloqueada o sin texto: no se graba
+        return respuesta
+
+    def _stream(self, contenido):
+        inicio = time.perf_counter()
+        primer_fragmento, partes, uso = None, [], None
+        for chunk in self._modelo.generate_content(contenido, stream=True):
+            if primer_fragmento is None:
+                primer_fragmento = time.perf_counter() - inicio
+            uso = getattr(chunk, 'usage_metadata', None) or uso
+            try:
+                partes.append(chunk.text)
+            except ValueError:
+                pass
+            yield chunk
+        latencia = time.perf_counter() - inicio
+        self._grabar(contenido, ''.join(partes), latencia, primer_fragmento or latencia, uso)
+
+
+def modelo_gemini(crear_modelo, funcion, modelo_nombre):
+    """Modelo de Gemini según NUTRIFARMA_SERVICIOS; `crear_modelo()` construye el real"""
+    if MODO_SERVICIOS == 'reproducir':
+        return ModeloReproducido(funcion)
+    modelo = crear_modelo()
+    if MODO_SERVICIOS == 'grabar':
+        return ModeloGrabador(modelo, funcion, modelo_nombre)
+    return modelo
+
+
+# CIMA
+def consulta_cima(consultar_red):
+    """Función de búsqueda en la API de CIMA según NUTRIFARMA_SERVICIOS.
+
+    `consultar_red(nombre)` es la petición real, que devuelve el JSON de CIMA.
+    """
+    if MODO_SERVICIOS == 'real':
+        return consultar_red
+
+    def reproducir(nombre):
+        clave = normalizar_texto(nombre)
+        entrada, latencia = obtener_grabaciones().buscar('cima', clave, 'medicamentos')
+        time.sleep(latencia)
+        if entrada is None or entrada['clave'] != clave:
+            # Medicamento no grabado: CIMA no lo encuentra
+            return {'totalFilas': 0, 'resultados': []}
+        return entrada['datos']
+
+    def grabar(nombre):
+        inicio = time.perf_counter()
+        datos = consultar_red(nombre)
+        obtener_grabaciones().guardar({
+            'servicio': 'cima', 'funcion': 'medicamentos', 'clave': normalizar_texto(nombre),
+            'latencia_s': round(time.perf_counter() - inicio, 3), 'datos': datos,
+        })
+        return datos
+
+    return reproducir if MODO_SERVICIOS == 'reproducir' else grabar